@@ -0,0 +1,497 @@
+"""
+Faster correlation for the image filters of labs 1 and 2.
+
+correlate in lab.py visits every tap of the kernel for every pixel, clamping
+each position to the edge of the image, so an n-by-n kernel costs O(n**2)
+work per pixel.  This module computes the same results more cheaply:
+
+    * separable kernels (kernel[i][j] == column[i] * row[j], as for box
+      blurs and the Sobel kernels) are applied as a horizontal pass followed
+      by a vertical one, O(n) per pixel
+    * box filters of integer images (blurred and sharpened) use running
+      window sums in exact integer arithmetic, O(1) per pixel whatever n is
+    * any other kernel is applied to an edge-extended copy of the image
+      (built once per call), one tap at a time across a whole row: no
+      bounds checks or index arithmetic per pixel, and with NumPy (if it is
+      installed) one array operation per tap for the whole image
+    * large kernels go through the FFT instead, when a cost model comparing
+      the number of taps with the size of the transform says it is cheaper
+    * edges computes both Sobel gradients and their magnitude together, in
+      one pass (sobel)
+
+Floating point additions done in a different order can come out different in
+the last bits, which matters only where a value lies right at a rounding
+boundary (x.5).  Such values are recomputed tap by tap, in the same order as
+the direct computation, so that the images are identical after
+round_and_clip_image.
+"""
+
+import math
+from itertools import accumulate, repeat
+from operator import add, mul, sub, floordiv, mod
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from fourier import next_power_of_two, fft
+
+
+EPSILON = 2.0 ** -52
+
+
+def kernel_offsets(size):
+    """
+    Return the positions, relative to the pixel being computed, of the rows
+    (or columns) of a kernel of the given size.
+    """
+    return range(-((size - 1) // 2), 1 + size // 2)
+
+
+def clip_round(c):
+    """
+    Round and clip a single value, as round_and_clip_image does.
+    """
+    if c < 0:
+        return 0
+    if c > 255:
+        return 255
+    return round(c)
+
+
+def reference_value(image, kernel, x, y):
+    """
+    Return the correlation of the kernel with the image at pixel (x, y),
+    adding up the taps in the same order as correlate in lab.py, so that the
+    result is identical to the last bit.
+    """
+    height, width, pixels = image['height'], image['width'], image['pixels']
+    offsets = kernel_offsets(len(kernel))
+    new = 0
+    for dx, krow in zip(offsets, kernel):
+        base = min(max(x + dx, 0), height - 1) * width
+        for dy, k in zip(offsets, krow):
+            new += pixels[base + min(max(y + dy, 0), width - 1)] * k
+    return new
+
+
+def is_integer_image(image):
+    """
+    Return True if every pixel of the image is an int.
+    """
+    return all(type(p) is int for p in image['pixels'])
+
+
+# PADDED BUFFERS
+
+def padded_pixels(image, before, after):
+    """
+    Return a flat list of the pixels of the image extended by `before` rows
+    (and columns) at the top (and left) and `after` at the bottom (and
+    right), repeating the nearest edge pixel as handel_out_of_bound does,
+    together with the width of the extended image.
+    """
+    height, width, pixels = image['height'], image['width'], image['pixels']
+    lines = []
+    for x in range(height):
+        line = list(pixels[x * width:(x + 1) * width])
+        lines.append([line[0]] * before + line + [line[-1]] * after)
+    padded = []
+    for line in [lines[0]] * before + lines + [lines[-1]] * after:
+        padded.extend(line)
+    return padded, width + before + after
+
+
+def correlate_padded(image, kernel):
+    """
+    Correlate the image with any kernel, returning a new image of unrounded
+    values.  Every output pixel adds up the same products in the same order
+    as correlate in lab.py, so the results are identical to the last bit.
+    """
+    height, width = image['height'], image['width']
+    size = len(kernel)
+    offsets = kernel_offsets(size)
+    before, after = -offsets[0], offsets[-1]
+    # (row, column, weight) of every tap that contributes anything; a zero
+    # tap only ever turns an int result into a float
+    taps = [(i, j, k) for i, krow in enumerate(kernel) for j, k in zip(range(size), krow) if k != 0]
+    floating = any(type(k) is float for krow in kernel for k in krow[:size])
+
+    if height == 0 or width == 0:
+        pixels = []
+    elif numpy is not None and _fits_numpy(image, kernel):
+        pixels = _correlate_numpy(image, taps, before, after, floating)
+    else:
+        padded, padded_width = padded_pixels(image, before, after)
+        if floating:
+            # the products are floats either way; converting up front is
+            # exact and saves converting every pixel once per tap
+            padded = list(map(float, padded))
+        taps = [(i * padded_width + j, k) for i, j, k in taps]
+        pixels = []
+        for x in range(height):
+            start = x * padded_width
+            acc = [0] * width
+            for offset, k in taps:
+                s = start + offset
+                acc[:] = map(add, acc, map(mul, padded[s:s + width], repeat(k)))
+            pixels.extend(acc)
+        if floating and not taps:
+            pixels = list(map(float, pixels))
+
+    return {
+        'height': height,
+        'width': width,
+        'pixels': pixels,
+    }
+
+
+def _fits_numpy(image, kernel):
+    # NumPy reproduces Python's arithmetic exactly for floats, and for ints
+    # as long as they cannot overflow 64 bits
+    if not is_integer_image(image):
+        return all(type(p) in (int, float) for p in image['pixels'])
+    largest = max(map(abs, image['pixels']), default=0)
+    total = sum(abs(k) for krow in kernel for k in krow)
+    return largest * total < 2 ** 62
+
+
+def _correlate_numpy(image, taps, before, after, floating):
+    integral = not floating and is_integer_image(image)
+    values = numpy.array(image['pixels'], dtype=numpy.int64 if integral else float)
+    values = values.reshape(image['height'], image['width'])
+    padded = numpy.pad(values, ((before, after), (before, after)), mode='edge')
+    height, width = values.shape
+    # each tap is one shifted (sliding) view of the padded image
+    acc = numpy.zeros_like(values)
+    for i, j, k in taps:
+        acc += padded[i:i + height, j:j + width] * k
+    return acc.ravel().tolist()
+
+
+# SEPARABLE KERNELS
+
+def separate_kernel(kernel):
+    """
+    If the given (square) kernel is separable, return (column, row) such that
+    kernel[i][j] == column[i] * row[j]; otherwise return None.  Integer
+    kernels are split into integer factors where possible, so that integer
+    images still give integer results.
+    """
+    size = len(kernel)
+    if any(len(krow) != size for krow in kernel):
+        return None
+    taps = [(i, j) for i in range(size) for j in range(size) if kernel[i][j] != 0]
+    if not taps:
+        return None
+    integral = all(type(k) is int for krow in kernel for k in krow)
+    if integral:
+        p, q = min(taps, key=lambda ij: abs(kernel[ij[0]][ij[1]]))
+    else:
+        p, q = max(taps, key=lambda ij: abs(kernel[ij[0]][ij[1]]))
+    pivot = kernel[p][q]
+    row = list(kernel[p])
+    if integral and all(kernel[i][q] % pivot == 0 for i in range(size)):
+        column = [kernel[i][q] // pivot for i in range(size)]
+    else:
+        column = [kernel[i][q] / pivot for i in range(size)]
+
+    tolerance = 0 if integral else abs(pivot) * 1e-12
+    for c, krow in zip(column, kernel):
+        for r, k in zip(row, krow):
+            if abs(c * r - k) > tolerance:
+                return None
+    return column, row
+
+
+def _horizontal_pass(image, row):
+    # correlate each row of the image with the 1-D kernel `row`
+    height, width, pixels = image['height'], image['width'], image['pixels']
+    offsets = kernel_offsets(len(row))
+    before, after = -offsets[0], offsets[-1]
+    zero = 0 if all(type(r) is int for r in row) else 0.0
+    out = []
+    for x in range(height):
+        line = list(pixels[x * width:(x + 1) * width])
+        padded = [line[0]] * before + line + [line[-1]] * after
+        acc = [zero] * width
+        for j, weight in enumerate(row):
+            if weight:
+                acc[:] = map(add, acc, map(mul, padded[j:j + width], repeat(weight)))
+        out.append(acc)
+    return out
+
+
+def _vertical_pass(lines, column, width):
+    # correlate the columns of a list of rows with the 1-D kernel `column`,
+    # returning the flat list of pixels
+    height = len(lines)
+    offsets = kernel_offsets(len(column))
+    zero = 0 if all(type(c) is int for c in column) else 0.0
+    out = []
+    for x in range(height):
+        acc = [zero] * width
+        for d, weight in zip(offsets, column):
+            if weight:
+                acc[:] = map(add, acc, map(mul, lines[min(max(x + d, 0), height - 1)], repeat(weight)))
+        out.extend(acc)
+    return out
+
+
+def correlate_separable(image, kernel, column, row):
+    """
+    Correlate the image with a separable kernel, given its factors (see
+    separate_kernel), as two 1-D passes.  Returns a new image of unrounded
+    values.
+    """
+    pixels = _vertical_pass(_horizontal_pass(image, row), column, image['width'])
+    if any(type(p) is float for p in pixels):
+        size = len(kernel)
+        total = sum(abs(k) for krow in kernel for k in krow)
+        largest = max(map(abs, image['pixels']), default=0)
+        # rounding in the two passes, plus the products column[i] * row[j]
+        # being within the separate_kernel tolerance of the kernel's taps
+        error = 8 * size * total * largest * EPSILON + size * size * 1e-12 * largest
+        _repair(pixels, image, kernel, error)
+    return {
+        'height': image['height'],
+        'width': image['width'],
+        'pixels': pixels,
+    }
+
+
+def _repair(pixels, image, kernel, error):
+    # recompute, tap by tap, every value close enough to x.5 that rounding
+    # errors (our `error`, plus that of the direct sum) could change the
+    # result of rounding it
+    size = len(kernel)
+    total = sum(abs(k) for krow in kernel for k in krow)
+    largest = max(map(abs, image['pixels']), default=0)
+    bound = error + 4 * size * size * total * largest * EPSILON
+    width = image['width']
+    for i, v in enumerate(pixels):
+        if abs(v % 1 - 0.5) <= bound:
+            pixels[i] = reference_value(image, kernel, i // width, i % width)
+
+
+# FFT CORRELATION
+
+def _fft2(lines, height, width):
+    # 2-D transform of a list of rows, zero-padded to height x width (powers
+    # of two); returns the transformed columns
+    rows = [fft(list(line) + [0] * (width - len(line))) for line in lines]
+    return [fft(list(col) + [0] * (height - len(col))) for col in zip(*rows)]
+
+
+def _correlate_fft_python(padded, kernel, height, width):
+    # padded: the edge-extended image as a list of rows
+    size_x = next_power_of_two(len(padded))
+    size_y = next_power_of_two(len(padded[0]))
+    image_cols = _fft2(padded, size_x, size_y)
+    kernel_cols = _fft2(kernel, size_x, size_y)
+    # correlating is multiplying by the conjugate of the kernel's transform
+    product = [fft(list(map(mul, col, map(complex.conjugate, kcol))), inverse=True)
+               for col, kcol in zip(image_cols, kernel_cols)]
+    out = []
+    for row in list(zip(*product))[:height]:
+        out.extend(v.real for v in fft(row, inverse=True)[:width])
+    return out
+
+
+def _correlate_fft_numpy(padded, kernel, height, width):
+    values = numpy.array(padded, dtype=float)
+    shape = values.shape
+    spectrum = numpy.fft.rfft2(values) * numpy.conj(numpy.fft.rfft2(numpy.array(kernel, dtype=float), shape))
+    return numpy.fft.irfft2(spectrum, shape)[:height, :width].ravel().tolist()
+
+
+def correlate_fft(image, kernel):
+    """
+    Correlate the image with the kernel using the FFT, returning a new image
+    of unrounded values.  The image is edge-extended by the kernel's reach
+    first, so pixels beyond the edges behave exactly as in correlate.  Costs
+    O(log(height*width)) per pixel whatever the size of the kernel.
+    """
+    height, width = image['height'], image['width']
+    size = len(kernel)
+    kernel = [list(krow[:size]) + [0] * (size - len(krow)) for krow in kernel]
+    offsets = kernel_offsets(size)
+    flat, padded_width = padded_pixels(image, -offsets[0], offsets[-1])
+    padded = [flat[i:i + padded_width] for i in range(0, len(flat), padded_width)]
+
+    if numpy is not None:
+        pixels = _correlate_fft_numpy(padded, kernel, height, width)
+    else:
+        pixels = _correlate_fft_python(padded, kernel, height, width)
+
+    # the FFT's rounding error grows with the log of its size and the
+    # magnitudes of both inputs
+    points = len(padded) * padded_width
+    error = (8 * max(1, points.bit_length()) * EPSILON
+             * math.sqrt(sum(p * p for p in flat)) * math.sqrt(sum(k * k for krow in kernel for k in krow)))
+    if is_integer_image(image) and all(type(k) is int for krow in kernel for k in krow) and error < 0.25:
+        # the exact results are integers
+        pixels = [round(p) for p in pixels]
+    else:
+        _repair(pixels, image, kernel, error)
+    return {
+        'height': height,
+        'width': width,
+        'pixels': pixels,
+    }
+
+
+# approximate seconds per (tap * pixel) for direct correlation, and, for the
+# FFT, per pixel (building and repairing the buffers) plus per (point *
+# log2(points)) of each 2-D transform; with and without NumPy
+DIRECT_COST = {'numpy': 1.5e-9, 'python': 1e-7}
+FFT_COST = {'numpy': (6e-7, 1e-9), 'python': (1e-6, 3e-7)}
+
+
+def prefer_fft(image, kernel):
+    """
+    Return True if correlating the image with the kernel is expected to be
+    faster through the FFT than directly.
+    """
+    mode = 'python' if numpy is None else 'numpy'
+    height, width, size = image['height'], image['width'], len(kernel)
+    taps = sum(1 for krow in kernel for k in krow[:size] if k != 0)
+    direct = taps * height * width * DIRECT_COST[mode]
+    if numpy is None:
+        points = next_power_of_two(height + size - 1) * next_power_of_two(width + size - 1)
+    else:
+        points = (height + size - 1) * (width + size - 1)
+    per_pixel, per_point = FFT_COST[mode]
+    # three transforms: the image, the kernel and the inverse
+    transform = height * width * per_pixel + 3 * points * max(1, points.bit_length()) * per_point
+    return transform < direct
+
+
+# BOX FILTERS
+
+def box_sums(image, n):
+    """
+    Return a flat list with the sum of the n-by-n window (clamped at the
+    edges of the image, as in correlate) around every pixel of an integer
+    image, using running sums along the rows and then down the columns.
+    """
+    height, width, pixels = image['height'], image['width'], image['pixels']
+    offsets = kernel_offsets(n)
+    before, after = -offsets[0], offsets[-1]
+
+    lines = []
+    for x in range(height):
+        line = list(pixels[x * width:(x + 1) * width])
+        totals = list(accumulate([line[0]] * before + line + [line[-1]] * after, initial=0))
+        lines.append(list(map(sub, totals[n:], totals[:-n])))
+
+    def clamp(x):
+        return min(max(x, 0), height - 1)
+
+    window = [0] * width
+    for d in offsets:
+        window[:] = map(add, window, lines[clamp(d)])
+    out = []
+    for x in range(height):
+        out.extend(window)
+        if x + 1 < height:
+            window[:] = map(sub, map(add, window, lines[clamp(x + 1 + after)]), lines[clamp(x - before)])
+    return out
+
+
+def box_filtered(image, n, kernel, scale=1, center=0):
+    """
+    Return the rounded and clipped result of correlating an integer image
+    with `kernel`, which must be the n-by-n box kernel scaled by `scale` (1 or
+    -1) plus `center` (an int) at its centre: blurred's kernel has scale=1 and
+    center=0, sharpened's scale=-1 and center=2.  The result is identical to
+    round_and_clip_image(correlate(image, kernel)), in constant time per
+    pixel.
+    """
+    d = n * n
+    sums = box_sums(image, n)
+    if scale < 0:
+        sums = [-s for s in sums]
+    if center:
+        sums = list(map(add, sums, map(mul, image['pixels'], repeat(center * d))))
+
+    # each value is sums[i] / d exactly: round to nearest, then clip
+    pixels = list(map(min, repeat(255), map(max, repeat(0),
+        map(floordiv, map(add, map(mul, sums, repeat(2)), repeat(d)), repeat(2 * d)))))
+
+    # values at (or, for huge kernels, within rounding error of) x.5 are
+    # recomputed the direct way, since the direct floating point sum decides
+    # which way they round
+    largest = max(map(abs, image['pixels']), default=0)
+    total = 1 + 2 * abs(center)
+    limit = int(8 * d * d * total * largest * EPSILON)
+    if d % 2 == 0 or limit:
+        width = image['width']
+        for i, r in enumerate(map(mod, sums, repeat(d))):
+            if abs(2 * r - d) <= limit:
+                pixels[i] = clip_round(reference_value(image, kernel, i // width, i % width))
+
+    return {
+        'height': image['height'],
+        'width': image['width'],
+        'pixels': pixels,
+    }
+
+
+# EDGES
+
+def _sobel_numpy(image, clip):
+    # integer images only: every step is exact, as in Python
+    values = numpy.array(image['pixels'], dtype=numpy.int64).reshape(image['height'], image['width'])
+    p = numpy.pad(values, 1, mode='edge')
+    a, b, c = p[:-2, :-2], p[:-2, 1:-1], p[:-2, 2:]
+    d, f = p[1:-1, :-2], p[1:-1, 2:]
+    g, h, i = p[2:, :-2], p[2:, 1:-1], p[2:, 2:]
+    ox = (c - a) + 2 * (f - d) + (i - g)
+    oy = (g - a) + 2 * (h - b) + (i - c)
+    magnitude = numpy.rint(numpy.sqrt((ox * ox + oy * oy).astype(float))).astype(numpy.int64)
+    if clip:
+        magnitude = numpy.minimum(magnitude, 255)
+    return magnitude.ravel().tolist()
+
+
+def sobel(image, clip=True, root=math.sqrt):
+    """
+    Return the Sobel gradient magnitude of the image, as edges in lab.py
+    computes it (round(root(Ox**2 + Oy**2)) of the correlations with the two
+    Sobel kernels, then clipped to 255 unless clip is False), in a single
+    pass over an edge-extended copy of the image instead of two full
+    correlations and two more passes over their results.
+
+    Both gradients add up their taps in the same order as correlate, so the
+    result is identical for any image; `root` is the square root that edges
+    uses (integer images always give integer sums of squares, whose square
+    roots cannot lie close enough to x.5 for the choice to matter).
+    """
+    height, width = image['height'], image['width']
+    integral = is_integer_image(image)
+    if numpy is not None and integral and height and width \
+            and max(map(abs, image['pixels'])) < 2 ** 28:
+        pixels = _sobel_numpy(image, clip)
+    else:
+        if integral:
+            root = math.sqrt
+        padded, padded_width = padded_pixels(image, 1, 1)
+        pixels = []
+        for x in range(height):
+            up = padded[x * padded_width:(x + 1) * padded_width]
+            mid = padded[(x + 1) * padded_width:(x + 2) * padded_width]
+            down = padded[(x + 2) * padded_width:(x + 3) * padded_width]
+            for a, b, c, d, f, g, h, i in zip(up, up[1:], up[2:], mid, mid[2:],
+                                              down, down[1:], down[2:]):
+                ox = -a + c - 2 * d + 2 * f - g + i
+                oy = -a - 2 * b - c + g + 2 * h + i
+                value = round(root(ox**2 + oy**2))
+                pixels.append(255 if clip and value > 255 else value)
+
+    return {
+        'height': height,
+        'width': width,
+        'pixels': pixels,
+    }
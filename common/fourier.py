@@ -0,0 +1,60 @@
+"""
+The fast Fourier transform shared by the audio effects (lab 0) and the image
+filters (labs 1 and 2).
+
+fft uses NumPy when it is installed, and otherwise an iterative radix-2 FFT
+in pure Python, which works on whole slices at a time with `map`.
+"""
+
+import cmath
+from operator import add, mul, sub
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+def next_power_of_two(n):
+    """
+    Return the smallest power of two that is >= n.
+    """
+    return 1 << max(0, n - 1).bit_length()
+
+
+def fft(values, inverse=False):
+    """
+    Compute the discrete Fourier transform of the given sequence (whose
+    length must be a power of two), with NumPy or an iterative radix-2 FFT,
+    returning a new list of complex numbers.  If inverse is True, compute
+    the inverse transform instead (including the 1/n normalization).
+    """
+    n = len(values)
+    assert n & (n - 1) == 0, "the FFT length must be a power of two"
+
+    if numpy is not None:
+        transform = numpy.fft.ifft if inverse else numpy.fft.fft
+        return transform(numpy.asarray(values, dtype=complex)).tolist()
+
+    # reorder the input by bit-reversed index
+    order = [0]
+    while len(order) < n:
+        order = [2 * i for i in order] + [2 * i + 1 for i in order]
+    a = [complex(values[i]) for i in order]
+
+    sign = 1 if inverse else -1
+    size = 2
+    while size <= n:
+        half = size // 2
+        twiddles = [cmath.exp(sign * 2j * cmath.pi * k / size) for k in range(half)]
+        for start in range(0, n, size):
+            mid, stop = start + half, start + size
+            even = a[start:mid]
+            odd = list(map(mul, twiddles, a[mid:stop]))
+            a[start:mid] = map(add, even, odd)
+            a[mid:stop] = map(sub, even, odd)
+        size *= 2
+
+    if inverse:
+        a = [v / n for v in a]
+    return a
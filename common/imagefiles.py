@@ -0,0 +1,213 @@
+"""
+Reading and writing image files with PIL.
+
+Pixels are moved in and out of PIL as raw bytes (Image.tobytes and
+Image.frombytes) rather than through getdata and putdata, which go through
+a Python object per pixel.  Converting colour to greyscale still has to give
+exactly round(.299*r + .587*g + .114*b) for every pixel, which PIL's own
+conversion does not (its fixed-point arithmetic rounds a few thousand of the
+16.7 million possible colours the other way), so that is done here: with
+NumPy in double precision, which is the same arithmetic as Python's, or
+otherwise with `map` over the bytes of each channel and tables of the
+products.
+
+Both readers can read just a region of interest, given as (top, left,
+height, width): only that part of the image is converted and turned into
+Python values.  How much of the file is decoded depends on its format.
+Images stored as uncompressed rows of bytes (BMP, PPM, uncompressed TIFF and
+TGA) are read only in the rows of the region, straight from the file;
+compressed ones (PNG, JPEG, ...) cannot be decoded from the middle, so they
+are decoded whole and then cut down.
+
+image_to_raw and raw_to_image convert between image files and raw files of
+pixel bytes (see tiles.py) a strip of rows at a time, without ever turning
+the whole image into Python values.
+"""
+
+import mmap
+
+from array import array
+from itertools import chain
+from operator import add
+
+from PIL import Image
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+
+_RED = [.299 * v for v in range(256)]
+_GREEN = [.587 * v for v in range(256)]
+_BLUE = [.114 * v for v in range(256)]
+
+
+def grey_values(data, bands):
+    """
+    Return the list of greyscale values, round(.299*r + .587*g + .114*b), of
+    the pixels in `data`: raw bytes with `bands` bytes per pixel, the first
+    three being red, green and blue.
+    """
+    if numpy is not None:
+        values = numpy.frombuffer(data, dtype=numpy.uint8).reshape(-1, bands).astype(float)
+        grey = .299 * values[:, 0] + .587 * values[:, 1] + .114 * values[:, 2]
+        return numpy.rint(grey).astype(numpy.int64).tolist()
+    # the products only depend on the byte, so they are looked up
+    red, green, blue = data[0::bands], data[1::bands], data[2::bands]
+    return list(map(round, map(add, map(add, map(_RED.__getitem__, red),
+                                            map(_GREEN.__getitem__, green)),
+                                   map(_BLUE.__getitem__, blue))))
+
+
+def _raw_layout(img):
+    # (offset, rawmode, stride, ystep) of an image PIL has not loaded yet, if
+    # it is stored as uncompressed rows of whole bytes; otherwise None
+    if img.mode not in ('L', 'LA', 'RGB', 'RGBA') or len(img.tile) != 1:
+        return None
+    codec, extents, offset, args = img.tile[0]
+    if codec != 'raw' or tuple(extents) != (0, 0) + img.size:
+        return None
+    if isinstance(args, str):
+        args = (args,)
+    rawmode, stride, ystep = (tuple(args) + (0, 1))[:3]
+    if not set(rawmode) <= set('LRGBAX'):
+        return None
+    return offset, rawmode, stride or img.size[0] * len(rawmode), ystep
+
+
+def _open_region(handle, region):
+    # open an image, cut down to the region of interest if given, reading
+    # only the rows of the region when the format allows it
+    img = Image.open(handle)
+    if region is None:
+        return img
+    top, left, height, width = region
+    w, h = img.size
+    if not (0 <= top and 0 <= left and 0 <= height and 0 <= width
+            and top + height <= h and left + width <= w):
+        raise ValueError('region %r lies outside the %dx%d image' % (region, h, w))
+    box = (left, top, left + width, top + height)
+    layout = _raw_layout(img)
+    if layout is None:
+        return img.crop(box)  # decodes the whole image
+    offset, rawmode, stride, ystep = layout
+    # rows stored bottom-up (ystep -1) are in the file in reverse order
+    first = top if ystep > 0 else h - top - height
+    handle.seek(offset + first * stride)
+    data = handle.read(height * stride)
+    if len(data) < height * stride:
+        return img.crop(box)  # a truncated file, left for PIL to report
+    rows = Image.frombytes(img.mode, (w, height), data, 'raw', rawmode, stride, ystep)
+    return rows.crop((left, 0, left + width, height))
+
+
+def _grey_pixels(img):
+    # the greyscale values of a PIL image, as a list
+    data = img.tobytes()
+    if img.mode.startswith('RGB'):
+        return grey_values(data, len(img.getbands()))
+    elif img.mode == 'LA':
+        return list(data[0::2])
+    elif img.mode == 'L':
+        return list(data)
+    raise ValueError('Unsupported image mode: %r' % img.mode)
+
+
+def read_greyscale(filename, region=None):
+    """
+    Read an image file as a greyscale image dictionary, converting colour
+    images to greyscale.
+    """
+    with open(filename, 'rb') as img_handle:
+        img = _open_region(img_handle, region)
+        pixels = _grey_pixels(img)
+        w, h = img.size
+        return {'height': h, 'width': w, 'pixels': pixels}
+
+
+def read_color(filename, region=None):
+    """
+    Read an image file as a color image dictionary.
+    """
+    with open(filename, 'rb') as img_handle:
+        img = _open_region(img_handle, region)
+        img = img.convert('RGB')  # in case we were given a greyscale image
+        data = img.tobytes()
+        w, h = img.size
+        return {'height': h, 'width': w, 'pixels': list(zip(data[0::3], data[1::3], data[2::3]))}
+
+
+def _raw_bytes(pixels, color):
+    # the pixels as raw bytes, or None if they are not all ints from 0 to 255
+    if isinstance(pixels, array):
+        return bytes(pixels) if pixels.typecode == 'B' else None
+    try:
+        return bytes(chain.from_iterable(pixels)) if color else bytes(pixels)
+    except (TypeError, ValueError):
+        return None
+
+
+def write_image(image, filename, mode='PNG', color=False):
+    """
+    Save a greyscale (or, if color is True, colour) image dictionary to disk
+    or to a file-like object.  If filename is given as a string, the file type
+    will be inferred from the given name.  If filename is given as a file-like
+    object, the file type will be determined by the 'mode' parameter.
+    """
+    pil_mode = 'RGB' if color else 'L'
+    size = (image['width'], image['height'])
+    data = _raw_bytes(image['pixels'], color)
+    if data is not None and len(data) == size[0] * size[1] * len(pil_mode):
+        out = Image.frombytes(pil_mode, size, data)
+    else:
+        # anything else goes through PIL's own conversion, as it always has
+        out = Image.new(mode=pil_mode, size=size)
+        out.putdata(image['pixels'])
+    if isinstance(filename, str):
+        out.save(filename)
+    else:
+        out.save(filename, mode)
+    out.close()
+
+
+def image_to_raw(filename, raw_filename, color=False, strip=256):
+    """
+    Write the pixels of an image file to a raw file, row by row, one byte
+    per pixel (converted to greyscale as read_greyscale does) or, if color is
+    True, three (red, green, blue), converting `strip` rows at a time.
+    Return the (height, width) of the image.
+    """
+    with open(filename, 'rb') as img_handle:
+        img = Image.open(img_handle)
+        w, h = img.size
+        with open(raw_filename, 'wb') as out:
+            for top in range(0, h, strip):
+                part = img.crop((0, top, w, min(h, top + strip)))
+                if color:
+                    out.write(part.convert('RGB').tobytes())
+                else:
+                    out.write(bytes(_grey_pixels(part)))
+        return h, w
+
+
+def raw_to_image(raw_filename, height, width, filename, mode='PNG', color=False):
+    """
+    Save a raw file of pixel bytes, as written by image_to_raw, as an image
+    file (see write_image for filename and mode).  The raw file is mapped
+    into memory rather than read.
+    """
+    pil_mode = 'RGB' if color else 'L'
+    with open(raw_filename, 'rb') as raw:
+        data = mmap.mmap(raw.fileno(), 0, access=mmap.ACCESS_READ) if height * width else b''
+        try:
+            out = Image.frombuffer(pil_mode, (width, height), data, 'raw', pil_mode, 0, 1)
+            if isinstance(filename, str):
+                out.save(filename)
+            else:
+                out.save(filename, mode)
+            out.close()
+            del out
+        finally:
+            if data:
+                data.close()
@@ -0,0 +1,238 @@
+"""
+Compact, array-backed images.
+
+The labs represent images as dictionaries whose 'pixels' are Python lists:
+8 bytes of pointer per greyscale pixel (plus the int objects) and a tuple per
+colour pixel.  A PackedImage keeps each channel as one flat `array`, in
+planar layout (all the red values, then all the green, then all the blue,
+each a separate plane):
+
+    * typecode 'B' (one byte per value) when every value is an int from 0
+      to 255, as in any image that can be saved
+    * typecode 'd' (a double) otherwise, e.g. the unrounded output of
+      correlate
+
+Rows and channels are views, not copies: row(x) is a memoryview into each
+plane, and channel(c) is a greyscale PackedImage sharing the plane's array,
+so splitting a colour image into channels (and combining three greyscale
+images into one) copies no pixels.
+
+A PackedImage can be used wherever the labs expect an image dictionary:
+image['height'], image['width'] and image['pixels'] work as before
+(greyscale pixels are the plane itself; colour pixels are a read-only
+sequence of (r, g, b) tuples).  from_dict and to_dict convert between the
+two representations.
+
+transposed(image) is likewise a view: an image dictionary whose pixels are
+those of the given image (dictionary or PackedImage) read column by column.
+"""
+
+from array import array
+
+
+def typecode_for(values):
+    """
+    Return the array typecode ('B' or 'd') that can hold all of the given
+    values exactly (as far as 'd' can).
+    """
+    if all(type(v) is int and 0 <= v <= 255 for v in values):
+        return 'B'
+    return 'd'
+
+
+class ColorPixels:
+    """
+    A read-only sequence of (r, g, b) tuples over the three planes of a
+    colour PackedImage, as its 'pixels'.
+    """
+    def __init__(self, planes):
+        self.planes = planes
+
+    def __len__(self):
+        return len(self.planes[0])
+
+    def __iter__(self):
+        return zip(*self.planes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return list(zip(*(plane[index] for plane in self.planes)))
+        return tuple(plane[index] for plane in self.planes)
+
+    def __eq__(self, other):
+        try:
+            if len(self) != len(other):
+                return False
+        except TypeError:
+            return NotImplemented
+        return all(a == b for a, b in zip(self, other))
+
+
+class PackedImage:
+    """
+    An image stored as one flat array per channel.
+
+    Parameters:
+        * height (int), width (int): size of the image
+        * planes (list of arrays): one array of height*width values for a
+                                   greyscale image, or three (red, green,
+                                   blue) for a colour image; they are used
+                                   as they are, not copied
+    """
+    def __init__(self, height, width, planes):
+        if len(planes) not in (1, 3):
+            raise ValueError('an image has one plane (greyscale) or three (colour)')
+        if any(len(plane) != height * width for plane in planes):
+            raise ValueError('every plane must hold height*width values')
+        self.height = height
+        self.width = width
+        self.planes = list(planes)
+
+    # CONVERSION
+
+    @classmethod
+    def from_dict(cls, image):
+        """
+        Return a PackedImage holding the same pixels as the given image
+        dictionary (greyscale, or colour with 3-tuple pixels).
+        """
+        if isinstance(image, PackedImage):
+            return image
+        pixels = image['pixels']
+        if pixels and isinstance(pixels[0], tuple):
+            channels = [[p[c] for p in pixels] for c in range(3)]
+        else:
+            channels = [pixels]
+        return cls(image['height'], image['width'],
+                   [array(typecode_for(values), values) for values in channels])
+
+    def to_dict(self):
+        """
+        Return a new image dictionary with the same pixels as this image.
+        """
+        if self.is_color():
+            pixels = list(zip(*(plane.tolist() for plane in self.planes)))
+        else:
+            pixels = self.planes[0].tolist()
+        return {'height': self.height, 'width': self.width, 'pixels': pixels}
+
+    def copy(self):
+        """
+        Return a PackedImage with its own copy of the pixels.
+        """
+        return PackedImage(self.height, self.width, [array(p.typecode, p) for p in self.planes])
+
+    # DICTIONARY INTERFACE
+
+    def keys(self):
+        return ['height', 'width', 'pixels']
+
+    def __getitem__(self, key):
+        if key == 'height':
+            return self.height
+        if key == 'width':
+            return self.width
+        if key == 'pixels':
+            return ColorPixels(self.planes) if self.is_color() else self.planes[0]
+        raise KeyError(key)
+
+    def __eq__(self, other):
+        if isinstance(other, dict) and {'height', 'width', 'pixels'} <= other.keys():
+            other = PackedImage.from_dict(other)
+        elif not isinstance(other, PackedImage):
+            return NotImplemented
+        return (self.height, self.width) == (other.height, other.width) and \
+            len(self.planes) == len(other.planes) and \
+            all(a == b for a, b in zip(self.planes, other.planes))
+
+    # VIEWS
+
+    def is_color(self):
+        return len(self.planes) == 3
+
+    def row(self, x):
+        """
+        Return row x as a list of memoryviews, one per plane, sharing this
+        image's memory.
+        """
+        start = x * self.width
+        return [memoryview(plane)[start:start + self.width] for plane in self.planes]
+
+    def channel(self, c):
+        """
+        Return channel c (0, 1, 2 for red, green, blue) of a colour image as
+        a greyscale PackedImage sharing this image's memory.
+        """
+        return PackedImage(self.height, self.width, [self.planes[c]])
+
+    def channels(self):
+        """
+        Return the list of channels of this image, as greyscale views.
+        """
+        return [self.channel(c) for c in range(len(self.planes))]
+
+    @classmethod
+    def combine(cls, red, green, blue):
+        """
+        Return a colour PackedImage whose channels are (not copies of) the
+        given greyscale PackedImages.
+        """
+        return cls(red.height, red.width, [red.planes[0], green.planes[0], blue.planes[0]])
+
+
+# TRANSPOSITION
+
+class TransposedPixels:
+    """
+    A read-only view of the pixels of an image dictionary as those of its
+    transpose (row y of the view is column y of the image), without copying
+    them.  A run of pixels from one row of the view is a strided slice of
+    the underlying pixels.
+    """
+    def __init__(self, pixels, height, width):
+        self.pixels = pixels
+        self.height = height  # of the underlying image
+        self.width = width
+
+    def __len__(self):
+        return self.height * self.width
+
+    def __iter__(self):
+        for y in range(self.width):
+            yield from self.pixels[y::self.width]
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            positions = range(*index.indices(len(self)))
+            if not positions:
+                return []
+            start, stop = positions[0], positions[-1] + 1
+            if positions.step == 1 and start // self.height == (stop - 1) // self.height:
+                y, x = divmod(start, self.height)
+                first = x * self.width + y
+                return self.pixels[first:first + (stop - start - 1) * self.width + 1:self.width]
+            return [self[i] for i in positions]
+        if index < 0:
+            index += len(self)
+        y, x = divmod(index, self.height)
+        return self.pixels[x * self.width + y]
+
+
+def transposed(image):
+    """
+    Return the transpose of the given image (its rows as columns) as an image
+    dictionary whose pixels are a view of the original's.
+    """
+    return {
+        'height': image['width'],
+        'width': image['height'],
+        'pixels': TransposedPixels(image['pixels'], image['height'], image['width']),
+    }
+
+
+def materialized(image):
+    """
+    Return an image dictionary with the pixels of the given image (or view)
+    copied into a list.
+    """
+    return {'height': image['height'], 'width': image['width'], 'pixels': list(image['pixels'])}
@@ -0,0 +1,134 @@
+"""
+Filtering images too large to hold as Python lists, a tile at a time.
+
+A RawImage is an image kept in a file as raw bytes, row by row (one byte per
+pixel for a greyscale image, three for a colour one), and mapped into
+memory, so that only the parts being read or written are paged in.
+imagefiles.image_to_raw and raw_to_image convert image files to and from
+this form.
+
+filter_tiled runs a filter over a RawImage one tile (a block of rows and
+columns) at a time, writing each result into another RawImage.  As in
+parallel.py, a tile is read with `reach` extra pixels (a halo) on every side
+where the image goes on, reach being how far the filter looks from each
+pixel (the kernel radius); those are filtered along with the tile and thrown
+away, so every kept pixel sees the same neighbours as when the whole image
+is filtered at once, and at the edges of the image the tile's edges are the
+image's, extended just as correlate extends them.  The results are the same
+as filtering the whole image, for filters that round and clip (so that
+their output fits in bytes).
+"""
+
+import os
+import mmap
+from itertools import chain
+
+
+# tiles are at most this many pixels high and wide, plus their halos
+TILE = 512
+
+
+class RawImage:
+    """
+    An image stored as raw bytes in a file, mapped into memory.
+
+    Parameters:
+        * filename (str): the raw file
+        * height (int), width (int): size of the image
+        * color (bool): three bytes (red, green, blue) per pixel if True,
+                        otherwise one (greyscale)
+        * create (bool): if True, create (or overwrite) the file, filled
+                         with zeros; otherwise it must already hold exactly
+                         height*width pixels
+    """
+    def __init__(self, filename, height, width, color=False, create=False):
+        self.height = height
+        self.width = width
+        self.color = color
+        self.bands = 3 if color else 1
+        size = height * width * self.bands
+        self.file = open(filename, 'w+b' if create else 'rb')
+        if create:
+            self.file.truncate(size)
+        elif os.fstat(self.file.fileno()).st_size != size:
+            self.file.close()
+            raise ValueError('%s does not hold a %dx%d image' % (filename, height, width))
+        if size:
+            access = mmap.ACCESS_WRITE if create else mmap.ACCESS_READ
+            self.buffer = mmap.mmap(self.file.fileno(), size, access=access)
+        else:
+            self.buffer = bytearray()
+
+    def read(self, top, left, height, width):
+        """
+        Return the given region of this image as an image dictionary.
+        """
+        rowbytes = self.width * self.bands
+        start, stop = left * self.bands, (left + width) * self.bands
+        data = b''.join(self.buffer[x * rowbytes + start:x * rowbytes + stop]
+                        for x in range(top, top + height))
+        if self.color:
+            pixels = list(zip(data[0::3], data[1::3], data[2::3]))
+        else:
+            pixels = list(data)
+        return {'height': height, 'width': width, 'pixels': pixels}
+
+    def write(self, top, left, image):
+        """
+        Write the given image (with pixel values that are ints from 0 to
+        255) into this one, with its top left pixel at (top, left).
+        """
+        pixels = image['pixels']
+        try:
+            data = bytes(chain.from_iterable(pixels)) if self.color else bytes(pixels)
+        except (TypeError, ValueError):
+            raise ValueError('only images of ints from 0 to 255 can be written as bytes')
+        rowbytes = self.width * self.bands
+        length = image['width'] * self.bands
+        start = left * self.bands
+        for x in range(image['height']):
+            offset = (top + x) * rowbytes + start
+            self.buffer[offset:offset + length] = data[x * length:(x + 1) * length]
+
+    def close(self):
+        if isinstance(self.buffer, mmap.mmap):
+            self.buffer.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def tiles(height, width, size=TILE):
+    """
+    Yield the tiles covering an image of the given size, as (top, left,
+    height, width), row by row.
+    """
+    for top in range(0, height, size):
+        for left in range(0, width, size):
+            yield top, left, min(size, height - top), min(size, width - left)
+
+
+def filter_tiled(filt, reach, source, target, size=TILE):
+    """
+    Apply the given filter, which looks at most `reach` pixels away from each
+    pixel and does not change the size of the image, to the RawImage source
+    a tile at a time, writing the results into the RawImage target.
+    """
+    if (source.height, source.width) != (target.height, target.width):
+        raise ValueError('the target must be the same size as the source')
+    for top, left, height, width in tiles(source.height, source.width, size):
+        # the tile with its halo, cut short at the edges of the image
+        x0, y0 = max(0, top - reach), max(0, left - reach)
+        x1 = min(source.height, top + height + reach)
+        y1 = min(source.width, left + width + reach)
+        result = filt(source.read(x0, y0, x1 - x0, y1 - y0))
+        pixels = result['pixels']
+        kept = []
+        for x in range(top - x0, top - x0 + height):
+            start = x * (y1 - y0) + left - y0
+            kept.extend(pixels[start:start + width])
+        target.write(top, left, {'height': height, 'width': width, 'pixels': kept})
@@ -0,0 +1,204 @@
+"""
+Benchmarks for the lab0 effects.
+
+Synthesizes stereo test sounds of the requested durations, times every
+effect (plus load_wav and write_wav) on them in both sound representations,
+and reports throughput in samples per second together with the peak memory
+allocated while each one runs (as measured by tracemalloc).
+
+Results can be saved as a JSON baseline and later runs compared against it,
+so that slowdowns in the hot loops show up:
+
+    python3 bench.py --durations 1 10 --save bench_baseline.json
+    ... change something ...
+    python3 bench.py --durations 1 10 --compare bench_baseline.json
+
+Durations can range from seconds to hours (`--durations 3600`); the test
+sounds are built by repeating one synthesized second, so generating them is
+cheap.  Beyond MAX_SECONDS, the dictionary representation (about 32 bytes
+per sample) and the slowest benchmarks are skipped, so long runs only time
+array-backed Sounds.  Comparing exits with status 1 if any benchmark got
+slower than the baseline by more than the tolerance (25% by default).
+"""
+
+import os
+import sys
+import json
+import math
+import time
+import argparse
+import tempfile
+import tracemalloc
+from array import array
+
+import lab
+import dsp
+from envelope import apply_envelope, fade
+from sound import Sound, as_dict
+
+RATE = 44100
+
+# the longest sounds (in seconds) that a representation or a benchmark is
+# run on: a dictionary of lists of an hour's sound takes gigabytes, and the
+# reverb without NumPy runs its FFTs in pure Python
+MAX_SECONDS = {
+    'dict': 600,
+    'reverb': 600 if dsp.numpy is not None else 30,
+}
+
+
+def synth_sound(seconds, rate=RATE, compact=False):
+    """
+    Return a deterministic stereo sound of the given duration: one second of
+    a chord (different in each channel), repeated.
+    """
+    second_left = array('d', (0.3 * math.sin(2 * math.pi * 220 * i / rate) +
+                              0.2 * math.sin(2 * math.pi * 277 * i / rate)
+                              for i in range(rate)))
+    second_right = array('d', (0.3 * math.sin(2 * math.pi * 330 * i / rate) +
+                               0.2 * math.sin(2 * math.pi * 415 * i / rate)
+                               for i in range(rate)))
+    n = round(seconds * rate)
+    repeats = -(-n // rate)
+    sound = Sound(rate, (second_left * repeats)[:n], (second_right * repeats)[:n])
+    return sound if compact else as_dict(sound)
+
+
+def cases(sound, other, workdir, only=None):
+    """
+    Return a list of (name, function) pairs, one for each benchmark on the
+    given sounds (or only for the named ones).
+    """
+    wavfile = os.path.join(workdir, 'bench.wav')
+    if not only or 'load_wav' in only:
+        lab.write_wav(sound, wavfile)
+    compact = isinstance(sound, Sound)
+    impulse = [0.5 ** i for i in range(256)]
+    return [(name, func) for name, func in [
+        ('backwards', lambda: lab.backwards(sound)),
+        ('mix', lambda: lab.mix(sound, other, 0.3)),
+        ('mix_tracks', lambda: lab.mix_tracks([sound, other, sound], [0.2, 0.3, 0.5])),
+        ('echo', lambda: lab.echo(sound, 5, 0.3, 0.6)),
+        ('pan', lambda: lab.pan(sound)),
+        ('envelope', lambda: apply_envelope(sound, fade(0.1, 0.1))),
+        ('remove_vocals', lambda: lab.remove_vocals(sound)),
+        ('reverb', lambda: lab.reverb(sound, impulse)),
+        ('load_wav', lambda: lab.load_wav(wavfile, compact=compact)),
+        ('write_wav', lambda: lab.write_wav(sound, os.path.join(workdir, 'out.wav'))),
+    ] if not only or name in only]
+
+
+def best_time(func, repeats):
+    """
+    Return the shortest of `repeats` timings of func(), in seconds.
+    """
+    best = float('inf')
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def peak_memory(func):
+    """
+    Return the peak number of bytes allocated while running func().
+    """
+    tracemalloc.start()
+    try:
+        func()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def run(durations, representations=('dict', 'compact'), only=None, repeats=3,
+        memory=True, out=sys.stdout):
+    """
+    Run the benchmarks, printing a line for each one.  Returns a dictionary
+    mapping 'name/representation/duration' to a dictionary of results.
+    """
+    results = {}
+    with tempfile.TemporaryDirectory() as workdir:
+        for seconds in durations:
+            for rep in representations:
+                limit = MAX_SECONDS.get(rep, seconds)
+                if seconds > limit:
+                    print('%-32s skipped: longer than %gs' % ('*/%s/%gs' % (rep, seconds), limit), file=out)
+                    continue
+                sound = synth_sound(seconds, compact=(rep == 'compact'))
+                other = synth_sound(seconds, compact=(rep == 'compact'))
+                samples = len(sound['left'])
+                for name, func in cases(sound, other, workdir, only):
+                    key = '%s/%s/%gs' % (name, rep, seconds)
+                    limit = MAX_SECONDS.get(name, seconds)
+                    if seconds > limit:
+                        print('%-32s skipped: longer than %gs' % (key, limit), file=out)
+                        continue
+                    elapsed = best_time(func, repeats)
+                    result = {
+                        'seconds': elapsed,
+                        'samples_per_sec': samples / elapsed if elapsed else float('inf'),
+                    }
+                    if memory:
+                        result['peak_bytes'] = peak_memory(func)
+                    results[key] = result
+                    print('%-32s %10.4fs %14.0f samples/s %12s' % (
+                        key, elapsed, result['samples_per_sec'],
+                        '%.1f MiB' % (result['peak_bytes'] / 2**20) if memory else ''), file=out)
+    return results
+
+
+def regressions(results, baseline, tolerance=0.25):
+    """
+    Return a list of (key, baseline throughput, new throughput) for every
+    benchmark whose throughput dropped by more than `tolerance` (a fraction)
+    compared to the baseline.
+    """
+    slower = []
+    for key, result in sorted(results.items()):
+        if key not in baseline:
+            continue
+        before = baseline[key]['samples_per_sec']
+        after = result['samples_per_sec']
+        if after < before * (1 - tolerance):
+            slower.append((key, before, after))
+    return slower
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Benchmark the lab0 audio effects.')
+    parser.add_argument('--durations', type=float, nargs='+', default=[1, 10],
+                        help='lengths of the test sounds, in seconds (default: 1 10)')
+    parser.add_argument('--repr', choices=['dict', 'compact'], nargs='+', default=['dict', 'compact'],
+                        help='sound representations to benchmark (default: both)')
+    parser.add_argument('--only', nargs='+', help='only run the named benchmarks')
+    parser.add_argument('--repeats', type=int, default=3, help='timings per benchmark; the best is kept')
+    parser.add_argument('--no-memory', action='store_true', help='skip the tracemalloc runs')
+    parser.add_argument('--save', metavar='FILE', help='write the results as a JSON baseline')
+    parser.add_argument('--compare', metavar='FILE', help='compare against a JSON baseline')
+    parser.add_argument('--tolerance', type=float, default=0.25,
+                        help='allowed fractional drop in throughput when comparing (default: 0.25)')
+    args = parser.parse_args(argv)
+
+    results = run(args.durations, args.repr, args.only, args.repeats, not args.no_memory)
+
+    if args.save:
+        with open(args.save, 'w') as f:
+            json.dump(results, f, indent=2, sort_keys=True)
+
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+        slower = regressions(results, baseline, args.tolerance)
+        for key, before, after in slower:
+            print('REGRESSION %s: %.0f -> %.0f samples/s (%.0f%%)' % (
+                key, before, after, 100 * (after - before) / before))
+        if slower:
+            return 1
+        print('no regressions against %s' % args.compare)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,367 @@
+"""
+Signal-processing kernels shared by the lab0 effects.
+
+The functions here work on a single channel (any sequence of floats) and
+return a new list of samples.  They avoid per-sample Python loops where they
+can by operating on whole slices at a time with `map`.  The FFTs use NumPy
+when it is available, and a pure-Python radix-2 FFT otherwise.
+"""
+
+import os
+import sys
+import math
+from itertools import repeat
+from operator import add, mul, sub
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# the modules shared between the labs are in ../common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+from fourier import next_power_of_two, fft
+
+
+# ECHO
+
+def tapped_echo(samples, num_echos, sample_delay, scale):
+    """
+    Add num_echos delayed copies of the given samples, the i-th one delayed by
+    i*sample_delay samples and scaled by scale**i.  This sums the taps in the
+    same order as the original echo implementation, so the output matches it
+    exactly, at a cost of O(num_echos * N).
+    """
+    n = len(samples)
+    out = list(samples) + [0] * num_echos * sample_delay
+    for i in range(1, num_echos + 1):
+        start = i * sample_delay
+        out[start:start + n] = map(add, out[start:start + n],
+                                   map(mul, samples, repeat(scale ** i)))
+    return out
+
+
+def feedback_echo(samples, num_echos, sample_delay, scale):
+    """
+    Compute the same echo as tapped_echo in a single O(N) pass, using the
+    recurrence
+
+        y[n] = x[n] + scale*y[n-d] - scale**(num_echos+1) * x[n-(num_echos+1)*d]
+
+    where d is sample_delay.  The last term cancels the echo that would
+    otherwise feed back forever, truncating the output to num_echos taps.
+    Since y[n] only depends on y[n-d], each block of d samples is computed
+    from the previous one with a single slice operation.
+
+    The result is the same as tapped_echo's up to floating-point rounding,
+    which the recurrence accumulates differently: the two can differ by a few
+    units in the last place of the larger samples, more as |scale| approaches
+    1, but far less than the resolution of a 16-bit WAV file.  The
+    subtraction is only well-conditioned for |scale| < 1; other scales (and a
+    zero delay) fall back to tapped_echo, exactly.
+    """
+    if num_echos <= 0 or sample_delay <= 0 or abs(scale) >= 1:
+        return tapped_echo(samples, num_echos, sample_delay, scale)
+
+    d = sample_delay
+    n = len(samples)
+    out = list(samples) + [0] * num_echos * d
+    length = len(out)
+
+    span = (num_echos + 1) * d # delay of the first echo that is cut off
+    tail = scale ** (num_echos + 1)
+
+    for start in range(d, length, d):
+        stop = min(start + d, length)
+        # y[n] += scale * y[n-d]
+        out[start:stop] = map(add, out[start:stop],
+                              map(mul, out[start - d:stop - d], repeat(scale)))
+        # y[n] -= tail * x[n-span], for the samples where x is not zero
+        if span <= start < n + span:
+            cut = samples[start - span:stop - span]
+            end = start + len(cut)
+            out[start:end] = map(sub, out[start:end], map(mul, cut, repeat(tail)))
+    return out
+
+
+class EchoLine:
+    """
+    Streaming version of tapped_echo (or, if feedback is True, of
+    feedback_echo): feed successive blocks of one channel through
+    process(), then call flush() for the final num_echos*sample_delay
+    samples.  Only the delay lines (the last few inputs, and for the
+    recurrence outputs, that are needed) are kept between blocks.
+    """
+    def __init__(self, num_echos, sample_delay, scale, feedback=False):
+        self.num_echos = max(num_echos, 0)
+        self.delay = sample_delay
+        self.scale = scale
+        self.feedback = feedback and num_echos > 0 and sample_delay > 0 and abs(scale) < 1
+        if self.feedback:
+            self.span = (num_echos + 1) * sample_delay
+            self.tail = scale ** (num_echos + 1)
+            self.inputs = [0] * self.span # x[n-span] .. x[n-1]
+            self.outputs = [0] * sample_delay # y[n-d] .. y[n-1]
+        else:
+            self.inputs = [0] * (self.num_echos * sample_delay)
+
+    def process(self, samples):
+        """
+        Return the echoed samples for the next block of input.
+        """
+        if not self.feedback:
+            return self._process_taps(samples)
+
+        d, span, scale, tail = self.delay, self.span, self.scale, self.tail
+        n = len(samples)
+        xs = self.inputs + list(samples)
+        ys = self.outputs + [0] * n
+        # ys[d+k] = xs[span+k] + scale*ys[k] - tail*xs[k], d samples at a time
+        for start in range(0, n, d):
+            stop = min(start + d, n)
+            ys[d + start:d + stop] = map(sub,
+                map(add, xs[span + start:span + stop],
+                         map(mul, ys[start:stop], repeat(scale))),
+                map(mul, xs[start:stop], repeat(tail)))
+        self.inputs = xs[-span:]
+        self.outputs = ys[-d:]
+        return ys[d:]
+
+    def _process_taps(self, samples):
+        history = len(self.inputs)
+        n = len(samples)
+        xs = self.inputs + list(samples)
+        out = xs[history:]
+        for i in range(1, self.num_echos + 1):
+            start = history - i * self.delay
+            out = list(map(add, out, map(mul, xs[start:start + n], repeat(self.scale ** i))))
+        self.inputs = xs[len(xs) - history:]
+        return out
+
+    def flush(self):
+        """
+        Return the samples that ring on after the end of the input.
+        """
+        return self.process([0] * (self.num_echos * self.delay))
+
+
+def echo_impulse(num_echos, sample_delay, scale):
+    """
+    Return the impulse response of an echo: a 1 followed by num_echos taps of
+    scale**i, each sample_delay samples apart.
+    """
+    impulse = [0.0] * (num_echos * sample_delay + 1)
+    for i in range(num_echos + 1):
+        impulse[i * sample_delay] += scale ** i
+    return impulse
+
+
+def echo_channel(samples, num_echos, sample_delay, scale, method='taps'):
+    """
+    Echo a single channel.  `method` selects the engine: 'taps' (direct
+    summation, exactly as the original echo), or, trading exactness for
+    speed with many echoes, 'feedback' (the O(N) recurrence) or 'fft'
+    (overlap-add convolution with the echo's impulse response), both of which
+    agree with it up to floating-point rounding.
+    """
+    if method == 'feedback':
+        return feedback_echo(samples, num_echos, sample_delay, scale)
+    elif method == 'taps':
+        return tapped_echo(samples, num_echos, sample_delay, scale)
+    elif method == 'fft':
+        return convolve(samples, echo_impulse(num_echos, sample_delay, scale))
+    raise ValueError('unknown echo method: %r' % method)
+
+
+# RESAMPLING
+
+# the low-pass filter used when downsampling spans this many zero crossings
+# of its sinc on each side of an output sample
+SINC_ZEROS = 8
+
+
+class Resampler:
+    """
+    One channel resampled from one sampling rate to another, computed a span
+    of output samples at a time (see span), without building the whole
+    output or any per-sample tables.  Positions are computed with integer
+    arithmetic, so they don't drift over long sounds.
+
+    Keeping or raising the rate interpolates linearly between neighbouring
+    samples.  Lowering it first removes the frequencies the new rate cannot
+    represent (which would otherwise alias into audible tones): each output
+    sample is a windowed-sinc low-pass filter with its cutoff at half the new
+    rate, evaluated only at that sample's position.  The output positions
+    only fall on a few different fractions of an input sample, so the
+    filter's coefficients are computed once per fraction (its polyphase
+    components) and reused.
+    """
+    def __init__(self, samples, from_rate, to_rate):
+        self.samples = samples
+        n = len(samples)
+        g = math.gcd(from_rate, to_rate)
+        self.step, self.phases = from_rate // g, to_rate // g
+        # output sample k sits at input position k*step/phases
+        self.length = n if from_rate == to_rate or n == 0 else (n - 1) * self.phases // self.step + 1
+        self.lowpass = to_rate < from_rate
+        if self.lowpass:
+            self.ratio = to_rate / from_rate
+            self.half = SINC_ZEROS / self.ratio  # half-width, in input samples
+            self.reach = math.ceil(self.half)
+            self.filters = {}
+
+    def __len__(self):
+        return self.length
+
+    def span(self, start, stop):
+        """
+        Return the list of output samples start to stop - 1.
+        """
+        stop = min(stop, self.length)
+        if start >= stop:
+            return []
+        if self.step == self.phases:
+            return list(self.samples[start:stop])
+        if self.lowpass:
+            if numpy is not None:
+                return self._filtered_numpy(start, stop)
+            return [self._filtered(k) for k in range(start, stop)]
+
+        samples, n, phases = self.samples, len(self.samples), self.phases
+        steps = range(start * self.step, stop * self.step, self.step)
+        first, last = steps[0] // phases, steps[-1] // phases
+        # the input samples around these positions, the last one repeated in
+        # case the last position lands exactly on the last sample
+        window = list(samples[first:min(last + 2, n)])
+        window.append(window[-1])
+        out = []
+        for k in steps:
+            i, frac = divmod(k, phases)
+            here = window[i - first]
+            out.append(here + (window[i - first + 1] - here) * (frac / phases))
+        return out
+
+    def _filter(self, phase):
+        # the (normalized) low-pass coefficients for input offsets -reach to
+        # reach around a position phase/phases past an input sample
+        taps = []
+        for offset in range(-self.reach, self.reach + 1):
+            u = phase / self.phases - offset
+            if abs(u) >= self.half:
+                taps.append(0.0)
+                continue
+            x = math.pi * self.ratio * u
+            sinc = math.sin(x) / x if x else 1.0
+            window = 0.5 + 0.5 * math.cos(math.pi * u / self.half)
+            taps.append(sinc * window)
+        total = sum(taps)
+        return [t / total for t in taps]
+
+    def _taps(self, phase):
+        taps = self.filters.get(phase)
+        if taps is None:
+            taps = self.filters[phase] = self._filter(phase)
+        return taps
+
+    def _filtered(self, k):
+        i, phase = divmod(k * self.step, self.phases)
+        taps = self._taps(phase)
+        samples, n, reach = self.samples, len(self.samples), self.reach
+        if reach <= i < n - reach:
+            around = samples[i - reach:i + reach + 1]
+        else:
+            # beyond the ends, the first and last samples are repeated
+            around = [samples[min(max(j, 0), n - 1)] for j in range(i - reach, i + reach + 1)]
+        return sum(map(mul, taps, around))
+
+
+    def _filtered_numpy(self, start, stop):
+        # the same sums for the whole span, as one product of arrays
+        samples, n, reach = self.samples, len(self.samples), self.reach
+        index, phase = numpy.divmod(numpy.arange(start, stop) * self.step, self.phases)
+        lo, hi = int(index[0]) - reach, int(index[-1]) + reach + 1
+        around = numpy.array(samples[max(lo, 0):min(hi, n)], dtype=float)
+        around = numpy.pad(around, (max(0, -lo), max(0, hi - n)), mode='edge')
+        phases, which = numpy.unique(phase, return_inverse=True)
+        taps = numpy.array([self._taps(int(p)) for p in phases])
+        windows = around[(index - reach - lo)[:, None] + numpy.arange(2 * reach + 1)]
+        return (windows * taps[which]).sum(axis=1).tolist()
+
+
+def resample(samples, from_rate, to_rate):
+    """
+    Resample a channel from one sampling rate to another (see Resampler),
+    returning a new list of samples.
+    """
+    resampler = Resampler(samples, from_rate, to_rate)
+    return resampler.span(0, len(resampler))
+
+
+# FFT AND CONVOLUTION
+
+def overlap_add(values, impulse, block_size=None):
+    """
+    Convolve the given values (real or complex) with a real impulse response
+    using FFT-based overlap-add, returning a list of complex numbers of length
+    len(values) + len(impulse) - 1.  Each block of block_size input samples
+    costs one forward and one inverse FFT, so long impulse responses stay
+    cheap.
+    """
+    n, m = len(values), len(impulse)
+    if n == 0 or m == 0:
+        return []
+
+    if block_size is None:
+        # blocks as long as the impulse keep the FFT size under 4x the block
+        block_size = max(m, 64)
+    size = next_power_of_two(block_size + m - 1)
+    if numpy is not None:
+        return _overlap_add_numpy(values, impulse, block_size, size)
+    response = fft(list(impulse) + [0] * (size - m))
+
+    out = [0j] * (n + m - 1)
+    for start in range(0, n, block_size):
+        block = values[start:start + block_size]
+        spectrum = fft(list(block) + [0] * (size - len(block)))
+        filtered = fft(list(map(mul, spectrum, response)), inverse=True)
+        stop = min(start + size, len(out))
+        out[start:stop] = map(add, out[start:stop], filtered)
+    return out
+
+
+def _overlap_add_numpy(values, impulse, block_size, size, rows=256):
+    # the same blocks, transformed `rows` at a time as the rows of an array
+    n, m = len(values), len(impulse)
+    values = numpy.asarray(values, dtype=complex)
+    response = numpy.fft.fft(numpy.asarray(impulse, dtype=float), size)
+    out = numpy.zeros(n + size, dtype=complex)
+    for first in range(0, n, rows * block_size):
+        part = values[first:first + rows * block_size]
+        count = -(-len(part) // block_size)
+        blocks = numpy.zeros((count, block_size), dtype=complex)
+        blocks.flat[:len(part)] = part
+        filtered = numpy.fft.ifft(numpy.fft.fft(blocks, size, axis=1) * response, axis=1)
+        for i, row in enumerate(filtered, first // block_size):
+            out[i * block_size:i * block_size + size] += row
+    return out[:n + m - 1].tolist()
+
+
+def convolve(samples, impulse, block_size=None):
+    """
+    Convolve a real channel with a real impulse response, returning a list of
+    floats.
+    """
+    return [v.real for v in overlap_add(samples, impulse, block_size)]
+
+
+def convolve_stereo(left, right, impulse, block_size=None):
+    """
+    Convolve both channels of a sound with the same real impulse response.
+    Both channels go through a single complex convolution (left + j*right),
+    whose real and imaginary parts are the two results.
+    """
+    n = min(len(left), len(right))
+    packed = list(map(complex, left[:n], right[:n]))
+    out = overlap_add(packed, impulse, block_size)
+    return [v.real for v in out], [v.imag for v in out]
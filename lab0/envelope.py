@@ -0,0 +1,197 @@
+"""
+Gain envelopes: per-sample volume curves applied to each channel of a sound.
+
+An Envelope is either a list of breakpoints, (position, gain) pairs with
+positions running from 0 (the first sample) to 1 (the last sample) joined by
+linear, cosine or exponential segments, or an arbitrary curve function of
+the position.  Applying one computes the whole ramp of gains up front and
+multiplies each channel by it in one operation: with NumPy, if it is
+installed, and otherwise with a precomputed `array('d')` of gains and a
+single `map`.
+
+pan in lab.py is the preset PAN_LEFT/PAN_RIGHT pair.
+"""
+
+import math
+from array import array
+from operator import mul
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+from sound import sound_like
+
+
+SHAPES = ('linear', 'cosine', 'exponential')
+
+
+class Envelope:
+    """
+    A piecewise gain envelope.
+
+    Parameters:
+        * points (list of (float, float)): (position, gain) breakpoints,
+                                           sorted by position in [0, 1].
+                                           The gain is held constant before
+                                           the first and after the last one.
+        * shape (str): how gains are interpolated between breakpoints:
+                       'linear', 'cosine' (an S-curve) or 'exponential'
+                       (linear in decibels; segments touching a gain of 0
+                       fall back to linear)
+    """
+    def __init__(self, points, shape='linear'):
+        if not points:
+            raise ValueError('an envelope needs at least one breakpoint')
+        if shape not in SHAPES:
+            raise ValueError('unknown envelope shape: %r' % shape)
+        if any(p1[0] < p0[0] for p0, p1 in zip(points, points[1:])):
+            raise ValueError('envelope breakpoints must be sorted by position')
+        self.points = [(float(t), g) for t, g in points]
+        self.shape = shape
+        self.func = None
+
+    @classmethod
+    def curve(cls, func):
+        """
+        An envelope whose gain at position t (from 0 to 1) is func(t).
+        """
+        env = cls([(0, 1)])
+        env.func = func
+        return env
+
+    def _segments(self, total, start, stop):
+        # yield (first, last, p0, g0, p1, g1) for the samples in
+        # [first, last) that lie between breakpoints at sample positions p0
+        # and p1; p1 is None for the constant parts at either end
+        positions = [(t * (total - 1), g) for t, g in self.points]
+        first_pos, first_gain = positions[0]
+        edge = min(max(start, math.ceil(first_pos)), stop)
+        if edge > start:
+            yield start, edge, None, first_gain, None, None
+        for (p0, g0), (p1, g1) in zip(positions, positions[1:]):
+            a = min(max(start, math.ceil(p0)), stop)
+            b = min(max(start, math.ceil(p1)), stop)
+            if a < b and p1 > p0:
+                yield a, b, p0, g0, p1, g1
+        last_pos, last_gain = positions[-1]
+        edge = min(max(start, math.ceil(last_pos)), stop)
+        if edge < stop:
+            yield edge, stop, None, last_gain, None, None
+
+    def _shaped(self, g0, g1, t, m):
+        # interpolate between gains g0 and g1 at fraction(s) t, using the
+        # math module m (math or numpy)
+        if self.shape == 'cosine':
+            return g0 + (g1 - g0) * ((1 - m.cos(math.pi * t)) / 2)
+        if self.shape == 'exponential' and g0 > 0 and g1 > 0:
+            return g0 * (g1 / g0) ** t
+        return g0 + (g1 - g0) * t
+
+    def _gains_numpy(self, total, offset, count):
+        if self.func is not None:
+            t = numpy.arange(offset, offset + count, dtype=float) / max(total - 1, 1)
+            return numpy.fromiter(map(self.func, t.tolist()), dtype=float, count=count)
+        out = numpy.empty(count)
+        for a, b, p0, g0, p1, g1 in self._segments(total, offset, offset + count):
+            if p1 is None:
+                out[a - offset:b - offset] = g0
+            else:
+                t = (numpy.arange(a, b, dtype=float) - p0) / (p1 - p0)
+                out[a - offset:b - offset] = self._shaped(g0, g1, t, numpy)
+        return out
+
+    def _gains_python(self, total, offset, count):
+        if self.func is not None:
+            scale = max(total - 1, 1)
+            return array('d', (self.func(i / scale) for i in range(offset, offset + count)))
+        out = array('d')
+        for a, b, p0, g0, p1, g1 in self._segments(total, offset, offset + count):
+            if p1 is None:
+                out.extend(array('d', [g0]) * (b - a))
+            elif self.shape == 'linear':
+                dg, span = g1 - g0, p1 - p0
+                out.extend(g0 + dg * ((i - p0) / span) for i in range(a, b))
+            else:
+                out.extend(self._shaped(g0, g1, (i - p0) / (p1 - p0), math) for i in range(a, b))
+        return out
+
+    def gains(self, total, offset=0, count=None):
+        """
+        Return the gains (as an `array('d')`) of samples offset through
+        offset+count-1 of a sound that is `total` samples long.  count
+        defaults to the rest of the sound.
+        """
+        if count is None:
+            count = total - offset
+        if numpy is not None:
+            out = array('d')
+            out.frombytes(self._gains_numpy(total, offset, count).tobytes())
+            return out
+        return self._gains_python(total, offset, count)
+
+
+def _scaled(samples, envelope, total, offset):
+    # multiply one channel by its envelope, returning a new array('d')
+    count = len(samples)
+    if envelope is None:
+        return array('d', samples)
+    if numpy is not None:
+        if isinstance(samples, array) and samples.typecode == 'd':
+            values = numpy.frombuffer(samples, dtype=float)
+        else:
+            values = numpy.fromiter(samples, dtype=float, count=count)
+        out = array('d')
+        out.frombytes((values * envelope._gains_numpy(total, offset, count)).tobytes())
+        return out
+    return array('d', map(mul, samples, envelope._gains_python(total, offset, count)))
+
+
+def apply_envelope(sound, left, right=None, offset=0, total=None):
+    """
+    Create a new sound with each channel of the given sound scaled by an
+    envelope.
+    Parameters:
+        * sound (dict or Sound): the original sound
+        * left (Envelope): envelope for the left channel (None to leave it
+                           unchanged)
+        * right (Envelope): envelope for the right channel; defaults to the
+                            left one
+        * offset (int): position of the sound's first sample within the
+                        whole sound the envelope spans, when `sound` is one
+                        block of it
+        * total (int): number of samples in the whole sound the envelope
+                       spans; defaults to the length of `sound`
+    Returns:
+        a new sound (of the same representation as the original).
+    """
+    if right is None:
+        right = left
+    if total is None:
+        total = len(sound['left'])
+    return sound_like(sound, sound['rate'],
+                      _scaled(sound['left'], left, total, offset),
+                      _scaled(sound['right'], right, total, offset))
+
+
+# PRESETS
+
+# the left channel fades out while the right channel fades in
+PAN_LEFT = Envelope([(0, 1), (1, 0)])
+PAN_RIGHT = Envelope([(0, 0), (1, 1)])
+
+
+def fade(fade_in=0, fade_out=0, shape='cosine'):
+    """
+    Return an envelope fading in over the first `fade_in` and out over the
+    last `fade_out` of a sound (both fractions of its length).
+    """
+    points = []
+    if fade_in > 0:
+        points.append((0, 0))
+    points.append((fade_in, 1))
+    points.append((1 - fade_out, 1))
+    if fade_out > 0:
+        points.append((1, 0))
+    return Envelope(points, shape)
@@ -1,200 +1,252 @@
-# No Imports Allowed!
+from array import array
+from operator import add, mul, sub
+from itertools import repeat
+
+from sound import Sound, as_sound, as_dict, sound_like
+from dsp import echo_channel, convolve_stereo, Resampler
+from envelope import apply_envelope, PAN_LEFT, PAN_RIGHT
+
+# mix_tracks fills its output this many samples at a time
+MIX_BLOCK = 4096
+
 
 def backwards(sound):
     """
     Create a reversed version of a sound. 
     Parameters: 
-        * sound(dict): the original sound.
+        * sound(dict or Sound): the original sound.
     Returns: 
-        a new sound that is the reversed version of the original. 
+        a new sound (of the same representation) that is the reversed version of the original. 
     """
-    # create reversed left and right sound tracks  
-    left_backwards = sound['left'][::-1]
-    right_backwards = sound['right'][::-1]
-
-    backwards = {
-        'rate': sound['rate'], 
-        'left': left_backwards,
-        'right': right_backwards,
-    } 
-    return backwards
+    # slicing reverses lists and arrays alike, without touching each sample in Python
+    return sound_like(sound, sound['rate'], sound['left'][::-1], sound['right'][::-1])
 
 
 def mix(sound1, sound2, p):
     """
     Mix together two sounds with the same sampling rates. 
     Parameter:
-        * sound 1, sound 2(dict): sounds represented by dictionaries
+        * sound 1, sound 2(dict or Sound): sounds to be mixed
         * p (float): mixing parameter; 0 <= p <= 1; 
                     sound1's samples are scaled by p;
                     sound2's samples are scaled by 1-p;
     Returns:
         If two sounds have different sampling rates, return None.
-        Otherwise, return a new sound that is the mixed version of two sounds.
+        Otherwise, return a new sound (of the same representation as sound1)
+        that is the mixed version of two sounds.
     """
     if sound1['rate'] != sound2['rate']:
         return None
-    
+    return mix_tracks([sound1, sound2], [p, 1-p])
+
+
+def mix_tracks(tracks, gains=None, rate=None):
+    """
+    Mix together any number of sounds, resampling the ones whose sampling
+    rate differs from the output's.
+    Parameters:
+        * tracks (list of dict or Sound): the sounds to be mixed
+        * gains (list of float): the amount by which each track's samples
+                                 should be scaled, one per track; defaults to
+                                 1/len(tracks) for every track
+        * rate (int): the sampling rate of the output; defaults to the
+                      sampling rate of the first track
+    Returns:
+        a new sound (of the same representation as the first track), as long
+        as the shortest (resampled) track.
+    """
+    if not tracks:
+        raise ValueError('there must be at least one track to mix')
+    if gains is None:
+        gains = [1/len(tracks)] * len(tracks)
+    elif len(gains) != len(tracks):
+        raise ValueError('there must be exactly one gain per track')
+    if rate is None:
+        rate = tracks[0]['rate']
+
+    # every track at the output rate, resampled as its samples are needed
+    channels = [(Resampler(track['left'], track['rate'], rate),
+                 Resampler(track['right'], track['rate'], rate)) for track in tracks]
+
     # the output length is the minimum of the lengths of input sounds
-    output_length = min(len(sound1['left']), len(sound2['left']))
-    
-    # scale sound1 samples by a factor of p
-    # scale sould2 samples by a factor of (p-1)
-    left_sound1, left_sound2, right_sound1, right_sound2 = [], [], [], []
-    for i in range(output_length):
-        left_sound1.append (sound1['left'][i] * p)
-        right_sound1.append (sound1['right'][i] * p)
-        left_sound2.append (sound2['left'][i] * (1-p))
-        right_sound2.append (sound2['right'][i] * (1-p))
- 
-    left_mix, right_mix = [], []
-    for i in range(0, output_length): 
-        left_mix.append(left_sound1[i] + left_sound2[i])
-        right_mix.append(right_sound1[i] + right_sound2[i])
-
-    mix = {
-        'rate': sound1['rate'], 
-        'left': left_mix,
-        'right': right_mix,
-    }
-    return mix
-
-
-def echo(sound, num_echos, delay, scale):
+    output_length = min(min(len(left), len(right)) for left, right in channels)
+
+    # a single pass over one preallocated output buffer, MIX_BLOCK samples
+    # at a time, adding in every track's gained samples while that part of
+    # the buffer is at hand
+    left_mix = array('d', bytes(8 * output_length))
+    right_mix = array('d', bytes(8 * output_length))
+    for start in range(0, output_length, MIX_BLOCK):
+        stop = min(start + MIX_BLOCK, output_length)
+        left_part, right_part = left_mix[start:stop], right_mix[start:stop]
+        for (left, right), gain in zip(channels, gains):
+            left_part = array('d', map(add, left_part, map(mul, left.span(start, stop), repeat(gain))))
+            right_part = array('d', map(add, right_part, map(mul, right.span(start, stop), repeat(gain))))
+        left_mix[start:stop] = left_part
+        right_mix[start:stop] = right_part
+
+    return sound_like(tracks[0], rate, left_mix, right_mix)
+
+
+def echo(sound, num_echos, delay, scale, method='taps'):
     """
     Create a new sound with a echo effect for a given sound. 
     Parameters:
-        * sound (dict): a dictionary representing the original sound
+        * sound (dict or Sound): the original sound
         * num_echos (int): the number of additional copies of the sound to add
         * delay (float): the amount (in seconds) by which each "echo" should be delayed
         * scale (float): the amount by which each echo's samples should be scaled
+        * method (str): the echo engine to use (see dsp.echo_channel);
+                        'taps' gives exactly the original result, 'feedback'
+                        runs in a single O(N) pass but only agrees with it
+                        up to floating-point rounding
     Returns:
-        a new sound with the echo effect upoon the original version.
+        a new sound (of the same representation) with the echo effect upoon the original version.
     """
 
     # the number of samples each 'echo' should be delayed by
     sample_delay = round(delay * sound['rate'])
 
-    # initialize the output with the final length after delay, prevent running out of indices 
-    left_echo = sound['left'] + [0] * num_echos * sample_delay  
-    right_echo = sound['right'] + [0] * num_echos * sample_delay
+    left_echo = echo_channel(sound['left'], num_echos, sample_delay, scale, method)
+    right_echo = echo_channel(sound['right'], num_echos, sample_delay, scale, method)
 
-    for i in range(1, num_echos + 1):
-        for sample_index in range(len(sound['left'])):
-            # each new copy is scaled down more than the one preceding it
-            # add in a delayed and scaled-down copy of the sound's samples
-            left_echo[sample_index + i * sample_delay] += sound['left'][sample_index] * scale ** i
-            right_echo[sample_index + i * sample_delay] += sound['right'][sample_index] * scale ** i
+    return sound_like(sound, sound['rate'], left_echo, right_echo)
 
-    echo = {
-        'rate': sound['rate'], 
-        'left': left_echo,
-        'right': right_echo,
-    }
-    return echo
 
+def reverb(sound, impulse):
+    """
+    Create a new sound by convolving a given sound with an impulse response
+    (for example, a recording of a room), using FFT-based overlap-add.
+    Parameters:
+        * sound (dict or Sound): the original sound
+        * impulse (list of float): the impulse response, at the sound's sampling rate
+    Returns:
+        a new sound (of the same representation), len(impulse) - 1 samples longer
+        than the original.
+    """
+    left, right = convolve_stereo(sound['left'], sound['right'], impulse)
+    return sound_like(sound, sound['rate'], left, right)
 
-def pan(sound):
+
+def pan(sound, offset=0, total=None):
     """
     Create a new sound with a spatial effect for a stereo sound.
     Parameters:
-        * sound (dict): a dictionary representing the original sound
+        * sound (dict or Sound): the original sound
+        * offset (int): position of the sound's first sample within the whole
+                        sound being panned, when `sound` is one block of it
+        * total (int): number of samples in the whole sound being panned;
+                       defaults to the length of `sound`
     Returns: 
-        a new sound with the spatial effect upon the original sound
+        a new sound (of the same representation) with the spatial effect upon the original sound
         the volume in the left and right channels of the original sound is adjusted separately, 
         so that the left channel starts out at full volume and ends at 0 volume (and vice versa for the right channel).
     """
-
-    left_pan, right_pan = [], []
-    N = len(sound['left']) # the number of samples of sound
-    for i in range(N):
-        # append scaled sample to new sound tracks 
-        left_pan.append (sound['left'][i] * (1 - ((i)/(N - 1))))
-        right_pan.append (sound['right'][i] * ((i)/(N - 1)))
-
-    pan = {
-        'rate': sound['rate'], 
-        'left': left_pan,
-        'right': right_pan,
-    }
-    return pan
+    # the left channel ramps linearly from 1 to 0 and the right from 0 to 1
+    return apply_envelope(sound, PAN_LEFT, PAN_RIGHT, offset, total)
 
 
 def remove_vocals(sound):
     """
     Creates a new sound wih vocals in the given sound removed. 
     Parameters:
-        * sound (dict): a dictionary representing the original sound
+        * sound (dict or Sound): the original sound
     Returns: 
-        a new sound with the orginal sound's vocals removed. 
-    """
-    # create a list to store (left - right) of each sample pair
-    diff = []
-    sample_length = len(sound['left'])
-    for i in range(sample_length):
-        diff.append(sound['left'][i]-sound['right'][i])
-    
-    # compute the output sound 
-    remove_vocals = {
-        'rate': sound['rate'], 
-        'left': diff,
-        'right': diff,
-    }
-    return remove_vocals
+        a new sound (of the same representation) with the orginal sound's vocals removed. 
+    """
+    # (left - right) of each sample pair, shared by both output channels
+    diff = map(sub, sound['left'], sound['right'])
+    return sound_like(sound, sound['rate'], diff, diff)
 
-# below are helper functions for converting back-and-forth between WAV files
-# and our internal dictionary representation for sounds
+# below are versions of the effects that run on a stream of blocks (for
+# example, from wavio.read_blocks), so that sounds of any length can be
+# processed in constant memory
+
+def aligned_blocks(blocks1, blocks2):
+    """
+    Given two streams of sounds, yield pairs of equal-length blocks covering
+    both streams until the shorter one runs out.
+    """
+    blocks1, blocks2 = iter(blocks1), iter(blocks2)
+    b1 = b2 = None
+    while True:
+        if b1 is None or not len(b1['left']):
+            b1 = next(blocks1, None)
+        if b2 is None or not len(b2['left']):
+            b2 = next(blocks2, None)
+        if b1 is None or b2 is None:
+            return
+        n = min(len(b1['left']), len(b2['left']))
+        if n == 0:
+            continue
+        yield (sound_like(b1, b1['rate'], b1['left'][:n], b1['right'][:n]),
+               sound_like(b2, b2['rate'], b2['left'][:n], b2['right'][:n]))
+        b1 = sound_like(b1, b1['rate'], b1['left'][n:], b1['right'][n:])
+        b2 = sound_like(b2, b2['rate'], b2['left'][n:], b2['right'][n:])
 
-import io
-import wave
-import struct
 
-def load_wav(filename):
+def mix_blocks(blocks1, blocks2, p):
     """
-    Given the filename of a WAV file, load the data from that file and return a
-    Python dictionary representing that sound
+    Mix two streams of sounds block by block; see `mix`.
+    """
+    for b1, b2 in aligned_blocks(blocks1, blocks2):
+        mixed = mix(b1, b2, p)
+        if mixed is None:
+            raise ValueError('cannot mix sounds with different sampling rates')
+        yield mixed
+
+
+def pan_blocks(blocks, total):
+    """
+    Pan a stream of sounds that is `total` samples long, block by block; see
+    `pan`.
     """
-    f = wave.open(filename, 'r')
-    chan, bd, sr, count, _, _ = f.getparams()
+    offset = 0
+    for block in blocks:
+        yield pan(block, offset, total)
+        offset += len(block['left'])
 
-    assert bd == 2, "only 16-bit WAV files are supported"
 
-    left = []
-    right = []
-    for i in range(count):
-        frame = f.readframes(1)
-        if chan == 2:
-            left.append(struct.unpack('<h', frame[:2])[0])
-            right.append(struct.unpack('<h', frame[2:])[0])
-        else:
-            datum = struct.unpack('<h', frame)[0]
-            left.append(datum)
-            right.append(datum)
+def remove_vocals_blocks(blocks):
+    """
+    Remove the vocals from a stream of sounds, block by block; see
+    `remove_vocals`.
+    """
+    for block in blocks:
+        yield remove_vocals(block)
 
-    left = [i/(2**15) for i in left]
-    right = [i/(2**15) for i in right]
 
-    return {'rate': sr, 'left': left, 'right': right}
+# below are helper functions for converting back-and-forth between WAV files
+# and our internal representations for sounds
+
+from wavio import BLOCK_SIZE, read_blocks, read_sound, write_blocks, WavWriter, WavMap
+from pipeline import Pipeline
+
+def load_wav(filename, compact=False):
+    """
+    Given the filename of a WAV file, load the data from that file and return a
+    Python dictionary representing that sound.  If compact is True, return an
+    array-backed Sound instead.
+    """
+    sound = read_sound(filename)
+    if compact:
+        return sound
+    return sound.to_dict()
 
 
 def write_wav(sound, filename):
     """
-    Given a dictionary representing a sound, and a filename, convert the given
+    Given a sound (a dictionary or a Sound), and a filename, convert the given
     sound into WAV format and save it as a file with the given filename (which
     can then be opened by most audio players)
     """
-    outfile = wave.open(filename, 'w')
-    outfile.setparams((2, 2, sound['rate'], 0, 'NONE', 'not compressed'))
-
-    out = []
-    for l, r in zip(sound['left'], sound['right']):
-        l = int(max(-1, min(1, l)) * (2**15-1))
-        r = int(max(-1, min(1, r)) * (2**15-1))
-        out.append(l)
-        out.append(r)
-
-    outfile.writeframes(b''.join(struct.pack('<h', frame) for frame in out))
-    outfile.close()
+    with WavWriter(filename, sound['rate']) as out:
+        for start in range(0, len(sound['left']), BLOCK_SIZE):
+            out.write({
+                'rate': sound['rate'],
+                'left': sound['left'][start:start + BLOCK_SIZE],
+                'right': sound['right'][start:start + BLOCK_SIZE],
+            })
 
 
 if __name__ == '__main__':
@@ -203,17 +255,15 @@ if __name__ == '__main__':
     # code for generating and saving sounds, or any other code you write for
     # testing, etc.
 
-    # loading file 
-    mystery = load_wav('sounds/mystery.wav')
-    chord = load_wav('sounds/chord.wav')
-    synth = load_wav('sounds/synth.wav')
-    water = load_wav('sounds/water.wav')
-    car = load_wav('sounds/car.wav')
-    coffee = load_wav('sounds/coffee.wav')
-    
-    # writing file 
-    write_wav(backwards(mystery), 'mystery_reversed.wav')
-    write_wav (mix(synth, water, 0.2), 'synth_water_mixed.wav')
-    write_wav(echo(chord, 5, 0.3, 0.6), 'chord_echo.wav')
-    write_wav(pan(car), 'car_pan.wav')
-    write_wav(remove_vocals(coffee), 'coffee_remove_vocals.wav')
+    # each job reads its input files, applies an effect chain and writes the
+    # result; see render.py for the format and for rendering from a manifest
+    from render import render_jobs, report
+
+    jobs = [
+        {'inputs': ['sounds/mystery.wav'], 'chain': [['backwards']], 'output': 'mystery_reversed.wav'},
+        {'inputs': ['sounds/synth.wav', 'sounds/water.wav'], 'chain': [['mix', 1, 0.2]], 'output': 'synth_water_mixed.wav'},
+        {'inputs': ['sounds/chord.wav'], 'chain': [['echo', 5, 0.3, 0.6]], 'output': 'chord_echo.wav'},
+        {'inputs': ['sounds/car.wav'], 'chain': [['pan']], 'output': 'car_pan.wav'},
+        {'inputs': ['sounds/coffee.wav'], 'chain': [['remove_vocals']], 'output': 'coffee_remove_vocals.wav'},
+    ]
+    report(render_jobs(jobs))
@@ -0,0 +1,340 @@
+"""
+Lazy, composable chains of lab0 effects.
+
+Writing `write_wav(echo(pan(mix(a, b, p)), ...), filename)` builds a full
+intermediate sound after every effect.  A Pipeline instead records the
+chain and runs it block by block when its output is requested:
+
+    (Pipeline.from_wav('a.wav')
+        .mix(Pipeline.from_wav('b.wav'), 0.2)
+        .pan()
+        .echo(5, 0.3, 0.6)
+        .write_wav('out.wav'))
+
+Consecutive per-sample effects (mix, pan, remove_vocals) are fused: each
+block flows through all of them as one chain of lazy iterators and is only
+materialized once, at the end of the run.  Effects that need to look back
+(echo, with its delay lines) or at the whole sound (backwards) keep their own
+state between blocks.  Every method returns a new Pipeline, so partial
+chains can be shared.
+"""
+
+from array import array
+from itertools import repeat, tee
+from operator import add, mul, sub
+
+from sound import Sound, as_sound, as_dict
+from dsp import EchoLine
+from envelope import PAN_LEFT, PAN_RIGHT
+from wavio import BLOCK_SIZE, read_blocks, read_blocks_reversed, wav_params, write_blocks
+
+
+# SOURCES
+
+class _SoundSource:
+    """
+    An in-memory sound, read in slices.
+    """
+    def __init__(self, sound):
+        self.sound = as_sound(sound)
+        self.rate = self.sound.rate
+        self.length = min(len(self.sound.left), len(self.sound.right))
+
+    def blocks(self, block_size):
+        left, right = self.sound.left, self.sound.right
+        for start in range(0, self.length, block_size):
+            yield left[start:start + block_size], right[start:start + block_size]
+
+    def reversed_blocks(self, block_size):
+        left, right = self.sound.left, self.sound.right
+        for stop in range(self.length, 0, -block_size):
+            start = max(0, stop - block_size)
+            yield left[start:stop][::-1], right[start:stop][::-1]
+
+
+class _WavSource:
+    """
+    A WAV file, read (forwards or backwards) through wavio.
+    """
+    def __init__(self, filename):
+        self.filename = filename
+        self.rate, self.length = wav_params(filename)
+
+    def blocks(self, block_size):
+        for block in read_blocks(self.filename, block_size):
+            yield block.left, block.right
+
+    def reversed_blocks(self, block_size):
+        for block in read_blocks_reversed(self.filename, block_size):
+            yield block.left, block.right
+
+
+class _StreamSource:
+    """
+    A one-shot stream of sounds (for example, the output of another block
+    generator), whose total length may not be known.
+    """
+    def __init__(self, blocks, rate, length):
+        self.stream = iter(blocks)
+        self.rate = rate
+        self.length = length
+
+    def blocks(self, block_size):
+        for block in self.stream:
+            yield block['left'], block['right']
+
+    reversed_blocks = None
+
+
+class _Reader:
+    """
+    Read a pipeline's output a requested number of samples at a time, for
+    aligning it with the blocks of another pipeline.
+    """
+    def __init__(self, blocks):
+        self.blocks = blocks
+        self.left, self.right = array('d'), array('d')
+
+    def read(self, n):
+        while len(self.left) < n:
+            block = next(self.blocks, None)
+            if block is None:
+                break
+            self.left.extend(block.left)
+            self.right.extend(block.right)
+        left, right = self.left[:n], self.right[:n]
+        del self.left[:n], self.right[:n]
+        return left, right
+
+
+# STAGES
+#
+# A per-sample stage provides start(), which returns a function
+# step(left, right, offset, n) -> (left, right, n) transforming one block of
+# n samples starting at position `offset` lazily; `n` shrinks if the stage
+# runs out of input.  A stateful stage provides run(blocks), a generator
+# from (left, right) blocks to (left, right) blocks.
+
+class _Mix:
+    stateful = False
+
+    def __init__(self, other, p):
+        self.other, self.p = other, p
+
+    def length(self, n):
+        if n is None or self.other.length is None:
+            return None
+        return min(n, self.other.length)
+
+    def start(self):
+        reader = _Reader(self.other.blocks())
+        p = self.p
+        def step(left, right, offset, n):
+            other_left, other_right = reader.read(n)
+            n = len(other_left)
+            left = map(add, map(mul, left, repeat(p, n)), map(mul, other_left, repeat(1-p)))
+            right = map(add, map(mul, right, repeat(p, n)), map(mul, other_right, repeat(1-p)))
+            return left, right, n
+        return step
+
+
+class _Pan:
+    stateful = False
+
+    def __init__(self, total):
+        self.total = total
+
+    def length(self, n):
+        return n
+
+    def start(self):
+        N = self.total
+        def step(left, right, offset, n):
+            left = map(mul, left, PAN_LEFT.gains(N, offset, n))
+            right = map(mul, right, PAN_RIGHT.gains(N, offset, n))
+            return left, right, n
+        return step
+
+
+class _RemoveVocals:
+    stateful = False
+
+    def length(self, n):
+        return n
+
+    def start(self):
+        def step(left, right, offset, n):
+            left, right = tee(map(sub, left, right))
+            return left, right, n
+        return step
+
+
+class _Echo:
+    stateful = True
+
+    def __init__(self, num_echos, sample_delay, scale, feedback=False):
+        self.args = (num_echos, sample_delay, scale, feedback)
+
+    def length(self, n):
+        num_echos, sample_delay = self.args[:2]
+        return None if n is None else n + max(num_echos, 0) * sample_delay
+
+    def run(self, blocks):
+        left_line, right_line = EchoLine(*self.args), EchoLine(*self.args)
+        for left, right in blocks:
+            yield left_line.process(left), right_line.process(right)
+        left, right = left_line.flush(), right_line.flush()
+        for start in range(0, len(left), BLOCK_SIZE):
+            yield left[start:start + BLOCK_SIZE], right[start:start + BLOCK_SIZE]
+
+
+class _Backwards:
+    stateful = True
+
+    def length(self, n):
+        return n
+
+    def run(self, blocks):
+        # nothing can be output until the last sample is known, so buffer
+        # the (compact) upstream output
+        left, right = array('d'), array('d')
+        for block_left, block_right in blocks:
+            left.extend(block_left)
+            right.extend(block_right)
+        yield from _SoundSource(Sound(0, left, right)).reversed_blocks(BLOCK_SIZE)
+
+
+def _fused(blocks, stages):
+    """
+    Run a block stream through a run of per-sample stages, materializing each
+    block once, after the last of them.
+    """
+    steps = [stage.start() for stage in stages]
+    offset = 0
+    for left, right in blocks:
+        n = full = min(len(left), len(right))
+        for step in steps:
+            left, right, n = step(left, right, offset, n)
+        yield array('d', left), array('d', right)
+        if n < full:
+            return
+        offset += n
+
+
+# PIPELINE
+
+class Pipeline:
+    """
+    A lazily evaluated chain of effects applied to a source sound.
+
+    Parameters:
+        * sound (dict or Sound): the source sound; see also from_wav and
+                                 from_blocks
+    """
+    def __init__(self, sound=None, _source=None, _stages=()):
+        self.source = _SoundSource(sound) if _source is None else _source
+        self.stages = tuple(_stages)
+        self.rate = self.source.rate
+        self.length = self.source.length
+        for stage in self.stages:
+            self.length = stage.length(self.length)
+
+    @classmethod
+    def from_wav(cls, filename):
+        """
+        A pipeline reading its source from the given WAV file.
+        """
+        return cls(_source=_WavSource(filename))
+
+    @classmethod
+    def from_blocks(cls, blocks, rate, length=None):
+        """
+        A pipeline reading its source from an iterable of sounds at the given
+        sampling rate (for example, wavio.read_blocks).  The total length is
+        only needed for pan.  The blocks can only be consumed once.
+        """
+        return cls(_source=_StreamSource(blocks, rate, length))
+
+    def _then(self, stage):
+        return Pipeline(_source=self.source, _stages=self.stages + (stage,))
+
+    # effects
+
+    def backwards(self):
+        return self._then(_Backwards())
+
+    def mix(self, other, p):
+        """
+        Mix with another pipeline (or sound); see lab.mix.  Unlike lab.mix,
+        sounds with different sampling rates raise a ValueError.
+        """
+        if not isinstance(other, Pipeline):
+            other = Pipeline(other)
+        if other.rate != self.rate:
+            raise ValueError('cannot mix sounds with different sampling rates')
+        return self._then(_Mix(other, p))
+
+    def echo(self, num_echos, delay, scale, method='taps'):
+        """
+        Echo the sound; see lab.echo.  Only the streaming methods, 'taps' and
+        'feedback', are available: 'fft' convolves the whole sound at once,
+        so it raises a ValueError, as any other method does.
+        """
+        if method not in ('taps', 'feedback'):
+            raise ValueError('unknown echo method for a pipeline: %r' % method)
+        feedback = method == 'feedback'
+        return self._then(_Echo(num_echos, round(delay * self.rate), scale, feedback))
+
+    def pan(self):
+        if self.length is None:
+            raise ValueError('pan needs to know the length of the sound')
+        return self._then(_Pan(self.length))
+
+    def remove_vocals(self):
+        return self._then(_RemoveVocals())
+
+    # output
+
+    def blocks(self, block_size=BLOCK_SIZE):
+        """
+        Run the chain, yielding its output as a sequence of Sounds.
+        """
+        stages = self.stages
+        if stages and isinstance(stages[0], _Backwards) and self.source.reversed_blocks:
+            # the source can be read backwards directly, without buffering it
+            stream = self.source.reversed_blocks(block_size)
+            stages = stages[1:]
+        else:
+            stream = self.source.blocks(block_size)
+
+        run = []
+        for stage in stages:
+            if stage.stateful:
+                if run:
+                    stream = _fused(stream, run)
+                    run = []
+                stream = stage.run(stream)
+            else:
+                run.append(stage)
+        if run:
+            stream = _fused(stream, run)
+
+        for left, right in stream:
+            yield Sound(self.rate, left, right)
+
+    def render(self, compact=True):
+        """
+        Run the chain and return its whole output, as a Sound (or, if compact
+        is False, as a dictionary).
+        """
+        out = Sound(self.rate, [], [])
+        for block in self.blocks():
+            out.left.extend(block.left)
+            out.right.extend(block.right)
+        return out if compact else as_dict(out)
+
+    def write_wav(self, filename):
+        """
+        Run the chain, writing its output to the given WAV file block by block.
+        """
+        write_blocks(self.blocks(), filename, self.rate)
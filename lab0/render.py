@@ -0,0 +1,231 @@
+"""
+Render many effect chains in parallel.
+
+A job is a dictionary describing one output file:
+
+    {
+        "inputs": ["sounds/synth.wav", "sounds/water.wav"],
+        "chain": [["mix", 1, 0.2], ["pan"], ["echo", 5, 0.3, 0.6]],
+        "output": "synth_water.wav"
+    }
+
+The chain is applied to the first input, in order.  Each step is an effect
+name followed by its arguments, as for the functions in lab.py, except that
+"mix" takes the index of another input instead of a sound.  Jobs are run by
+a pool of worker processes, each building a pipeline.Pipeline and streaming
+it to its output file.  A job that is malformed, or that fails while
+rendering, is reported as failed without stopping the others.
+
+Inputs are normally WAV filenames, which the workers open themselves.  An
+input may also be an in-memory sound; its samples are copied once into
+shared memory, and the workers read them from there rather than receiving
+them pickled.
+
+From the command line, given a JSON manifest holding a list of jobs:
+
+    python3 render.py manifest.json [-j PROCESSES]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+from array import array
+from multiprocessing import Pool, shared_memory
+
+from sound import Sound, as_sound
+from pipeline import Pipeline
+from wavio import write_blocks
+
+
+# effect name -> number of arguments it takes
+EFFECTS = {
+    'backwards': 0,
+    'echo': 3,
+    'mix': 2,
+    'pan': 0,
+    'remove_vocals': 0,
+}
+
+
+def check_job(job):
+    """
+    Raise a ValueError if the given job is not well formed.
+    """
+    if not isinstance(job, dict):
+        raise ValueError('a job must be a dictionary, not %r' % (job,))
+    if not job.get('inputs'):
+        raise ValueError('job %r has no inputs' % job.get('output'))
+    if 'output' not in job:
+        raise ValueError('job has no output')
+    chain = job.get('chain', [])
+    if not isinstance(chain, list):
+        raise ValueError('the chain must be a list of steps, not %r' % (chain,))
+    for step in chain:
+        if not isinstance(step, (list, tuple)) or not step or not isinstance(step[0], str):
+            raise ValueError('each step must be an effect name and its arguments, not %r' % (step,))
+        name, args = step[0], step[1:]
+        if name not in EFFECTS:
+            raise ValueError('unknown effect: %r' % name)
+        if len(args) != EFFECTS[name]:
+            raise ValueError('%s takes %d arguments, not %d' % (name, EFFECTS[name], len(args)))
+        if name == 'mix' and not (type(args[0]) is int and 0 <= args[0] < len(job['inputs'])):
+            raise ValueError('mix refers to missing input %r' % args[0])
+
+
+def build_pipeline(job, sources):
+    """
+    Build the Pipeline for a job, given its inputs as Pipelines.
+    """
+    chain = sources[0]
+    for name, *args in job.get('chain', []):
+        if name == 'mix':
+            index, p = args
+            chain = chain.mix(sources[index], p)
+        else:
+            chain = getattr(chain, name)(*args)
+    return chain
+
+
+# SHARED BUFFERS
+
+def share_sound(sound):
+    """
+    Copy the samples of an in-memory sound into a new shared memory block.
+    Returns the block and a picklable handle for attach_sound.
+    """
+    sound = as_sound(sound)
+    n = min(len(sound.left), len(sound.right))
+    block = shared_memory.SharedMemory(create=True, size=max(1, 16 * n))
+    block.buf[:8 * n] = memoryview(sound.left[:n]).cast('B')
+    block.buf[8 * n:16 * n] = memoryview(sound.right[:n]).cast('B')
+    return block, ('shared', block.name, sound.rate, n)
+
+
+def attach_sound(handle):
+    """
+    Read a sound shared by share_sound, in a worker process.
+    """
+    _, name, rate, n = handle
+    block = shared_memory.SharedMemory(name=name)
+    try:
+        left, right = array('d'), array('d')
+        left.frombytes(block.buf[:8 * n])
+        right.frombytes(block.buf[8 * n:16 * n])
+    finally:
+        block.close()
+    return Sound(rate, left, right)
+
+
+def _source(spec):
+    if isinstance(spec, tuple) and spec[0] == 'shared':
+        return Pipeline(attach_sound(spec))
+    return Pipeline.from_wav(spec)
+
+
+def run_job(job):
+    """
+    Render one job, returning (output filename, seconds taken, number of
+    samples written, error), where error is None, or a message saying why the
+    job failed (in which case any partly written output is removed).
+    """
+    start = time.perf_counter()
+    samples = 0
+    def counted(blocks):
+        nonlocal samples
+        for block in blocks:
+            samples += len(block.left)
+            yield block
+
+    writing = False
+    try:
+        chain = build_pipeline(job, [_source(spec) for spec in job['inputs']])
+        writing = True
+        write_blocks(counted(chain.blocks()), job['output'], chain.rate)
+    except Exception as e:
+        if writing and os.path.exists(job['output']):
+            os.remove(job['output'])
+        return job['output'], time.perf_counter() - start, samples, '%s: %s' % (type(e).__name__, e)
+    return job['output'], time.perf_counter() - start, samples, None
+
+
+def render_jobs(jobs, processes=None):
+    """
+    Render every job in the given list on a pool of `processes` worker
+    processes (by default, one per core).  Returns a list of (output
+    filename, seconds, samples, error) tuples (see run_job), in the order of
+    the jobs; malformed jobs are not run, and fail with the reason.
+    """
+    results = [None] * len(jobs)
+    for i, job in enumerate(jobs):
+        try:
+            check_job(job)
+        except ValueError as e:
+            output = job.get('output') if isinstance(job, dict) else None
+            results[i] = (output, 0.0, 0, 'ValueError: %s' % e)
+
+    shared = []
+    try:
+        specs = []
+        for job, result in zip(jobs, results):
+            if result is not None:
+                continue
+            inputs = []
+            for inp in job['inputs']:
+                if isinstance(inp, str):
+                    inputs.append(inp)
+                else:
+                    block, handle = share_sound(inp)
+                    shared.append(block)
+                    inputs.append(handle)
+            specs.append(dict(job, inputs=inputs))
+
+        if processes == 1 or not specs:
+            rendered = [run_job(spec) for spec in specs]
+        else:
+            with Pool(processes) as pool:
+                rendered = pool.map(run_job, specs, chunksize=1)
+    finally:
+        for block in shared:
+            block.close()
+            block.unlink()
+
+    rendered = iter(rendered)
+    return [result if result is not None else next(rendered) for result in results]
+
+
+def report(results, out=sys.stdout):
+    """
+    Print the time taken by each rendered job, and why each failed job
+    failed.
+    """
+    for output, seconds, samples, error in results:
+        if error is not None:
+            print('%-40s FAILED: %s' % (output, error), file=out)
+            continue
+        rate = samples / seconds if seconds else float('inf')
+        print('%-40s %8.3fs %10d samples %12.0f samples/s' % (output, seconds, samples, rate), file=out)
+    total = sum(seconds for _, seconds, _, _ in results)
+    failed = sum(error is not None for _, _, _, error in results)
+    print('%d jobs (%d failed), %.3fs of work' % (len(results), failed, total), file=out)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Render a manifest of lab0 effect chains in parallel.')
+    parser.add_argument('manifest', help='JSON file holding a list of jobs')
+    parser.add_argument('-j', '--processes', type=int, default=None,
+                        help='number of worker processes (default: one per core)')
+    args = parser.parse_args(argv)
+
+    with open(args.manifest) as f:
+        jobs = json.load(f)
+    start = time.perf_counter()
+    results = render_jobs(jobs, args.processes)
+    report(results)
+    print('wall time %.3fs' % (time.perf_counter() - start))
+    return 1 if any(error is not None for _, _, _, error in results) else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
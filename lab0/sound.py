@@ -0,0 +1,116 @@
+"""
+A compact representation for sounds.
+
+The lab represents a sound as a dictionary holding a sampling rate and two
+Python lists of floats.  Each of those floats is a separate boxed object, so a
+sample costs roughly 32 bytes (a list slot plus the float itself).  `Sound`
+keeps the same three fields but stores each channel in an `array('d')`, which
+is 8 bytes per sample, and still supports `sound['rate']`, `sound['left']` and
+`sound['right']` so that every effect in lab.py works on either form.
+"""
+
+from array import array
+
+
+def as_channel(samples):
+    """
+    Return the given samples as an `array('d')`, without copying if they
+    already are one.
+    """
+    if isinstance(samples, array) and samples.typecode == 'd':
+        return samples
+    return array('d', samples)
+
+
+class Sound:
+    """
+    A stereo sound whose channels are stored as `array('d')` buffers.
+
+    Parameters:
+        * rate (int): the sampling rate, in samples per second
+        * left, right (iterable of float): the samples of each channel
+    """
+    __slots__ = ('rate', 'left', 'right')
+
+    def __init__(self, rate, left, right):
+        self.rate = rate
+        self.left = as_channel(left)
+        # remove_vocals shares one channel between both sides; keep that
+        # sharing instead of making a second copy
+        self.right = self.left if right is left else as_channel(right)
+
+    def __getitem__(self, key):
+        if key not in self.__slots__:
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def keys(self):
+        return self.__slots__
+
+    def __contains__(self, key):
+        return key in self.__slots__
+
+    def __eq__(self, other):
+        if not isinstance(other, (Sound, dict)):
+            return NotImplemented
+        return (self.rate == other['rate']
+                and list(self.left) == list(other['left'])
+                and list(self.right) == list(other['right']))
+
+    def __repr__(self):
+        return 'Sound(rate=%r, samples=%d)' % (self.rate, len(self.left))
+
+    @classmethod
+    def from_dict(cls, sound):
+        """
+        Build a Sound from the dictionary representation (or return the given
+        sound unchanged if it already is one).
+        """
+        if isinstance(sound, cls):
+            return sound
+        return cls(sound['rate'], sound['left'], sound['right'])
+
+    def to_dict(self):
+        """
+        Return the dictionary representation of this sound, with the channels
+        as Python lists.
+        """
+        return {
+            'rate': self.rate,
+            'left': self.left.tolist(),
+            'right': self.right.tolist(),
+        }
+
+
+def as_sound(sound):
+    """
+    Adapter from either representation to a Sound.
+    """
+    return Sound.from_dict(sound)
+
+
+def as_dict(sound):
+    """
+    Adapter from either representation to the dictionary representation.
+    """
+    if isinstance(sound, dict):
+        return sound
+    return Sound.from_dict(sound).to_dict()
+
+
+def sound_like(template, rate, left, right):
+    """
+    Build a new sound in the same representation as `template`: a dictionary
+    of lists if the template is a dictionary, otherwise (for a Sound, or a
+    view such as wavio.WavMap) a Sound.  `left` and `right` may be any
+    iterables of samples; passing the same object for both makes the two
+    channels share their storage, as remove_vocals does.
+    """
+    if not isinstance(template, dict):
+        return Sound(rate, left, right)
+    left_out = left if isinstance(left, list) else list(left)
+    if right is left:
+        right_out = left_out
+    else:
+        right_out = right if isinstance(right, list) else list(right)
+    return {'rate': rate, 'left': left_out, 'right': right_out}
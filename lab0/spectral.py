@@ -0,0 +1,315 @@
+"""
+Spectral (STFT-based) effects.
+
+remove_vocals in lab.py subtracts the right channel from the left, which
+removes everything panned to the centre: bass and drums as well as vocals.
+The effects here work on the short-time Fourier transform instead, so they
+can treat each frequency differently:
+
+    * remove_vocals_spectral only removes centre-panned content within the
+      vocal frequency range
+    * equalize scales bands of frequencies
+    * time_stretch changes the duration of a sound without changing its
+      pitch (a phase vocoder)
+
+All of them are built on FrameProcessor, which cuts a stereo stream into
+overlapping windowed frames as samples arrive, and puts the transformed
+frames back together by weighted overlap-add.  Both channels of a frame go
+through a single complex FFT (dsp.fft, radix-2), so each frame costs
+O(n log n) no matter how long the sound is.
+"""
+
+import math
+import cmath
+from array import array
+from operator import add, mul
+
+from dsp import fft
+from sound import Sound, sound_like
+from wavio import BLOCK_SIZE
+
+
+def hann(size):
+    """
+    Return a periodic Hann window of the given size.
+    """
+    return [0.5 - 0.5 * math.cos(2 * math.pi * i / size) for i in range(size)]
+
+
+class FrameProcessor:
+    """
+    Streaming short-time Fourier processing of a stereo sound.
+
+    Parameters:
+        * transform (function): called with the (left, right) half spectra of
+                                each frame (lists of size//2 + 1 complex
+                                numbers, bin k being frequency k*rate/size),
+                                returns the modified (left, right) half spectra
+        * size (int): frame length, a power of two
+        * in_hop (int): number of input samples between frames; defaults to
+                        size//4
+        * out_hop (int): number of output samples between frames; defaults to
+                         in_hop.  The output is out_hop/in_hop times as long
+                         as the input.
+
+    Feed the input through process() one block at a time, then call flush()
+    once at the end.
+    """
+    def __init__(self, transform, size=2048, in_hop=None, out_hop=None):
+        assert size & (size - 1) == 0, "the frame size must be a power of two"
+        self.transform = transform
+        self.size = size
+        self.in_hop = in_hop or size // 4
+        self.out_hop = out_hop or self.in_hop
+        self.window = hann(size)
+
+        # overlap-added squared windows, which every output sample is divided by
+        self.norm = [0.0] * self.out_hop
+        for i, w in enumerate(self.window):
+            self.norm[i % self.out_hop] += w * w
+
+        # start with enough silence that the first input sample is covered
+        # by as many frames as every other sample
+        pad = size - self.in_hop
+        self.inputs = (array('d', bytes(8 * pad)), array('d', bytes(8 * pad)))
+        self.overlap = ([0.0] * size, [0.0] * size)
+        self.skip = round(pad * self.out_hop / self.in_hop) # output from the padding
+        self.received = 0
+        self.produced = 0
+
+    def _frame(self, out_left, out_right):
+        n, half, w = self.size, self.size // 2, self.window
+        in_left, in_right = self.inputs
+
+        # both (real) channels go through one FFT as left + j*right
+        spectrum = fft(list(map(complex, map(mul, in_left[:n], w), map(mul, in_right[:n], w))))
+        del in_left[:self.in_hop], in_right[:self.in_hop]
+
+        conj = [spectrum[-k % n].conjugate() for k in range(half + 1)]
+        left = [(z + c) / 2 for z, c in zip(spectrum, conj)]
+        right = [(z - c) / 2j for z, c in zip(spectrum, conj)]
+
+        left, right = self.transform(left, right)
+
+        # rebuild the full (conjugate-symmetric) spectrum of each channel
+        spectrum = [0j] * n
+        spectrum[0] = complex(left[0].real, right[0].real)
+        spectrum[half] = complex(left[half].real, right[half].real)
+        for k in range(1, half):
+            spectrum[k] = left[k] + 1j * right[k]
+            spectrum[n - k] = left[k].conjugate() + 1j * right[k].conjugate()
+        frame = fft(spectrum, inverse=True)
+
+        hop = self.out_hop
+        for overlap, part, out in ((self.overlap[0], (v.real for v in frame), out_left),
+                                   (self.overlap[1], (v.imag for v in frame), out_right)):
+            overlap[:] = map(add, overlap, map(mul, part, w))
+            out.extend(v / norm for v, norm in zip(overlap[:hop], self.norm))
+            overlap[:] = overlap[hop:] + [0.0] * hop
+
+    def _emit(self, out_left, out_right, limit=None):
+        # drop the output that came from the initial padding, and anything
+        # past `limit` samples of real output
+        start = max(0, self.skip - self.produced)
+        stop = len(out_left)
+        if limit is not None:
+            stop = min(stop, start + limit - max(0, self.produced - self.skip))
+        self.produced += len(out_left)
+        return out_left[start:stop], out_right[start:stop]
+
+    def process(self, left, right):
+        """
+        Add the given block of input, returning the (left, right) output
+        samples that are now complete.
+        """
+        self.inputs[0].extend(left)
+        self.inputs[1].extend(right)
+        self.received += len(left)
+        out_left, out_right = [], []
+        while len(self.inputs[0]) >= self.size:
+            self._frame(out_left, out_right)
+        return self._emit(out_left, out_right)
+
+    def flush(self):
+        """
+        Finish the input, returning the remaining (left, right) output.
+        """
+        target = round(self.received * self.out_hop / self.in_hop)
+        out_left, out_right = [], []
+        silence = bytes(8 * self.in_hop)
+        while self.produced + len(out_left) - self.skip < target:
+            self.inputs[0].frombytes(silence)
+            self.inputs[1].frombytes(silence)
+            while len(self.inputs[0]) >= self.size:
+                self._frame(out_left, out_right)
+        return self._emit(out_left, out_right, target)
+
+
+def process_blocks(blocks, processor):
+    """
+    Run a stream of sounds through a FrameProcessor, yielding the output as
+    a stream of Sounds.
+    """
+    rate = None
+    for block in blocks:
+        rate = block['rate']
+        left, right = processor.process(block['left'], block['right'])
+        if left:
+            yield Sound(rate, left, right)
+    if rate is not None:
+        left, right = processor.flush()
+        yield Sound(rate, left, right)
+
+
+def process_sound(sound, processor):
+    """
+    Run a whole sound through a FrameProcessor, returning a new sound of the
+    same representation.
+    """
+    left, right = array('d'), array('d')
+    n = min(len(sound['left']), len(sound['right']))
+    for start in range(0, n, BLOCK_SIZE):
+        block_left, block_right = processor.process(sound['left'][start:start + BLOCK_SIZE],
+                                                    sound['right'][start:start + BLOCK_SIZE])
+        left.extend(block_left)
+        right.extend(block_right)
+    block_left, block_right = processor.flush()
+    left.extend(block_left)
+    right.extend(block_right)
+    return sound_like(sound, sound['rate'], left, right)
+
+
+# VOCAL REMOVAL
+
+def vocal_remover(rate, size=2048, low=150, high=8000, threshold=0.6):
+    """
+    Return a FrameProcessor removing centre-panned content between the
+    frequencies `low` and `high` (in Hz).  For each frequency bin, the
+    similarity of the two channels, 2*Re(L*conj(R)) / (|L|^2 + |R|^2), is 1
+    for content that is identical in both and falls towards 0 (or below) as it
+    is panned away from the centre or out of phase.  Their common part
+    (L+R)/2 is removed in proportion to how far the similarity is above
+    `threshold`.
+    """
+    band = [k for k in range(size // 2 + 1) if low <= k * rate / size <= high]
+
+    def transform(left, right):
+        for k in band:
+            l, r = left[k], right[k]
+            power = abs(l) ** 2 + abs(r) ** 2
+            if power == 0:
+                continue
+            similarity = 2 * (l * r.conjugate()).real / power
+            if similarity > threshold:
+                amount = (similarity - threshold) / (1 - threshold)
+                mid = (l + r) / 2 * amount
+                left[k] = l - mid
+                right[k] = r - mid
+        return left, right
+
+    return FrameProcessor(transform, size)
+
+
+def remove_vocals_spectral(sound, size=2048, low=150, high=8000, threshold=0.6):
+    """
+    Creates a new sound with the vocals in the given sound removed, keeping
+    everything outside the vocal range (and everything not panned to the
+    centre) intact; see vocal_remover.
+    """
+    return process_sound(sound, vocal_remover(sound['rate'], size, low, high, threshold))
+
+
+# EQUALIZATION
+
+def equalizer(rate, bands, size=2048):
+    """
+    Return a FrameProcessor scaling frequencies by band.  `bands` is a list
+    of (low, high, gain) triples: every frequency between low and high (in Hz)
+    is scaled by gain (a factor, not decibels).  Overlapping bands multiply.
+    """
+    gains = [1.0] * (size // 2 + 1)
+    for k in range(len(gains)):
+        freq = k * rate / size
+        for low, high, gain in bands:
+            if low <= freq <= high:
+                gains[k] *= gain
+
+    def transform(left, right):
+        return list(map(mul, left, gains)), list(map(mul, right, gains))
+
+    return FrameProcessor(transform, size)
+
+
+def equalize(sound, bands, size=2048):
+    """
+    Create a new sound with the given bands of frequencies scaled; see
+    equalizer.
+    """
+    return process_sound(sound, equalizer(sound['rate'], bands, size))
+
+
+# TIME STRETCHING
+
+def stretcher(factor, size=2048):
+    """
+    Return a FrameProcessor making a sound `factor` times as long, without
+    changing its pitch.  Frames are read every size/(4*factor) samples and
+    written every size/4 samples (a phase vocoder).  The phase of each
+    spectral peak is advanced by its measured frequency times the synthesis
+    hop, so sinusoids stay continuous across frames; the bins around a peak
+    keep their phase relative to it ("identity phase locking"), which keeps
+    them from drifting apart and partially cancelling each other.
+    """
+    out_hop = size // 4
+    in_hop = max(1, round(out_hop / factor))
+    half = size // 2
+    expected = [2 * math.pi * k * in_hop / size for k in range(half + 1)]
+    ratio = out_hop / in_hop
+
+    def advance(spectrum, state):
+        mags = [abs(z) for z in spectrum]
+        phases = [cmath.phase(z) for z in spectrum]
+        if state.get('last') is None:
+            # the first frame keeps its phases
+            state['last'], state['out'] = phases, list(phases)
+            return spectrum
+        last, out = state['last'], state['out']
+
+        peaks = [k for k in range(half + 1)
+                 if mags[k] > 0
+                 and (k == 0 or mags[k] > mags[k - 1])
+                 and (k == half or mags[k] >= mags[k + 1])]
+        new = [0.0] * (half + 1)
+        for k in peaks:
+            # deviation from the bin's centre frequency, wrapped to [-pi, pi]
+            delta = phases[k] - last[k] - expected[k]
+            delta -= 2 * math.pi * round(delta / (2 * math.pi))
+            new[k] = out[k] + (expected[k] + delta) * ratio
+
+        # every other bin follows its nearest peak
+        nearest = 0
+        for k in range(half + 1):
+            while nearest + 1 < len(peaks) and peaks[nearest + 1] - k < k - peaks[nearest]:
+                nearest += 1
+            if peaks and k != peaks[nearest]:
+                peak = peaks[nearest]
+                new[k] = new[peak] + phases[k] - phases[peak]
+
+        state['last'], state['out'] = phases, new
+        return [cmath.rect(m, p) for m, p in zip(mags, new)]
+
+    states = ({}, {})
+
+    def transform(left, right):
+        return advance(left, states[0]), advance(right, states[1])
+
+    return FrameProcessor(transform, size, in_hop, out_hop)
+
+
+def time_stretch(sound, factor, size=2048):
+    """
+    Create a new sound that is `factor` times as long as the given sound
+    (approximately; the ratio is rounded to a whole number of samples per
+    analysis hop), at the same pitch; see stretcher.
+    """
+    return process_sound(sound, stretcher(factor, size))
@@ -232,6 +232,368 @@ def test_remove_vocals_random_3():
     compare_sounds(lab.remove_vocals(*inps), exp)
     assert inps == inps2, 'be careful not to modify the input!'
 
+def test_compact_sound_effects():
+    s1 = {
+        'rate': 30,
+        'left': [1, 2, 3, 4, 5, 6],
+        'right': [7, 6, 5, 4, 3, 2],
+    }
+    s2 = {
+        'rate': 30,
+        'left': [7, 8, 9, 10],
+        'right': [12, 13, 14, 15],
+    }
+    c1, c2 = lab.as_sound(s1), lab.as_sound(s2)
+    assert isinstance(c1, lab.Sound)
+    assert lab.as_dict(c1) == s1
+    for result, expected in [
+            (lab.backwards(c1), lab.backwards(s1)),
+            (lab.mix(c1, c2, 0.7), lab.mix(s1, s2, 0.7)),
+            (lab.echo(c1, 2, 0.1, 0.7), lab.echo(s1, 2, 0.1, 0.7)),
+            (lab.pan(c1), lab.pan(s1)),
+            (lab.remove_vocals(c1), lab.remove_vocals(s1))]:
+        assert isinstance(result, lab.Sound), 'effects should keep the compact representation'
+        compare_sounds(result, expected)
+    assert lab.as_dict(c1) == s1, 'be careful not to modify the input!'
+
+
+def test_streaming_effects(tmp_path):
+    inp = {
+        'rate': 8,
+        'left': [0.5, -0.25, 0.125, 0.75, -0.5, 0.25, 0.0, -0.125, 0.375],
+        'right': [0.25, 0.5, -0.75, 0.125, 0.0, -0.25, 0.5, 0.625, -0.375],
+    }
+    fname = str(tmp_path / 'inp.wav')
+    lab.write_wav(inp, fname)
+    inp = lab.load_wav(fname)
+    assert lab.load_wav(fname, compact=True) == inp
+
+    def joined(blocks):
+        out = {'rate': inp['rate'], 'left': [], 'right': []}
+        for block in blocks:
+            out['left'].extend(block['left'])
+            out['right'].extend(block['right'])
+        return out
+
+    blocks = lambda: lab.read_blocks(fname, 2)
+    assert [len(b['left']) for b in blocks()] == [2, 2, 2, 2, 1]
+    compare_sounds(joined(lab.pan_blocks(blocks(), 9)), lab.pan(inp))
+    compare_sounds(joined(lab.remove_vocals_blocks(blocks())), lab.remove_vocals(inp))
+    compare_sounds(joined(lab.mix_blocks(blocks(), lab.read_blocks(fname, 3), 0.3)),
+                   lab.mix(inp, inp, 0.3))
+
+    outname = str(tmp_path / 'out.wav')
+    lab.write_blocks(lab.pan_blocks(blocks(), 9), outname)
+    compare_sounds(lab.load_wav(outname), lab.pan(inp), eps=(2/(2**15-1)))
+
+    # blocks with channels of different lengths stay aligned, and a channel
+    # that ends up longer than the other is cut short as write_wav does
+    ragged = [
+        {'rate': 8, 'left': inp['left'][:3], 'right': inp['right'][:1]},
+        {'rate': 8, 'left': inp['left'][3:4], 'right': inp['right'][1:6]},
+        {'rate': 8, 'left': inp['left'][4:], 'right': inp['right'][6:8]},
+    ]
+    lab.write_blocks(ragged, outname)
+    short = {'rate': 8, 'left': inp['left'][:8], 'right': inp['right'][:8]}
+    compare_sounds(lab.load_wav(outname), short, eps=(2/(2**15-1)))
+
+
+def test_echo_methods():
+    inp = {
+        'rate': 9,
+        'left': [1, 2, 3, -1, 0.5],
+        'right': [0, 4, 0, 2, -3],
+    }
+    inp2 = copy.deepcopy(inp)
+    # by default, exactly the sums of the original echo (3 echoes, 3 samples apart)
+    exp = {'rate': 9}
+    for side in ('left', 'right'):
+        out = list(inp[side]) + [0] * 9
+        for i in range(1, 4):
+            for k, x in enumerate(inp[side]):
+                out[3 * i + k] += x * 0.7 ** i
+        exp[side] = out
+    assert lab.echo(inp, 3, 0.3, 0.7) == exp
+    assert lab.echo(inp, 3, 0.3, 0.7, method='taps') == exp
+    # the faster engines agree up to rounding
+    for method in ('feedback', 'fft'):
+        compare_sounds(lab.echo(inp, 3, 0.3, 0.7, method=method), exp, eps=1e-12)
+    # scales of magnitude 1 or more can't use the feedback recurrence
+    assert lab.echo(inp, 3, 0.3, -1.5, method='feedback') == lab.echo(inp, 3, 0.3, -1.5)
+    assert inp == inp2, 'be careful not to modify the input!'
+
+
+def test_reverb_small():
+    inp = {
+        'rate': 9,
+        'left': [1, 2, 3],
+        'right': [0, 4, 0],
+    }
+    exp = {
+        'rate': 9,
+        'left': [0.5, 1.25, 2, 0.75],
+        'right': [0, 2, 1, 0],
+    }
+    compare_sounds(lab.reverb(inp, [0.5, 0.25]), exp)
+
+
+def test_pipeline_matches_effects(tmp_path):
+    s1 = {
+        'rate': 10,
+        'left': [0.05 * i for i in range(-8, 9)],
+        'right': [0.05 * (i % 5) for i in range(17)],
+    }
+    s2 = {
+        'rate': 10,
+        'left': [0.3, -0.2, 0.1, 0.4, -0.5, 0.6, 0.0, -0.1, 0.2, 0.3, -0.4, 0.5],
+        'right': [-0.3, 0.2, -0.1, 0.0, 0.5, -0.6, 0.7, 0.1, -0.2, 0.0, 0.4, -0.5],
+    }
+    inp1, inp2 = copy.deepcopy(s1), copy.deepcopy(s2)
+
+    chain = lab.Pipeline(s1).mix(s2, 0.3).pan().echo(2, 0.3, 0.6)
+    exp = lab.echo(lab.pan(lab.mix(s1, s2, 0.3)), 2, 0.3, 0.6)
+    compare_sounds(chain.render(compact=False), exp)
+    assert list(chain.blocks(block_size=4))  # blocks can be smaller than the delay
+    chain = lab.Pipeline(s1).echo(2, 0.3, 0.6, method='feedback')
+    compare_sounds(chain.render(), lab.echo(s1, 2, 0.3, 0.6, method='feedback'))
+    for method in ('fft', 'bogus'):
+        with pytest.raises(ValueError):
+            lab.Pipeline(s1).echo(2, 0.3, 0.6, method=method)
+
+    chain = lab.Pipeline(s1).backwards().remove_vocals().pan()
+    compare_sounds(chain.render(), lab.pan(lab.remove_vocals(lab.backwards(s1))))
+
+    outfile = str(tmp_path / 'out.wav')
+    lab.Pipeline(s1).echo(1, 0.2, 0.5).backwards().write_wav(outfile)
+    compare_sounds(lab.load_wav(outfile), lab.backwards(lab.echo(s1, 1, 0.2, 0.5)),
+                   eps=(2/(2**15-1)))
+    assert s1 == inp1 and s2 == inp2, 'be careful not to modify the inputs!'
+
+
+def test_mix_tracks_small():
+    s1 = {
+        'rate': 30,
+        'left': [1, 2, 3, 4, 5, 6],
+        'right': [7, 6, 5, 4, 3, 2],
+    }
+    s2 = {
+        'rate': 15,
+        'left': [2, 4, 6],
+        'right': [0, 2, 4],
+    }
+    s3 = {
+        'rate': 30,
+        'left': [7, 8, 9, 10],
+        'right': [12, 13, 14, 15],
+    }
+    inps = copy.deepcopy([s1, s2, s3])
+    # s2 is resampled to [2, 3, 4, 5, 6] and [0, 1, 2, 3, 4]
+    exp = {
+        'rate': 30,
+        'left': [0.5+1+3.5, 1+1.5+4, 1.5+2+4.5, 2+2.5+5],
+        'right': [3.5+0+6, 3+0.5+6.5, 2.5+1+7, 2+1.5+7.5],
+    }
+    compare_sounds(lab.mix_tracks([s1, s2, s3], [0.5, 0.5, 0.5]), exp)
+    compare_sounds(lab.mix_tracks([s1, s3], [0.7, 0.3]), lab.mix(s1, s3, 0.7))
+    assert [s1, s2, s3] == inps, 'be careful not to modify the inputs!'
+
+    # downsampling filters out what the new rate can't represent, instead of
+    # aliasing it: the highest frequency at 40 samples per second becomes
+    # nothing at 20, while a constant stays constant
+    high = {'rate': 40, 'left': [(-1) ** i for i in range(200)], 'right': [0.25] * 200}
+    low = lab.mix_tracks([high], [1], rate=20)
+    assert len(low['left']) == len(low['right']) == 100
+    assert max(abs(x) for x in low['left'][10:-10]) < 0.01
+    compare_sounds(low, {'rate': 20, 'left': low['left'], 'right': [0.25] * 100})
+
+    with pytest.raises(ValueError):
+        lab.mix_tracks([])
+    with pytest.raises(ValueError):
+        lab.mix_tracks([s1, s3], [0.5])
+
+
+def test_render_jobs(tmp_path):
+    import render
+    inp = {
+        'rate': 10,
+        'left': [0.05 * i for i in range(-8, 9)],
+        'right': [0.05 * (i % 5) for i in range(17)],
+    }
+    infile = str(tmp_path / 'inp.wav')
+    lab.write_wav(inp, infile)
+    inp = lab.load_wav(infile)
+
+    jobs = [
+        {'inputs': [infile, lab.as_sound(inp)], 'chain': [['mix', 1, 0.3], ['echo', 2, 0.2, 0.5]],
+         'output': str(tmp_path / 'out1.wav')},
+        {'inputs': [lab.as_sound(inp)], 'chain': [['backwards'], ['pan']],
+         'output': str(tmp_path / 'out2.wav')},
+    ]
+    results = render.render_jobs(jobs, processes=2)
+    assert [r[0] for r in results] == [job['output'] for job in jobs]
+    assert [r[2] for r in results] == [17 + 4, 17]
+    compare_against_file(lab.echo(lab.mix(inp, inp, 0.3), 2, 0.2, 0.5), jobs[0]['output'])
+    compare_against_file(lab.pan(lab.backwards(inp)), jobs[1]['output'])
+
+    assert all(r[3] is None for r in results)
+
+    with pytest.raises(ValueError):
+        render.check_job({'inputs': [infile], 'chain': [['flanger']], 'output': 'x.wav'})
+    with pytest.raises(ValueError):
+        render.check_job({'inputs': [infile], 'chain': [[]], 'output': 'x.wav'})
+
+    # bad jobs fail on their own, without stopping the rest of the batch
+    jobs = [
+        {'inputs': [infile], 'chain': [[]], 'output': str(tmp_path / 'bad1.wav')},
+        {'inputs': [str(tmp_path / 'missing.wav')], 'output': str(tmp_path / 'bad2.wav')},
+        {'inputs': [infile], 'chain': [['backwards']], 'output': str(tmp_path / 'out3.wav')},
+    ]
+    results = render.render_jobs(jobs, processes=1)
+    assert [r[3] is None for r in results] == [False, False, True]
+    assert not os.path.exists(jobs[1]['output'])
+    compare_against_file(lab.backwards(inp), jobs[2]['output'])
+
+
+def test_wav_map(tmp_path):
+    inp = {
+        'rate': 8,
+        'left': [0.5, -0.25, 0.125, 0.75, -0.5, 0.25, 0.0],
+        'right': [0.25, 0.5, -0.75, 0.125, 0.0, -0.25, 0.5],
+    }
+    fname = str(tmp_path / 'inp.wav')
+    lab.write_wav(inp, fname)
+    inp = lab.load_wav(fname)
+
+    with lab.WavMap(fname) as mapped:
+        assert mapped['rate'] == inp['rate']
+        assert len(mapped['left']) == len(inp['left'])
+        assert mapped['left'][3] == inp['left'][3]
+        assert mapped['right'][-1] == inp['right'][-1]
+        assert list(mapped['right'][5:1:-2]) == inp['right'][5:1:-2]
+        compare_sounds(lab.backwards(mapped), lab.backwards(inp))
+        compare_sounds(lab.remove_vocals(mapped), lab.remove_vocals(inp))
+
+
+def test_bench_harness():
+    import io
+    import tempfile
+    import bench
+    results = bench.run([0.01], only=['pan', 'echo'], repeats=1, out=io.StringIO())
+    assert set(results) == {'pan/dict/0.01s', 'pan/compact/0.01s', 'echo/dict/0.01s', 'echo/compact/0.01s'}
+    assert all(r['samples_per_sec'] > 0 and r['peak_bytes'] > 0 for r in results.values())
+
+    baseline = {k: dict(v, samples_per_sec=v['samples_per_sec'] * 2) for k, v in results.items()}
+    assert len(bench.regressions(results, baseline)) == 4
+    assert bench.regressions(results, results) == []
+
+    # long sounds are only benchmarked in the compact representation, and
+    # the WAV fixture is only written for load_wav
+    limits = dict(bench.MAX_SECONDS)
+    try:
+        bench.MAX_SECONDS.update(dict=0.005, reverb=0.005)
+        results = bench.run([0.01], only=['pan', 'reverb'], repeats=1, memory=False, out=io.StringIO())
+    finally:
+        bench.MAX_SECONDS.update(limits)
+    assert set(results) == {'pan/compact/0.01s'}
+    with tempfile.TemporaryDirectory() as workdir:
+        sound = bench.synth_sound(0.01, compact=True)
+        assert [name for name, _ in bench.cases(sound, sound, workdir, ['pan'])] == ['pan']
+        assert os.listdir(workdir) == []
+        bench.cases(sound, sound, workdir, ['load_wav'])
+        assert os.listdir(workdir) == ['bench.wav']
+
+
+def test_spectral_effects():
+    import math
+    import spectral
+    rate, n = 4000, 3000
+    tone = lambda f, i: math.sin(2 * math.pi * f * i / rate)
+    # a centred "vocal" at 500Hz and bass at 63Hz, plus a 750Hz tone on the left
+    inp = {
+        'rate': rate,
+        'left': [tone(500, i) + tone(63, i) + 0.5 * tone(750, i) for i in range(n)],
+        'right': [tone(500, i) + tone(63, i) for i in range(n)],
+    }
+    inp2 = copy.deepcopy(inp)
+
+    def level(samples, f):
+        # amplitude of frequency f over the middle of the sound
+        part = range(n // 4, 3 * n // 4)
+        return abs(sum(samples[i] * complex(math.cos(2 * math.pi * f * i / rate),
+                                            -math.sin(2 * math.pi * f * i / rate))
+                       for i in part)) * 2 / len(part)
+
+    unchanged = spectral.process_sound(inp, spectral.FrameProcessor(lambda l, r: (l, r), 256))
+    compare_sounds(unchanged, inp)
+    compare_sounds(spectral.equalize(inp, [(0, rate, 0.5)], 256),
+                   {'rate': rate, 'left': [i / 2 for i in inp['left']], 'right': [i / 2 for i in inp['right']]})
+
+    result = spectral.remove_vocals_spectral(inp, 512)
+    assert level(result['left'], 500) < 0.05 and level(result['right'], 500) < 0.05
+    assert abs(level(result['left'], 63) - 1) < 0.05
+    assert abs(level(result['left'], 750) - 0.5) < 0.05
+
+    stretched = spectral.time_stretch(inp, 2, 512)
+    assert len(stretched['left']) == 2 * n
+    assert abs(level(stretched['right'][n // 2:], 500) - 1) < 0.1
+    assert inp == inp2, 'be careful not to modify the input!'
+
+    # lengths shorter than a frame, or not a whole number of hops
+    hops = spectral.stretcher(1.5, 256)
+    for length in (1, 10, 100, 255, 700, 1000, 1600):
+        short = {'rate': rate, 'left': inp['left'][:length], 'right': inp['right'][:length]}
+        assert len(spectral.equalize(short, [(0, rate, 0.5)], 256)['left']) == length
+        assert len(spectral.remove_vocals_spectral(short, 512)['right']) == length
+        assert len(spectral.time_stretch(short, 2, 512)['left']) == 2 * length
+        assert len(spectral.time_stretch(short, 1.5, 256)['right']) == round(length * hops.out_hop / hops.in_hop)
+
+
+def test_envelopes():
+    import envelope
+    from sound import Sound
+    n = 11
+    inp = {'rate': 8, 'left': [1.0] * n, 'right': [0.5] * n}
+    inp2 = copy.deepcopy(inp)
+
+    # pan is the linear preset, and matches its original definition exactly
+    expected = {'rate': 8,
+                'left': [1.0 * (1 - i / (n - 1)) for i in range(n)],
+                'right': [0.5 * (i / (n - 1)) for i in range(n)]}
+    assert lab.pan(inp) == expected
+    assert lab.pan(Sound.from_dict(inp)) == expected
+    assert lab.pan({'rate': 8, 'left': [1.0] * 4, 'right': [0.5] * 4}, 3, n) == \
+        {'rate': 8, 'left': expected['left'][3:7], 'right': expected['right'][3:7]}
+
+    env = envelope.Envelope([(0.2, 0), (0.6, 2), (1, 1)])
+    compare_sounds(envelope.apply_envelope(inp, env),
+                   {'rate': 8,
+                    'left': [0, 0, 0, 0.5, 1, 1.5, 2, 1.75, 1.5, 1.25, 1],
+                    'right': [0, 0, 0, 0.25, 0.5, 0.75, 1, 0.875, 0.75, 0.625, 0.5]})
+    fade = envelope.fade(0.5, 0)
+    assert fade.gains(n)[0] == 0 and fade.gains(n)[5:] == envelope.Envelope([(0, 1)]).gains(n, 5)
+    curve = envelope.Envelope.curve(lambda t: t * t)
+    compare_sounds(envelope.apply_envelope(inp, curve, envelope.Envelope([(0, 1)])),
+                   {'rate': 8, 'left': [(i / 10) ** 2 for i in range(n)], 'right': [0.5] * n})
+
+    # the pure-Python ramps give the same gains as NumPy
+    if envelope.numpy is not None:
+        numpy, envelope.numpy = envelope.numpy, None
+        try:
+            assert lab.pan(inp) == expected
+            compare_sounds(envelope.apply_envelope(inp, envelope.fade(0.3, 0.3)),
+                           {'rate': 8, 'left': list(envelope.fade(0.3, 0.3).gains(n)),
+                            'right': [g / 2 for g in envelope.fade(0.3, 0.3).gains(n)]})
+        finally:
+            envelope.numpy = numpy
+
+    # a channel left unchanged is still a copy, not the input's own samples
+    for sound in (inp, Sound.from_dict(inp)):
+        result = envelope.apply_envelope(sound, None, env)
+        assert result['left'] is not sound['left']
+        result['left'][0] = 7
+    assert inp == inp2, 'be careful not to modify the input!'
+
+
 if __name__ == '__main__':
     import sys
     import json
@@ -0,0 +1,318 @@
+"""
+Streaming and memory-mapped access to 16-bit WAV files.
+
+Rather than decoding a whole file into memory, read_blocks yields the sound
+as a sequence of fixed-size blocks (each a `Sound` of at most `block_size`
+samples), and WavWriter accepts blocks one at a time.  Each block is decoded
+or encoded with a single `array.frombytes`/`tobytes` call, so a recording of
+any length can be processed in constant memory.
+
+WavMap goes further for effects that only need to index samples: it maps
+the file into memory and reads samples straight from the mapped PCM data,
+converting only the ones that are touched.
+"""
+
+import sys
+import mmap
+import wave
+import struct
+from array import array
+from itertools import repeat
+from operator import mul
+
+from sound import Sound
+
+# number of frames read from (or written to) a file at once
+BLOCK_SIZE = 1 << 14
+
+
+def decode_frames(frames, chan):
+    """
+    Convert a bytes object of little-endian 16-bit frames with `chan`
+    channels into a (left, right) pair of `array('d')` in [-1, 1).
+    """
+    data = array('h')
+    data.frombytes(frames)
+    if sys.byteorder == 'big':
+        data.byteswap()
+
+    if chan == 2:
+        left, right = data[0::2], data[1::2]
+    else:
+        left, right = data, data
+
+    # 2**-15 is exact, so this gives the same values as i/(2**15)
+    left = array('d', map(mul, left, repeat(2**-15, len(left))))
+    right = array('d', map(mul, right, repeat(2**-15, len(right))))
+    return left, right
+
+
+def encode_frames(left, right):
+    """
+    Clip the given channels (which must have the same length) to [-1, 1] and
+    convert them into a bytes object of interleaved little-endian 16-bit
+    stereo frames.
+    """
+    n = len(left)
+    if len(right) != n:
+        raise ValueError('both channels must have the same number of samples')
+    out = array('h', bytes(4 * n))
+    out[0::2] = array('h', (int(max(-1, min(1, l)) * (2**15-1)) for l in left))
+    out[1::2] = array('h', (int(max(-1, min(1, r)) * (2**15-1)) for r in right))
+    if sys.byteorder == 'big':
+        out.byteswap()
+    return out.tobytes()
+
+
+def wav_params(filename):
+    """
+    Return the (sampling rate, number of frames) of the given WAV file.
+    """
+    with wave.open(filename, 'rb') as f:
+        return f.getframerate(), f.getnframes()
+
+
+def _blocks(f, block_size):
+    # the blocks of an open WAV file, from its current position
+    chan, bd, sr, count, _, _ = f.getparams()
+
+    assert bd == 2, "only 16-bit WAV files are supported"
+
+    while True:
+        frames = f.readframes(block_size)
+        if not frames:
+            break
+        left, right = decode_frames(frames, chan)
+        yield Sound(sr, left, right)
+
+
+def read_blocks(filename, block_size=BLOCK_SIZE):
+    """
+    Given the filename of a WAV file, yield its contents as a sequence of
+    Sounds of at most `block_size` samples each.
+    """
+    with wave.open(filename, 'rb') as f:
+        yield from _blocks(f, block_size)
+
+
+def read_sound(filename, block_size=BLOCK_SIZE):
+    """
+    Given the filename of a WAV file, return its whole contents as a single
+    Sound, read `block_size` samples at a time.
+    """
+    with wave.open(filename, 'rb') as f:
+        sound = Sound(f.getframerate(), [], [])
+        for block in _blocks(f, block_size):
+            sound.left.extend(block.left)
+            sound.right.extend(block.right)
+        return sound
+
+
+def read_blocks_reversed(filename, block_size=BLOCK_SIZE):
+    """
+    Given the filename of a WAV file, yield its contents backwards, as a
+    sequence of reversed Sounds of at most `block_size` samples each,
+    starting from the end of the file.
+    """
+    with wave.open(filename, 'rb') as f:
+        chan, bd, sr, count, _, _ = f.getparams()
+
+        assert bd == 2, "only 16-bit WAV files are supported"
+
+        stop = count
+        while stop > 0:
+            start = max(0, stop - block_size)
+            f.setpos(start)
+            left, right = decode_frames(f.readframes(stop - start), chan)
+            left.reverse()
+            right.reverse()
+            yield Sound(sr, left, right)
+            stop = start
+
+
+class WavWriter:
+    """
+    Incrementally write a stereo 16-bit WAV file, one block at a time.
+
+    The channels of a block need not have the same length: samples of one
+    channel beyond the end of the other are held back until the other
+    channel catches up in a later block (and dropped if it never does, as
+    write_wav drops them).
+
+    Invoked as, for example:
+        with WavWriter('out.wav', 44100) as out:
+            for block in blocks:
+                out.write(block)
+    """
+    def __init__(self, filename, rate):
+        self.rate = rate
+        self.file = wave.open(filename, 'wb')
+        self.file.setparams((2, 2, rate, 0, 'NONE', 'not compressed'))
+        # samples of one channel still waiting for the other's
+        self.left = array('d')
+        self.right = array('d')
+
+    def write(self, block):
+        """
+        Append the samples of the given sound (a dictionary or a Sound) to
+        the file.
+        """
+        assert block['rate'] == self.rate, "all blocks must share one sampling rate"
+        left, right = block['left'], block['right']
+        if self.left or self.right:
+            left = self.left + array('d', left)
+            right = self.right + array('d', right)
+        n = min(len(left), len(right))
+        if len(left) == len(right):
+            self.file.writeframes(encode_frames(left, right))
+            self.left, self.right = array('d'), array('d')
+        else:
+            self.file.writeframes(encode_frames(left[:n], right[:n]))
+            self.left, self.right = array('d', left[n:]), array('d', right[n:])
+
+    def close(self):
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def write_blocks(blocks, filename, rate=None):
+    """
+    Write every block of the given iterable of sounds to a WAV file, taking
+    the sampling rate from the first block unless `rate` is given.
+    """
+    writer = None if rate is None else WavWriter(filename, rate)
+    try:
+        for block in blocks:
+            if writer is None:
+                writer = WavWriter(filename, block['rate'])
+            writer.write(block)
+        if writer is None:
+            raise ValueError('cannot write an empty stream without a sampling rate')
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+# MEMORY-MAPPED ACCESS
+
+def _find_pcm(buf):
+    """
+    Walk the RIFF chunks of a WAV file held in `buf`, returning its
+    (channels, bytes per sample, sampling rate, data offset, data size).
+    """
+    if bytes(buf[0:4]) != b'RIFF' or bytes(buf[8:12]) != b'WAVE':
+        raise wave.Error('not a WAV file')
+    fmt = None
+    pos = 12
+    while pos + 8 <= len(buf):
+        chunk = bytes(buf[pos:pos + 4])
+        size, = struct.unpack('<I', buf[pos + 4:pos + 8])
+        body = pos + 8
+        if chunk == b'fmt ':
+            _, chan, rate, _, _, bits = struct.unpack('<HHIIHH', buf[body:body + 16])
+            fmt = (chan, bits // 8, rate)
+        elif chunk == b'data':
+            if fmt is None:
+                raise wave.Error('data chunk before fmt chunk')
+            return fmt + (body, min(size, len(buf) - body))
+        # chunks are padded to an even length
+        pos = body + size + (size & 1)
+    raise wave.Error('no data chunk')
+
+
+class WavChannel:
+    """
+    One channel of a WavMap, behaving like a read-only sequence of floats.
+    Indexing converts a single sample; slicing converts only the selected
+    samples (into an `array('d')`); iterating converts samples as they are
+    consumed.
+    """
+    def __init__(self, pcm, channel, channels):
+        self.pcm = pcm
+        self.channel = channel
+        self.channels = channels
+        self.length = len(pcm) // channels
+
+    def __len__(self):
+        return self.length
+
+    def __iter__(self):
+        return map(mul, self.pcm[self.channel::self.channels], repeat(2**-15))
+
+    def __getitem__(self, index):
+        chan = self.channels
+        if isinstance(index, slice):
+            frames = range(*index.indices(self.length))
+            if not frames:
+                return array('d')
+            # the same frames, as positions in the interleaved PCM data
+            start = frames.start * chan + self.channel
+            step = frames.step * chan
+            stop = start + (len(frames) - 1) * step + (1 if step > 0 else -1)
+            raw = self.pcm[start:stop if stop >= 0 else None:step]
+            return array('d', map(mul, raw, repeat(2**-15, len(frames))))
+
+        if index < 0:
+            index += self.length
+        if not 0 <= index < self.length:
+            raise IndexError('sample index out of range')
+        return self.pcm[index * chan + self.channel] * 2**-15
+
+
+class WavMap:
+    """
+    A read-only view of a 16-bit WAV file through a memory map.  Opening it
+    only reads the header; `sound['left']` and `sound['right']` are
+    WavChannels reading samples straight from the mapped file, so effects can
+    be applied to it directly:
+
+        with WavMap('long.wav') as sound:
+            write_wav(backwards(sound), 'long_reversed.wav')
+
+    The PCM data is read in the machine's byte order, so this requires a
+    little-endian machine (as WAV files are little-endian).
+    """
+    def __init__(self, filename):
+        assert sys.byteorder == 'little', "WavMap requires a little-endian machine"
+        self.file = open(filename, 'rb')
+        try:
+            self.map = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        except BaseException:
+            self.file.close()
+            raise
+        self.view = memoryview(self.map)
+
+        chan, width, self.rate, offset, size = _find_pcm(self.view)
+        assert width == 2, "only 16-bit WAV files are supported"
+
+        size -= size % (2 * chan) # ignore a trailing partial frame
+        self.data = self.view[offset:offset + size]
+        self.pcm = self.data.cast('h')
+        self.left = WavChannel(self.pcm, 0, chan)
+        self.right = WavChannel(self.pcm, 1 if chan == 2 else 0, chan)
+
+    def __getitem__(self, key):
+        if key not in ('rate', 'left', 'right'):
+            raise KeyError(key)
+        return getattr(self, key)
+
+    def close(self):
+        """
+        Release the memory map.  Any iterators over the channels must be
+        finished (or discarded) first.
+        """
+        for view in (self.pcm, self.data, self.view):
+            view.release()
+        self.map.close()
+        self.file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -1,10 +1,16 @@
 #!/usr/bin/env python3
 
-import math
+import os
+import sys
 
-from PIL import Image as Image
+# the modules shared between the labs are in ../common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
 
-# NO ADDITIONAL IMPORTS ALLOWED!
+from correlation import (separate_kernel, correlate_separable, correlate_padded,
+                         correlate_fft, prefer_fft, is_integer_image, box_filtered,
+                         sobel)
+from imagefiles import read_greyscale, write_image
+from tiles import filter_tiled, TILE
 
 
 def get_pixel(image, x, y):
@@ -112,35 +118,17 @@ def correlate(image, kernel):
 
     A kernel is represented as an n x n matrix. 
     """
-    def kernel_calc(pixel, x, y, kernel):
-        """
-        Compute and return the new color of a pixel of an image given its position and a kernel.
-        """
-        new = 0; 
-        kernel_size = len(kernel)
-        # Relative positions to current pixel
-        offset = range(-((kernel_size - 1) // 2), 1 + kernel_size // 2)
-        
-        # Absolute positions in the kernel
-        kernel_index = range(kernel_size)
-        
-        for dx, kx in zip(offset, kernel_index):
-            for dy, ky in zip(offset, kernel_index):
-                new += handel_out_of_bound(image, x+dx, y+dy) * kernel[kx][ky]
-        return new
- 
-    result = {
-        'height': image['height'],
-        'width': image['width'],
-        'pixels': [],
-    }
-    
-    for x in range(image['height']):
-        for y in range(image['width']): 
-            color = get_pixel(image, x, y) 
-            newcolor = kernel_calc(color, x, y, kernel)
-            set_pixel(result, newcolor)
-    return result
+    factors = separate_kernel(kernel)
+    if factors is not None:
+        # two 1-D passes: O(n) work per pixel instead of O(n**2)
+        return correlate_separable(image, kernel, *factors)
+
+    if prefer_fft(image, kernel):
+        # large kernels: the cost per pixel no longer grows with the kernel
+        return correlate_fft(image, kernel)
+
+    # one tap at a time over an edge-extended copy of the image
+    return correlate_padded(image, kernel)
 
 
 
@@ -184,6 +172,10 @@ def blurred(image, n):
     # create a representation for the appropriate n-by-n kernel 
     kernel = [[1/(n**2)] * n for _ in range(n)]
 
+    if is_integer_image(image):
+        # running window sums give the same pixels in constant time per pixel
+        return box_filtered(image, n, kernel)
+
     # compute the correlation of the input image with that kernel
     result = correlate(image, kernel)
 
@@ -207,6 +199,10 @@ def sharpened(image, n):
     # this operation is as if adding 2 identity kernel to 'minus blurred version' kernel
     kernel[k_center][k_center] += 2 
 
+    if is_integer_image(image):
+        # 2 * pixel minus the box sum, in constant time per pixel
+        return box_filtered(image, n, kernel, scale=-1, center=2)
+
     # then compute the correlation of the input image with the computed kernel
     result = correlate(image, kernel)
 
@@ -216,64 +212,54 @@ def sharpened(image, n):
     return result 
 
 
-def edges(image):
+def edges(image, clip=True):
     """
     Detect the edges in a given image. 
     Return a new image resulting from a series of operations where the edges are emphasized. 
-    """
-    # kernel Kx 
-    Kx=[[-1,0,1],
-        [-2,0,2],
-        [-1,0,1]]
-    # kernel Ky 
-    Ky=[[-1,-2,-1],
-        [0, 0, 0],
-        [1, 2, 1]]
-    # compute Ox and Oy by correlating the input with Kx and Ky respectively 
-    Ox = correlate(image, Kx)
-    Oy = correlate(image, Ky)
 
-    result = {
-        'height': image['height'],
-        'width': image['width'],
-        'pixels': [],
-    }
+    Each pixel of the output is the square root of the sum of squares of the
+    correlations of the input with the Sobel kernels Kx and Ky, rounded (and
+    clipped to 255, unless clip is False); both correlations and the
+    magnitude are computed together in a single pass over the image.
+    """
+    return sobel(image, clip, root=lambda s: s**(1/2))
 
-    # for y in Oy['pixels']:
-    #     set_pixel(result, y)
 
-    # each pixel of the output is the square root of the sum of squares of corresponding pixels in Ox and Oy
-    for x, y in zip(Ox['pixels'], Oy['pixels']):
-        Oxy = round((x**2 + y**2)**(1/2)) #round(math.sqrt(x**2 + y**2))
-        set_pixel(result, Oxy)
+def tiled_filter(filt, source, target, *args, size=TILE):
+    """
+    Apply one of the filters above (inverted, kernel, blurred, sharpened or
+    edges), called with the given further arguments, to the RawImage source
+    (see tiles.py) a tile of at most size-by-size pixels at a time, writing
+    the result into the RawImage target.
 
-    result = round_and_clip_image(result)
-    return result
+    Invoked as, for example:
+       tiled_filter(blurred, source, target, 5)
+    """
+    if filt is kernel:
+        reach = len(args[0]) // 2
+    elif filt is blurred or filt is sharpened:
+        reach = args[0] // 2
+    elif filt is edges:
+        reach = 1
+    elif filt is inverted:
+        reach = 0
+    else:
+        raise ValueError('cannot tell how far this filter looks from each pixel')
+    filter_tiled(lambda image: filt(image, *args), reach, source, target, size)
 
 # HELPER FUNCTIONS FOR LOADING AND SAVING IMAGES
 
-def load_image(filename):
+def load_image(filename, region=None):
     """
     Loads an image from the given file and returns a dictionary
-    representing that image.  This also performs conversion to greyscale.
+    representing that image.  This also performs conversion to greyscale.  If
+    region is given as (top, left, height, width), only that part of the
+    image is loaded.
 
     Invoked as, for example:
        i = load_image('test_images/cat.png')
     """
-    with open(filename, 'rb') as img_handle:
-        img = Image.open(img_handle)
-        img_data = img.getdata()
-        if img.mode.startswith('RGB'):
-            pixels = [round(.299 * p[0] + .587 * p[1] + .114 * p[2])
-                      for p in img_data]
-        elif img.mode == 'LA':
-            pixels = [p[0] for p in img_data]
-        elif img.mode == 'L':
-            pixels = list(img_data)
-        else:
-            raise ValueError('Unsupported image mode: %r' % img.mode)
-        w, h = img.size
-        return {'height': h, 'width': w, 'pixels': pixels}
+    return read_greyscale(filename, region)
 
 
 def save_image(image, filename, mode='PNG'):
@@ -283,13 +269,7 @@ def save_image(image, filename, mode='PNG'):
     filename is given as a file-like object, the file type will be determined
     by the 'mode' parameter.
     """
-    out = Image.new(mode='L', size=(image['width'], image['height']))
-    out.putdata(image['pixels'])
-    if isinstance(filename, str):
-        out.save(filename)
-    else:
-        out.save(filename, mode)
-    out.close()
+    write_image(image, filename, mode)
 
 
 if __name__ == '__main__':
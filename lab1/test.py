@@ -222,6 +222,187 @@ def test_edges_centered_pixel():
     compare_images(result, expected)
 
 
+def direct_correlation(image, kernel):
+    # the plain per-tap definition of correlation, with clamped edges
+    h, w = image['height'], image['width']
+    offsets = range(-((len(kernel) - 1) // 2), 1 + len(kernel) // 2)
+    pixels = []
+    for x in range(h):
+        for y in range(w):
+            new = 0
+            for dx, row in zip(offsets, kernel):
+                for dy, k in zip(offsets, row):
+                    new += image['pixels'][min(max(x + dx, 0), h - 1) * w + min(max(y + dy, 0), w - 1)] * k
+            pixels.append(new)
+    return {'height': h, 'width': w, 'pixels': pixels}
+
+
+def test_fast_box_filters():
+    # box filters use running sums and separable kernels two 1-D passes;
+    # both must round exactly like the direct computation, including ties
+    im = {
+        'height': 5,
+        'width': 7,
+        'pixels': [(37 * i * i + 11 * i) % 256 for i in range(35)],
+    }
+    halves = {'height': 4, 'width': 3, 'pixels': [0, 2, 0, 2, 0, 2, 1, 3, 5, 255, 0, 254]}
+    for image in (im, halves):
+        original = object_hash(image)
+        for n in range(1, 7):
+            box = [[1/(n**2)] * n for _ in range(n)]
+            sharp = [[-1/(n**2)] * n for _ in range(n)]
+            sharp[(n-1)//2][(n-1)//2] += 2
+            compare_images(lab.blurred(image, n), lab.round_and_clip_image(direct_correlation(image, box)))
+            compare_images(lab.sharpened(image, n), lab.round_and_clip_image(direct_correlation(image, sharp)))
+        sobel = [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]
+        assert lab.correlate(image, sobel) == direct_correlation(image, sobel)
+        assert object_hash(image) == original, "Be careful not to modify the original image!"
+
+
+def test_padded_correlation():
+    # kernels that cannot be separated go through the padded buffer, which
+    # adds up the same products in the same order as the direct definition
+    import correlation
+    im = {
+        'height': 6,
+        'width': 4,
+        'pixels': [(53 * i + 7) % 256 for i in range(24)],
+    }
+    kernels = [
+        [[0.0, 0.2, 0.0], [0.2, 0.2, 0.2], [0.0, 0.2, 0.0]],
+        [[1, -2, 0, 3], [0, 1, 1, 0], [2, 0, 0, -1], [0, 0, 5, 1]],
+        [[(3 * i + j) % 7 / 10 - 0.3 for j in range(7)] for i in range(7)],
+    ]
+    numpy = correlation.numpy
+    try:
+        for mode in (numpy, None):
+            correlation.numpy = mode
+            for k in kernels:
+                result = lab.correlate(im, k)
+                expected = direct_correlation(im, k)
+                assert result == expected
+                assert [type(p) for p in result['pixels']] == [type(p) for p in expected['pixels']]
+    finally:
+        correlation.numpy = numpy
+
+
+def test_fft_correlation():
+    # large kernels go through the FFT; edges behave as in correlate and the
+    # rounded results are the same as the direct ones
+    import correlation
+    im = {
+        'height': 12,
+        'width': 9,
+        'pixels': [(29 * i * i + 3 * i) % 256 for i in range(108)],
+    }
+    n = 17
+    smooth = [[((i * n + j) % 5 + 1) / (3 * n * n) for j in range(n)] for i in range(n)]
+    halves = [[0.5 if (i + j) % 2 else 0.25 for j in range(n)] for i in range(n)]
+    integral = [[(i * j) % 3 - 1 for j in range(n)] for i in range(n)]
+    assert correlation.prefer_fft({'height': 1000, 'width': 1000}, [[0.01] * 31] * 31)
+    assert not correlation.prefer_fft({'height': 1000, 'width': 1000}, [[1, 0, 0], [0, 2, 0], [0, 0, 1]])
+    numpy = correlation.numpy
+    try:
+        for mode in (numpy, None):
+            correlation.numpy = mode
+            for k in (smooth, halves):
+                compare_images(lab.round_and_clip_image(correlation.correlate_fft(im, k)),
+                               lab.round_and_clip_image(direct_correlation(im, k)))
+            assert correlation.correlate_fft(im, integral) == direct_correlation(im, integral)
+    finally:
+        correlation.numpy = numpy
+
+
+def test_packed_images():
+    # array-backed images round-trip through dictionaries and can be passed
+    # to the filters in place of them
+    from images import PackedImage
+    im = {
+        'height': 6,
+        'width': 7,
+        'pixels': [(13 * i * i + 5 * i) % 256 for i in range(42)],
+    }
+    packed = PackedImage.from_dict(im)
+    assert packed.planes[0].typecode == 'B'
+    assert packed.to_dict() == im and packed == im
+    assert bytes(packed.row(2)[0]) == bytes(im['pixels'][14:21])
+    for filt in (lab.inverted, lambda i: lab.blurred(i, 3), lambda i: lab.sharpened(i, 3), lab.edges):
+        compare_images(filt(packed), filt(im))
+    unrounded = PackedImage.from_dict(lab.correlate(im, [[0, 0.5, 0], [0, 0, 0], [0, 0, -0.25]]))
+    assert unrounded.planes[0].typecode == 'd'
+
+
+def test_image_files(tmp_path):
+    # raw-byte saving and loading round-trips, and a region of the file is
+    # the same part of the whole image
+    im = {
+        'height': 9,
+        'width': 11,
+        'pixels': [(37 * i + 11) % 256 for i in range(99)],
+    }
+    fname = str(tmp_path / 'grey.png')
+    lab.save_image(im, fname)
+    compare_images(lab.load_image(fname), im)
+    region = lab.load_image(fname, (2, 3, 4, 5))
+    assert region['height'] == 4 and region['width'] == 5
+    assert region['pixels'] == [im['pixels'][x * 11 + y] for x in range(2, 6) for y in range(3, 8)]
+
+
+def test_fused_edges():
+    # the single-pass Sobel magnitude is the same as correlating with both
+    # kernels and combining them, with and without NumPy and for float images
+    import math
+    import correlation
+    Kx = [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]
+    Ky = [[-1, -2, -1], [0, 0, 0], [1, 2, 1]]
+    images = [
+        {'height': 7, 'width': 6, 'pixels': [(71 * i * i + 13 * i) % 256 for i in range(42)]},
+        {'height': 4, 'width': 9, 'pixels': [((i * 7) % 10) * 1.25 - 3 for i in range(36)]},
+    ]
+    numpy = correlation.numpy
+    try:
+        for mode in (numpy, None):
+            correlation.numpy = mode
+            for im in images:
+                ox, oy = direct_correlation(im, Kx), direct_correlation(im, Ky)
+                magnitude = [round(math.sqrt(x**2 + y**2)) for x, y in zip(ox['pixels'], oy['pixels'])]
+                assert lab.edges(im, clip=False)['pixels'] == magnitude
+                assert lab.edges(im)['pixels'] == [min(v, 255) for v in magnitude]
+    finally:
+        correlation.numpy = numpy
+
+
+def test_tiled_filters(tmp_path):
+    # filtering a raw image a tile at a time gives the same pixels as
+    # filtering the whole image
+    from tiles import RawImage, filter_tiled
+    from imagefiles import image_to_raw, raw_to_image
+    im = {
+        'height': 23,
+        'width': 31,
+        'pixels': [(i * 97) % 256 if i % 5 else (i * 13) % 200 for i in range(713)],
+    }
+    lab.save_image(im, str(tmp_path / 'im.png'))
+    assert image_to_raw(str(tmp_path / 'im.png'), str(tmp_path / 'im.raw'), strip=4) == (23, 31)
+    with RawImage(str(tmp_path / 'im.raw'), 23, 31) as source:
+        compare_images(source.read(0, 0, 23, 31), im)
+        kern = [[0, 0, 0], [0.5, 0, 0], [0, 0, 0.5]]
+        for filt, args, reach in ((lab.blurred, (5,), 2), (lab.sharpened, (4,), 2),
+                                  (lab.edges, (), 1), (lab.kernel, (kern,), 1)):
+            with RawImage(str(tmp_path / 'out.raw'), 23, 31, create=True) as target:
+                filter_tiled(lambda image: filt(image, *args), reach, source, target, 8)
+                compare_images(target.read(0, 0, 23, 31), filt(im, *args))
+            with RawImage(str(tmp_path / 'out.raw'), 23, 31, create=True) as target:
+                lab.tiled_filter(filt, source, target, *args, size=6)
+                compare_images(target.read(0, 0, 23, 31), filt(im, *args))
+            with RawImage(str(tmp_path / 'out.raw'), 23, 31, create=True) as target:
+                lab.tiled_filter(filt, source, target, *args)
+        raw_to_image(str(tmp_path / 'out.raw'), 23, 31, str(tmp_path / 'out.png'))
+        compare_images(lab.load_image(str(tmp_path / 'out.png')), lab.kernel(im, kern))
+    with pytest.raises(ValueError):
+        RawImage(str(tmp_path / 'im.raw'), 23, 30)
+
+
 if __name__ == '__main__':
     import sys
     import json
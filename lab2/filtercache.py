@@ -0,0 +1,289 @@
+"""
+A cache of filter results, keyed by the content of the images.
+
+The same source images tend to go through the same filters (a cascade, a
+blur of a given size, seam carving by some number of columns) over and
+over.  ResultCache remembers what each filter made of each image, under a
+key that is a hash of:
+
+    * the image's size and pixels, packed into bytes (one byte per value
+      when they are all ints from 0 to 255, otherwise a double each), so
+      equal images give equal keys however their pixels are held
+    * a description of the filter (see filter_spec): its kernel for filters
+      that correlate with one, the filters of a cascade, the name and a
+      digest of the code of a module-level function such as edges or inverted
+    * CACHE_VERSION, which is to be increased whenever a change to this
+      code or to the helpers a filter calls changes what filters compute,
+      since the digest of a function's code does not cover the functions it
+      calls
+
+Filters that cannot be described (closures without a known kernel) are just
+applied, without caching.
+
+The most recently used results are kept in memory, and, if the cache is
+given a directory, every result is also written there (pickled, one file per
+key), so later processes can use it.  The directory is kept under a size cap
+by deleting the least recently used files first.  The files are pickles, and
+unpickling one runs whatever code it asks for, so only give ResultCache a
+directory that no one untrusted can write to.
+
+For seam carving, the cache remembers the seams themselves (as plan_seams
+returns them, in columns of the original image) rather than the carved
+images: carving 50 columns from an image whose first 40 seams are known
+only looks for 10 more, and any number of columns up to what is known is
+removed in a single pass with apply_seams.
+"""
+
+import os
+import pickle
+import hashlib
+import tempfile
+from array import array
+from collections import OrderedDict
+from itertools import chain
+
+from seams import plan_seams, apply_seams
+
+
+# increase this when stored results are no longer what the filters compute
+CACHE_VERSION = 1
+
+
+def _value_bytes(values):
+    # the values packed into bytes, with a tag saying how
+    if isinstance(values, array) and values.typecode == 'B':
+        return b'B' + values.tobytes()
+    if not isinstance(values, array):
+        try:
+            return b'B' + bytes(values)
+        except (TypeError, ValueError):
+            pass
+    return b'd' + array('d', values).tobytes()
+
+
+def image_digest(image, spec=()):
+    """
+    Return a hex digest of the given image's size and pixels, together with
+    the given (repr-able) filter description.
+    """
+    pixels = image['pixels']
+    digest = hashlib.blake2b(digest_size=20)
+    digest.update(b'v%d %d %d ' % (CACHE_VERSION, image['height'], image['width']))
+    if len(pixels) and isinstance(pixels[0], tuple):
+        digest.update(b'color ' + _value_bytes(list(chain.from_iterable(pixels))))
+    else:
+        digest.update(b'grey ' + _value_bytes(pixels))
+    digest.update(repr(spec).encode())
+    return digest.hexdigest()
+
+
+def _code_digest(code, digest):
+    # add the instructions, names and constants of a code object (and of the
+    # code objects of any functions defined in it) to the given digest
+    digest.update(code.co_code)
+    digest.update(repr(code.co_names).encode())
+    for const in code.co_consts:
+        if hasattr(const, 'co_code'):
+            _code_digest(const, digest)
+        elif isinstance(const, frozenset):
+            # whose order changes with the hash seed
+            digest.update(repr(sorted(map(repr, const))).encode())
+        else:
+            digest.update(repr(const).encode())
+
+
+def function_digest(func):
+    """
+    Return a hex digest of the code and default arguments of the given
+    function, which changes when the function is edited.
+    """
+    digest = hashlib.blake2b(digest_size=12)
+    _code_digest(func.__code__, digest)
+    digest.update(repr((func.__defaults__, func.__kwdefaults__)).encode())
+    return digest.hexdigest()
+
+
+def filter_spec(filt):
+    """
+    Return a description of what the given filter computes, which is the
+    same for any two filters giving the same results, or None if that is not
+    known.
+    """
+    filt = getattr(filt, '__wrapped__', filt)
+    kernels = getattr(filt, 'kernels', None)
+    if kernels is not None:
+        # a merged correlation, which differs from its composed kernel at the
+        # edges of the image
+        return ('merged', tuple(tuple(map(tuple, k)) for k in kernels))
+    kernel = getattr(filt, 'kernel', None)
+    if kernel is not None:
+        return ('kernel', tuple(map(tuple, kernel)))
+    greyscale = getattr(filt, 'greyscale', None)
+    if greyscale is not None:
+        spec = filter_spec(greyscale)
+        return None if spec is None else ('color', spec)
+    filters = getattr(filt, 'filters', None)
+    if filters is not None:
+        specs = tuple(filter_spec(f) for f in filters)
+        return None if None in specs else ('cascade', getattr(filt, 'exact', True), specs)
+    name = getattr(filt, '__qualname__', '')
+    if getattr(filt, '__closure__', True) is None and '<' not in name:
+        return ('function', filt.__module__, name, function_digest(filt))
+    return None
+
+
+def _copy(image):
+    # a new image dictionary, so that callers cannot change a cached one
+    return {'height': image['height'], 'width': image['width'], 'pixels': list(image['pixels'])}
+
+
+class ResultCache:
+    """
+    A cache of filter results (see the module docstring).
+
+    Parameters:
+        * directory (str or None): where to keep results on disk; if None,
+                                   results are only kept in memory.  It must
+                                   be trusted, as its files are unpickled
+        * memory_items (int): how many results to keep in memory
+        * disk_bytes (int): how many bytes of files to keep in directory
+    """
+    def __init__(self, directory=None, memory_items=32, disk_bytes=1 << 30):
+        self.directory = directory
+        self.memory_items = memory_items
+        self.disk_bytes = disk_bytes
+        self.memory = OrderedDict()
+        if directory is not None:
+            os.makedirs(directory, exist_ok=True)
+
+    # STORAGE
+
+    def _path(self, key):
+        return os.path.join(self.directory, key + '.pickle')
+
+    def get(self, key, default=None):
+        """
+        Return the value stored under the given key, or default.
+        """
+        if key in self.memory:
+            self.memory.move_to_end(key)
+            return self.memory[key]
+        if self.directory is None:
+            return default
+        path = self._path(key)
+        try:
+            with open(path, 'rb') as f:
+                value = pickle.load(f)
+        except (OSError, EOFError, pickle.UnpicklingError):
+            return default
+        try:
+            os.utime(path)  # the file's time marks when it was last used
+        except OSError:
+            pass  # deleted by another process since; the value is still good
+        self._remember(key, value)
+        return value
+
+    def put(self, key, value):
+        """
+        Store the given value under the given key.
+        """
+        self._remember(key, value)
+        if self.directory is None:
+            return
+        # written to a temporary file first, so that no one reads half a file
+        handle, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(handle, 'wb') as f:
+            pickle.dump(value, f, pickle.HIGHEST_PROTOCOL)
+        os.replace(temp, self._path(key))
+        self._evict()
+
+    def _remember(self, key, value):
+        self.memory[key] = value
+        self.memory.move_to_end(key)
+        while len(self.memory) > self.memory_items:
+            self.memory.popitem(last=False)
+
+    def _evict(self):
+        # delete the least recently used files until the rest fit the cap
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.name.endswith('.pickle'):
+                stat = entry.stat()
+                files.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in files)
+        for _, size, path in sorted(files):
+            if total <= self.disk_bytes:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+
+    def clear(self):
+        """
+        Forget every stored value, in memory and on disk.
+        """
+        self.memory.clear()
+        if self.directory is not None:
+            for entry in os.scandir(self.directory):
+                if entry.name.endswith('.pickle'):
+                    os.remove(entry.path)
+
+    # FILTERS
+
+    def apply(self, filt, image):
+        """
+        Return the result of applying the given filter to the given image,
+        computing it only if it is not already stored.
+        """
+        spec = filter_spec(filt)
+        if spec is None:
+            return filt(image)
+        key = image_digest(image, spec)
+        result = self.get(key)
+        if result is None:
+            result = _copy(filt(image))
+            self.put(key, result)
+        return _copy(result)
+
+    def cached(self, filt):
+        """
+        Return a filter giving the same results as the given one, through
+        this cache.
+        """
+        def cached_filter(image):
+            return self.apply(filt, image)
+
+        cached_filter.__dict__.update(filt.__dict__)
+        cached_filter.__wrapped__ = filt
+        return cached_filter
+
+    def seams(self, image, count):
+        """
+        Return the first `count` seams seam_carving would remove from the
+        given image, as plan_seams does, finding only those not already
+        stored.
+        """
+        key = image_digest(image, ('seams',))
+        known = self.get(key, [])
+        if len(known) >= count:
+            return known[:count]
+        # carve the known seams out and keep carving the result, remembering
+        # which column of the original image each remaining pixel came from
+        carved = apply_seams(image, known)
+        origin = [list(range(image['width'])) for _ in range(image['height'])]
+        for x, row in enumerate(origin):
+            for y in sorted((seam[x] for seam in known), reverse=True):
+                del row[y]
+        more = plan_seams(carved, count - len(known))
+        known = known + [[origin[x][y] for x, y in enumerate(seam)] for seam in more]
+        self.put(key, known)
+        return known
+
+    def seam_carving(self, image, ncols):
+        """
+        Return the same image as seam_carving(image, ncols), using and
+        extending the stored seams of the image.
+        """
+        return apply_seams(image, self.seams(image, ncols))
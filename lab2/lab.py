@@ -1,9 +1,20 @@
 #!/usr/bin/env python3
 
-# NO ADDITIONAL IMPORTS!
-# (except in the last part of the lab; see the lab writeup for details)
-import math
-from PIL import Image
+import os
+import sys
+
+# the modules shared between the labs are in ../common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+from correlation import (separate_kernel, correlate_separable, correlate_padded,
+                         correlate_fft, prefer_fft, is_integer_image, box_filtered,
+                         sobel)
+from parallel import filter_channels
+from seams import (SeamCarver, plan_seams, apply_seams, cumulative_energy, trace_seam,
+                   retarget)
+from images import PackedImage
+from tiles import filter_tiled, TILE
+from imagefiles import read_color, read_greyscale, write_image
 
 
 # GRAYSCALE FILTERS
@@ -89,35 +100,17 @@ def correlate(image, kernel):
 
     A kernel is represented as an n x n matrix. 
     """
-    def kernel_calc(pixel, x, y, kernel):
-        """
-        Compute and return the new color of a pixel of an image given its position and a kernel.
-        """
-        new = 0; 
-        kernel_size = len(kernel)
-        # Relative positions to current pixel
-        offset = range(-((kernel_size - 1) // 2), 1 + kernel_size // 2)
-        
-        # Absolute positions in the kernel
-        kernel_index = range(kernel_size)
-        
-        for dx, kx in zip(offset, kernel_index):
-            for dy, ky in zip(offset, kernel_index):
-                new += handel_out_of_bound(image, x+dx, y+dy) * kernel[kx][ky]
-        return new
- 
-    result = {
-        'height': image['height'],
-        'width': image['width'],
-        'pixels': [],
-    }
-    
-    for x in range(image['height']):
-        for y in range(image['width']): 
-            color = get_pixel(image, x, y) 
-            newcolor = kernel_calc(color, x, y, kernel)
-            set_pixel(result, newcolor)
-    return result
+    factors = separate_kernel(kernel)
+    if factors is not None:
+        # two 1-D passes: O(n) work per pixel instead of O(n**2)
+        return correlate_separable(image, kernel, *factors)
+
+    if prefer_fft(image, kernel):
+        # large kernels: the cost per pixel no longer grows with the kernel
+        return correlate_fft(image, kernel)
+
+    # one tap at a time over an edge-extended copy of the image
+    return correlate_padded(image, kernel)
 
 
 def round_and_clip_image(image):
@@ -146,6 +139,28 @@ def round_and_clip_image(image):
     return apply_per_pixel(image, rules)
 
 
+def blur_kernel(n):
+    """
+    Return the n-by-n box blur kernel.
+    """
+    return [[1/(n**2)] * n for _ in range(n)]
+
+
+def sharpen_kernel(n):
+    """
+    Return the n-by-n sharpen kernel: twice the identity minus the box blur.
+    """
+    # compute 'minus blurred version' kernel
+    kernel = [[-1/(n**2)] * n for _ in range(n)]
+
+    # find the center pixel of kernel 
+    k_center = (n-1)//2
+
+    # this operation is as if adding 2 identity kernel to 'minus blurred version' kernel
+    kernel[k_center][k_center] += 2 
+    return kernel
+
+
 def blurred(image, n):
     """
     Return a new image representing the result of applying a box blur (with
@@ -156,7 +171,11 @@ def blurred(image, n):
     """
 
     # create a representation for the appropriate n-by-n kernel 
-    kernel = [[1/(n**2)] * n for _ in range(n)]
+    kernel = blur_kernel(n)
+
+    if is_integer_image(image):
+        # running window sums give the same pixels in constant time per pixel
+        return box_filtered(image, n, kernel)
 
     # compute the correlation of the input image with that kernel
     result = correlate(image, kernel)
@@ -172,14 +191,11 @@ def sharpened(image, n):
     Return a new image representing the result of applying a sharpen effect (with
     kernel size n) to the input image.
     """
-    # compute 'minus blurred version' kernel
-    kernel = [[-1/(n**2)] * n for _ in range(n)]
+    kernel = sharpen_kernel(n)
 
-    # find the center pixel of kernel 
-    k_center = (n-1)//2
-
-    # this operation is as if adding 2 identity kernel to 'minus blurred version' kernel
-    kernel[k_center][k_center] += 2 
+    if is_integer_image(image):
+        # 2 * pixel minus the box sum, in constant time per pixel
+        return box_filtered(image, n, kernel, scale=-1, center=2)
 
     # then compute the correlation of the input image with the computed kernel
     result = correlate(image, kernel)
@@ -190,36 +206,17 @@ def sharpened(image, n):
     return result 
 
 
-def edges(image):
+def edges(image, clip=True):
     """
     Detect the edges in a given image. 
     Return a new image resulting from a series of operations where the edges are emphasized. 
-    """
-    # kernel Kx 
-    Kx=[[-1,0,1],
-        [-2,0,2],
-        [-1,0,1]]
-    # kernel Ky 
-    Ky=[[-1,-2,-1],
-        [0, 0, 0],
-        [1, 2, 1]]
-    # compute Ox and Oy by correlating the input with Kx and Ky respectively 
-    Ox = correlate(image, Kx)
-    Oy = correlate(image, Ky)
-
-    result = {
-        'height': image['height'],
-        'width': image['width'],
-        'pixels': [],
-    }
-
-    # each pixel of the output is the square root of the sum of squares of corresponding pixels in Ox and Oy
-    for x, y in zip(Ox['pixels'], Oy['pixels']):
-        Oxy = round(math.sqrt(x**2 + y**2))
-        set_pixel(result, Oxy)
 
-    result = round_and_clip_image(result)
-    return result
+    Each pixel of the output is the square root of the sum of squares of the
+    correlations of the input with the Sobel kernels Kx and Ky, rounded (and
+    clipped to 255, unless clip is False); both correlations and the
+    magnitude are computed together in a single pass over the image.
+    """
+    return sobel(image, clip)
 
 
 # HELPER FUNCTIONS 
@@ -230,6 +227,10 @@ def separate(color_im):
     Split a given color image into three separate grey scale images.
     Return a list of three separated image in the order of [R, G, B]. 
     """
+    if isinstance(color_im, PackedImage):
+        # the channels are views of the image's planes
+        return color_im.channels()
+
     height = color_im['height']
     width = color_im['width']
     red, green, blue = [], [], [] # store the pixels of each color 
@@ -267,6 +268,9 @@ def combine(red_im, green_im, blue_im):
     Combine three greyscale images into a single new color image. 
     Return a new combined image. 
     """
+    if all(isinstance(im, PackedImage) for im in (red_im, green_im, blue_im)):
+        return PackedImage.combine(red_im, green_im, blue_im)
+
     combined = []
     for red, green, blue in zip(red_im['pixels'], green_im['pixels'], blue_im['pixels']):
         color_pixel = (red, green, blue)
@@ -299,9 +303,74 @@ def color_filter_from_greyscale_filter(filt):
         combined = combine(red_filt, green_filt, blue_filt)
         return combined
 
+    # lets filter_cascade run several of these on each channel in turn
+    color_filt.greyscale = filt
     return color_filt
 
 
+def filter_reach(filt):
+    """
+    Return how many pixels away from each pixel a greyscale filter looks, or
+    None if that is not known.
+    """
+    kernel = getattr(filt, 'kernel', None)
+    if kernel is not None:
+        return len(kernel) // 2
+    if filt is edges:
+        return 1
+    if filt is inverted:
+        return 0
+    return None
+
+
+def parallel_color_filter(filt, processes=None):
+    """
+    Like color_filter_from_greyscale_filter, but the returned function filters
+    the three channels (split into horizontal tiles, when the filter's reach
+    is known) on a pool of `processes` worker processes (by default, one per
+    core).  The greyscale filter must not change the size of the image.
+    """
+    reach = filter_reach(filt)
+
+    def color_filt(color_im):
+        height, width = color_im['height'], color_im['width']
+        channels = [im['pixels'] for im in separate(color_im)]
+        filtered = filter_channels(channels, height, width, filt, reach, processes)
+        return combine(*({'height': height, 'width': width, 'pixels': pixels} for pixels in filtered))
+
+    color_filt.greyscale = filt
+    return color_filt
+
+
+def tiled_filter(filt, source, target, *args, size=TILE):
+    """
+    Apply a filter, called with the given further arguments, to the
+    RawImage source (see tiles.py) a tile of at most size-by-size pixels at
+    a time, writing the result into the RawImage target.  The filter is
+    either blurred, sharpened or edges with its arguments, or a greyscale
+    filter whose reach is known (see filter_reach) or a color filter made
+    from one.
+
+    Invoked as, for example:
+       tiled_filter(blurred, source, target, 5)
+       tiled_filter(make_blur_filter(5), source, target)
+    """
+    if not args:
+        reach = filter_reach(getattr(filt, 'greyscale', filt))
+    elif filt is blurred or filt is sharpened:
+        reach = args[0] // 2
+    elif filt is edges:
+        reach = 1
+    else:
+        reach = None
+    if reach is None:
+        raise ValueError('cannot tell how far this filter looks from each pixel')
+    if args:
+        filter_tiled(lambda image: filt(image, *args), reach, source, target, size)
+    else:
+        filter_tiled(filt, reach, source, target, size)
+
+
 def make_blur_filter(n):
     """
     Takes the parameter n and returns a blur filter which takes a single image as argument
@@ -309,6 +378,7 @@ def make_blur_filter(n):
     def blur_filter(image):
         return blurred(image, n)
 
+    blur_filter.kernel = blur_kernel(n)
     return blur_filter
 
 
@@ -319,20 +389,244 @@ def make_sharpen_filter(n):
     def sharp_filter(image):
         return sharpened(image, n)
 
+    sharp_filter.kernel = sharpen_kernel(n)
     return sharp_filter
 
 
-def filter_cascade(filters):
+def crop(image, top, left, height, width):
+    """
+    Return the height-by-width part of the image whose top left pixel is at
+    (top, left).
+    """
+    pixels = []
+    for x in range(top, top + height):
+        start = x * image['width'] + left
+        pixels.extend(image['pixels'][start:start + width])
+    return {'height': height, 'width': width, 'pixels': pixels}
+
+
+def make_merged_filter(kernels):
+    """
+    Takes a list of kernels and returns a filter correlating a single image
+    with each in turn, without rounding or clipping in between, as a single
+    correlation with the composed kernel (rounding and clipping the result).
+    """
+    combined = kernels[0]
+    for k in kernels[1:]:
+        combined = compose_kernels(combined, k)
+    # how far each output pixel reaches above/left and below/right
+    before = sum((len(k) - 1) // 2 for k in kernels)
+    after = sum(len(k) // 2 for k in kernels)
+
+    def chained(image):
+        for k in kernels:
+            image = correlate(image, k)
+        return image
+
+    def merged_filter(image):
+        height, width = image['height'], image['width']
+        result = correlate(image, combined)
+        pixels = result['pixels']
+
+        # near the edges, clamping at every stage is not the same as clamping
+        # once: compute those bands stage by stage, from crops just big
+        # enough that their cut edges do not reach the band
+        reach = before + after
+        bands = (
+            (0, 0, min(height, reach), width, 0, min(height, before), 0, width),
+            (max(0, height - reach), 0, min(height, reach), width,
+             max(0, height - after), height, 0, width),
+            (0, 0, height, min(width, reach), 0, height, 0, min(width, before)),
+            (0, max(0, width - reach), height, min(width, reach),
+             0, height, max(0, width - after), width),
+        )
+        for top, left, h, w, x0, x1, y0, y1 in bands:
+            if x0 >= x1 or y0 >= y1:
+                continue
+            part = chained(crop(image, top, left, h, w))['pixels']
+            for x in range(x0, x1):
+                start = (x - top) * w - left
+                pixels[x * width + y0:x * width + y1] = part[start + y0:start + y1]
+        return round_and_clip_image(result)
+
+    merged_filter.kernel = combined
+    merged_filter.kernels = kernels
+    return merged_filter
+
+
+def make_kernel_filter(kernel):
+    """
+    Takes a kernel and returns a filter correlating a single image with it
+    (rounding and clipping the result).
+    """
+    def kernel_filter(image):
+        return round_and_clip_image(correlate(image, kernel))
+
+    kernel_filter.kernel = kernel
+    return kernel_filter
+
+
+def compose_kernels(first, second):
+    """
+    Return a single kernel whose correlation with an image is the same as
+    correlating with `first` and then with `second`, away from the edges of
+    the image (without rounding in between).
+    """
+    taps = {}
+    size1, size2 = len(first), len(second)
+    offsets1 = range(-((size1 - 1) // 2), 1 + size1 // 2)
+    offsets2 = range(-((size2 - 1) // 2), 1 + size2 // 2)
+    for dx2, row2 in zip(offsets2, second):
+        for dy2, k2 in zip(offsets2, row2):
+            if k2 == 0:
+                continue
+            for dx1, row1 in zip(offsets1, first):
+                for dy1, k1 in zip(offsets1, row1):
+                    if k1 == 0:
+                        continue
+                    key = (dx1 + dx2, dy1 + dy2)
+                    taps[key] = taps.get(key, 0) + k1 * k2
+    taps = {key: k for key, k in taps.items() if k != 0} or {(0, 0): 0}
+    # the smallest kernel whose offsets (see correlate) cover every tap
+    before = max(0, -min(min(key) for key in taps))
+    after = max(0, max(max(key) for key in taps))
+    size = max(2 * before + 1, 2 * after)
+    center = (size - 1) // 2
+    kernel = [[0] * size for _ in range(size)]
+    for (dx, dy), k in taps.items():
+        kernel[center + dx][center + dy] = k
+    return kernel
+
+
+def plan_cascade(filters, exact=True):
+    """
+    Compile a list of filters into a list of steps for filter_cascade.  Each
+    step is either ('color', greyscale filters), a run of filters made by
+    color_filter_from_greyscale_filter, to be applied to each channel in turn
+    between a single separate and combine, or ('any', filter) for a filter
+    that has to see the whole image.
+
+    Filters from make_blur_filter, make_sharpen_filter and make_kernel_filter
+    correlate with a known kernel.  Adjacent ones are merged into a single
+    correlation with the composed kernel (see make_merged_filter) wherever
+    skipping the rounding and clipping between them cannot change the
+    result:
+
+        * correlations with the identity kernel right after a stage that
+          already rounds and clips are dropped
+        * a correlation that only moves pixels (a kernel with a single tap
+          of 1, like translation_kernel) is merged into the correlation
+          before it, since rounding and clipping each pixel commutes with
+          moving it, and into the one after it when its own input is already
+          rounded and clipped, since it then produces rounded, clipped
+          pixels itself
+
+    Unless `exact` is True, adjacent correlations with no negative taps
+    (such as blurs) are merged too: clipping between them could not change
+    anything, but skipping the rounding between them can change some pixels
+    by one or so.
+    """
+    steps = []
+    for filt in filters:
+        if hasattr(filt, 'greyscale'):
+            if steps and steps[-1][0] == 'color':
+                steps[-1][1].append(filt.greyscale)
+            else:
+                steps.append(('color', [filt.greyscale]))
+        else:
+            steps.append(('any', filt))
+
+    def simplify(stages):
+        out = []
+        for f in stages:
+            kernel = getattr(f, 'kernel', None)
+            if kernel is not None and out and _rounds(out[-1]) and _is_identity(kernel):
+                # the image from the previous stage is already rounded and
+                # clipped, which is all an identity correlation would do
+                continue
+            if out and _merges_exactly(out, f) or \
+                    not exact and _mergeable(f) and out and _mergeable(out[-1]):
+                kernels = getattr(out[-1], 'kernels', [out[-1].kernel]) + [kernel]
+                out[-1] = make_merged_filter(kernels)
+                out[-1].kernels = kernels
+            else:
+                out.append(f)
+        return out
+
+    return [(kind, simplify(payload) if kind == 'color' else payload) for kind, payload in steps]
+
+
+def _mergeable(filt):
+    # correlations that keep [0, 255] images within [0, 255], so that only
+    # the rounding between them is skipped when they are merged
+    kernel = getattr(filt, 'kernel', None)
+    return (kernel is not None
+            and all(k >= 0 for row in kernel for k in row)
+            and sum(k for row in kernel for k in row) <= 1 + 1e-12)
+
+
+def _kernels(filt):
+    # the kernels a filter correlates with in turn, or None if not known
+    kernel = getattr(filt, 'kernel', None)
+    return None if kernel is None else getattr(filt, 'kernels', [kernel])
+
+
+def _moves_pixels(filt):
+    # True for correlations that only pick one pixel for each output pixel
+    kernels = _kernels(filt)
+    return kernels is not None and all(
+        sorted(k for row in kernel for k in row if k != 0) == [1] for kernel in kernels)
+
+
+def _merges_exactly(stages, filt):
+    # True if filt can be merged into the last of the stages before it
+    # without changing the result (see plan_cascade)
+    if _kernels(filt) is None or _kernels(stages[-1]) is None:
+        return False
+    if _moves_pixels(filt):
+        return True
+    return _moves_pixels(stages[-1]) and len(stages) > 1 and _rounds(stages[-2])
+
+
+def _rounds(filt):
+    # True for filters whose output is always rounded and clipped
+    return hasattr(filt, 'kernel') or filt is edges
+
+
+def _is_identity(kernel):
+    center = (len(kernel) - 1) // 2
+    return all(k == (1 if (i, j) == (center, center) else 0)
+               for i, row in enumerate(kernel) for j, k in enumerate(row))
+
+
+def filter_cascade(filters, exact=True):
     """
     Given a list of filters (implemented as functions on images), returns a new
     single filter such that applying that filter to an image produces the same
     output as applying each of the individual ones in turn.
+
+    Consecutive color filters made from greyscale ones split the image into
+    channels once, run all their greyscale filters on each channel, and
+    combine once (see plan_cascade; `exact=False` also merges adjacent
+    correlations).
     """
+    steps = plan_cascade(filters, exact)
+
     def cascade (image):
-        new = dict(image)
-        for f in filters:
-            new = f(new)
+        new = image
+        for kind, payload in steps:
+            if kind == 'color':
+                channels = separate(new)
+                for f in payload:
+                    channels = [f(channel) for channel in channels]
+                new = combine(*channels)
+            else:
+                new = payload(new)
         return new
+
+    # what the cascade is made of, for caching its results
+    cascade.filters = list(filters)
+    cascade.exact = exact
     return cascade 
 
 
@@ -346,23 +640,12 @@ def seam_carving(image, ncols):
     Starting from the given image, use the seam carving technique to remove
     ncols (an integer) columns from the image.
     """
-    new = {
-        'height': image['height'],
-        'width': image['width'],
-        'pixels': image['pixels'][:],
-    }
-    
-    i = 0
-    while i < ncols: # befoer enough number of columns are removed
-        grey = greyscale_image_from_color_image(new)
-        energy = compute_energy(grey)
-        cem = cumulative_energy_map(energy)
-        seam = minimum_energy_seam(cem)
-        new = image_without_seam(new, seam)
-        new['width'] -= 1
-        i+=1
-
-    return new
+    # the carver keeps the energy and cumulative energy map up to date as
+    # seams are removed, instead of recomputing them for every seam
+    carver = SeamCarver(image)
+    for _ in range(ncols):
+        carver.remove_seam()
+    return carver.image()
 
 
 # Helper Functions for Seam Carving
@@ -428,23 +711,9 @@ def cumulative_energy_map(energy):
     the values in the 'pixels' array may not necessarily be in the range [0,
     255].
     """
-    cem = {
-        'height': energy['height'],
-        'width': energy['width'],
-        'pixels': energy['pixels'][:],
-    }
-
-    for x in range(cem['height']):
-        for y in range(cem['width']): 
-            adj_value = adjacent_min(cem, x, y)
-            if adj_value: # if have adjacent pixels 
-                # set the value of current location, added to the minimum of 
-                # the cumulative energies from the "adjacent" pixels in the row above
-                current = get_pixel(cem, x, y)
-                new = current + adj_value[0]
-                index = x * cem['width'] + y 
-                cem['pixels'][index] = new
-    return cem
+    # one row at a time, from shifted copies of the row above; the result
+    # also records which pixel above each one's minimum came from
+    return cumulative_energy(energy)
 
 
 def minimum_energy_seam(cem):
@@ -453,30 +722,26 @@ def minimum_energy_seam(cem):
     'pixels' list that correspond to pixels contained in the minimum-energy
     seam (computed as described in the lab 2 writeup).
     """
-    seam = [] # store indices need to be removed
-
-    # Find the minimum value pixel in the bottom row of the cumulative energy map is located.
-    x = cem['height'] - 1 # locate bottom row
-    min_idx = x * cem['width']
-    min_y = 0
-    min_pixel = get_pixel(cem, x, 0)
-    for y in range(1, cem['width']): 
-        current = get_pixel(cem, x, y)
-        if current < min_pixel: 
-            min_pixel = current
-            min_idx = x * cem['width'] + y
-            min_y = y
-
-    seam.append(min_idx)
+    # follows the backpointers cumulative_energy_map recorded, when present
+    return trace_seam(cem)
 
-    # The seam is then traced back up to the top row of the cumulative energy map 
-    # by following the adjacent pixels with the smallest cumulative energies.  
-    while x > 0:
-        min_y = adjacent_min(cem, x, min_y)[1] # get the index of min adjacent pixel 
-        x -= 1 # move to one row above 
-        seam.append(x * cem['width'] + min_y) 
 
-    return seam
+def seam_columns(image, seam):
+    """
+    Given an image and a list of indices into its 'pixels' list, return the
+    column of the seam's pixel in each row (top row first) if there is
+    exactly one in every row, and None otherwise.
+    """
+    height, width = image['height'], image['width']
+    if len(seam) != height or width == 0:
+        return None
+    columns = [None] * height
+    for i in seam:
+        x, y = divmod(i, width)
+        if not 0 <= x < height or columns[x] is not None:
+            return None
+        columns[x] = y
+    return columns
 
 
 def image_without_seam(image, seam):
@@ -486,86 +751,113 @@ def image_without_seam(image, seam):
     pixels from the original image except those corresponding to the locations
     in the given list.
     """
-    carved = {
+    pixels = image['pixels']
+    columns = seam_columns(image, seam)
+    if columns is not None:
+        # one pixel per row: copy the parts of each row on either side of it
+        width = image['width']
+        carved = []
+        for x, y in enumerate(columns):
+            start = x * width
+            carved.extend(pixels[start:start + y])
+            carved.extend(pixels[start + y + 1:start + width])
+    else:
+        remove = set(seam)
+        carved = [p for i, p in enumerate(pixels) if i not in remove]
+
+    return {
         'height': image['height'],
-        'width': image['width'],
-        'pixels': [],
+        'width': len(carved) // image['height'] if image['height'] else image['width'],
+        'pixels': carved,
     }
-    
-    for i in range(len(image['pixels'])):
-        if i not in seam:
-            set_pixel(carved, image['pixels'][i])
-    return carved
 
 
 
 # SELF DESIGN
 def image_with_seam(image, seam):
-    added = {
+    """
+    Given a (color) image and a list of indices, return a new image in which
+    each of the pixels at those locations appears twice, side by side.
+    """
+    pixels = image['pixels']
+    columns = seam_columns(image, seam)
+    if columns is not None:
+        width = image['width']
+        added = []
+        for x, y in enumerate(columns):
+            start = x * width
+            added.extend(pixels[start:start + y + 1])
+            added.extend(pixels[start + y:start + width])
+    else:
+        double = set(seam)
+        added = []
+        for i, p in enumerate(pixels):
+            added.append(p)
+            if i in double:
+                added.append(p)
+
+    return {
         'height': image['height'],
-        'width': image['width'],
-        'pixels': [],
+        'width': len(added) // image['height'] if image['height'] else image['width'],
+        'pixels': added,
     }
-    
-    for i in range(len(image['pixels'])):
-        if i in seam:
-            set_pixel(added, image['pixels'][i])
-            set_pixel(added, image['pixels'][i])
-        else:
-            set_pixel(added, image['pixels'][i])
-    return added
 
 
 def seam_adding(image, ncols):
     """
     Starting from the given image, add ncols (an integer) columns from the image.
-    """
-    new = {
-        'height': image['height'],
-        'width': image['width'],
-        'pixels': image['pixels'][:],
-    }
-    
-    i = 0
-    while i < ncols: # befoer enough number of columns are added
-        grey = greyscale_image_from_color_image(new)
-        energy = compute_energy(grey)
-        cem = cumulative_energy_map(energy)
-        seam = minimum_energy_seam(cem)
-        new = image_with_seam(new, seam)
-        new['width'] += 1 # inc width
-        i+=1
 
+    The lowest-energy seams are duplicated side by side.  They are planned
+    against the image as it is, as the seams seam_carving would remove,
+    so that the same seam is not picked over and over; at most one seam per
+    column is added in each round.
+    """
+    new = image
+    while ncols > 0 and new['width'] > 0:
+        count = min(ncols, new['width'])
+        new = apply_seams(new, plan_seams(new, count), widen=True)
+        ncols -= count
+
+    if new is image:
+        new = {
+            'height': image['height'],
+            'width': image['width'],
+            'pixels': image['pixels'][:],
+        }
     return new
 
 
+def content_aware_resize(image, width, height, method='auto'):
+    """
+    Starting from the given image, use seam carving to resize it to the given
+    width and height: vertical seams are removed (or duplicated) to change
+    its width, and horizontal seams to change its height.
+
+    When the image shrinks both ways, method picks the order of the seams:
+    'optimal' finds the cheapest order by dynamic programming over the
+    intermediate sizes (practical for small images only), 'greedy' keeps
+    removing seams in whichever direction is cheaper, and 'auto' picks
+    between them by size.
+    """
+    return retarget(image, width, height, method)
+
+
 # for transparent 
 def seam_list(image, ncols):
     """
     Starting from the given image, use the seam carving technique to remove
     ncols (an integer) columns from the image.
     """
-    new = {
-        'height': image['height'],
-        'width': image['width'],
-        'pixels': image['pixels'][:],
-    }
-    
     width = image['width']
     seam_total = []
-    i = 0
-    while i < ncols: # befoer enough number of columns are removed
-        grey = greyscale_image_from_color_image(new)
-        energy = compute_energy(grey)
-        cem = cumulative_energy_map(energy)
-        seam = minimum_energy_seam(cem) # seam = list of indcies to remove 
-        
-        for idx in seam:
-            seam_total.append(idx + i * width) 
-            
-        new = image_without_seam(new, seam)
-        new['width'] -= 1
-        i+=1
+    carver = SeamCarver(image)
+    for i in range(ncols):
+        # indices into the current image's 'pixels', bottom row first, as
+        # minimum_energy_seam lists them
+        current = carver.width
+        seam = carver.remove_seam()
+        for x in reversed(range(len(seam))):
+            seam_total.append(x * current + seam[x] + i * width)
 
     return seam_total
 
@@ -604,7 +896,7 @@ def overlay(top_im, bottom_im, bx, by, colns):
 
 
     # make transparent 
-    idx_remove = seam_list(top_im, colns)
+    idx_remove = set(seam_list(top_im, colns))
 
     # overylay two images
     for x in range(bottom_im['height']):
@@ -630,21 +922,16 @@ def overlay(top_im, bottom_im, bx, by, colns):
 
 # HELPER FUNCTIONS FOR LOADING AND SAVING COLOR IMAGES
 
-def load_color_image(filename):
+def load_color_image(filename, region=None):
     """
     Loads a color image from the given file and returns a dictionary
-    representing that image.
+    representing that image.  If region is given as (top, left, height,
+    width), only that part of the image is loaded.
 
     Invoked as, for example:
        i = load_color_image('test_images/cat.png')
     """
-    with open(filename, 'rb') as img_handle:
-        img = Image.open(img_handle)
-        img = img.convert('RGB')  # in case we were given a greyscale image
-        img_data = img.getdata()
-        pixels = list(img_data)
-        w, h = img.size
-        return {'height': h, 'width': w, 'pixels': pixels}
+    return read_color(filename, region)
 
 
 def save_color_image(image, filename, mode='PNG'):
@@ -654,37 +941,20 @@ def save_color_image(image, filename, mode='PNG'):
     If filename is given as a file-like object, the file type will be
     determined by the 'mode' parameter.
     """
-    out = Image.new(mode='RGB', size=(image['width'], image['height']))
-    out.putdata(image['pixels'])
-    if isinstance(filename, str):
-        out.save(filename)
-    else:
-        out.save(filename, mode)
-    out.close()
+    write_image(image, filename, mode, color=True)
 
 
-def load_greyscale_image(filename):
+def load_greyscale_image(filename, region=None):
     """
     Loads an image from the given file and returns an instance of this class
-    representing that image.  This also performs conversion to greyscale.
+    representing that image.  This also performs conversion to greyscale.  If
+    region is given as (top, left, height, width), only that part of the
+    image is loaded.
 
     Invoked as, for example:
        i = load_greyscale_image('test_images/cat.png')
     """
-    with open(filename, 'rb') as img_handle:
-        img = Image.open(img_handle)
-        img_data = img.getdata()
-        if img.mode.startswith('RGB'):
-            pixels = [round(.299 * p[0] + .587 * p[1] + .114 * p[2])
-                      for p in img_data]
-        elif img.mode == 'LA':
-            pixels = [p[0] for p in img_data]
-        elif img.mode == 'L':
-            pixels = list(img_data)
-        else:
-            raise ValueError('Unsupported image mode: %r' % img.mode)
-        w, h = img.size
-        return {'height': h, 'width': w, 'pixels': pixels}
+    return read_greyscale(filename, region)
 
 
 def save_greyscale_image(image, filename, mode='PNG'):
@@ -694,13 +964,7 @@ def save_greyscale_image(image, filename, mode='PNG'):
     filename is given as a file-like object, the file type will be determined
     by the 'mode' parameter.
     """
-    out = Image.new(mode='L', size=(image['width'], image['height']))
-    out.putdata(image['pixels'])
-    if isinstance(filename, str):
-        out.save(filename)
-    else:
-        out.save(filename, mode)
-    out.close()
+    write_image(image, filename, mode)
 
 
 if __name__ == '__main__':
@@ -0,0 +1,134 @@
+"""
+Run greyscale filters on the channels of a colour image in parallel.
+
+filter_channels hands the red, green and blue channels, or horizontal tiles
+of them, to a pool of worker processes.  The pixels are copied once into a
+shared memory block that every worker reads its part from, and each worker
+writes its results into a second shared block, so no pixel lists are pickled
+in either direction.
+
+A tile carries `reach` extra rows (a halo) above and below it, where reach is
+how far the filter looks from each pixel (the kernel radius).  Those rows are
+filtered along with the tile and thrown away, so that every kept row sees
+the same neighbours as when the whole channel is filtered at once; at the
+top and bottom of the image the tile's edges are the image's, and are
+extended just as correlate extends them.
+
+The filter has to be inherited by the workers rather than pickled (lab
+filters are closures), so the pool is forked; where fork is unavailable, or
+the image is too small to be worth it, the channels are filtered in this
+process instead.
+"""
+
+import os
+import multiprocessing
+from array import array
+from multiprocessing import shared_memory
+
+
+# images with fewer pixels than this are filtered serially
+MIN_PIXELS = 1 << 16
+
+# set in each worker by _init_worker
+_FILTER = None
+
+
+def _init_worker(filt):
+    global _FILTER
+    _FILTER = filt
+
+
+def _to_array(pixels):
+    # 8-byte values: int64 if every pixel is an int, otherwise doubles
+    if all(type(p) is int for p in pixels):
+        return array('q', pixels)
+    return array('d', pixels)
+
+
+def _run_task(task):
+    # filter rows [row0, row1) of one channel (with its halo), writing them
+    # into the output block; returns the typecode of what was written
+    in_name, out_name, typecode, height, width, offset, row0, row1, reach = task
+    lo, hi = max(0, row0 - reach), min(height, row1 + reach)
+    block = shared_memory.SharedMemory(name=in_name)
+    try:
+        values = array(typecode)
+        values.frombytes(block.buf[8 * (offset + lo * width):8 * (offset + hi * width)])
+    finally:
+        block.close()
+
+    result = _FILTER({'height': hi - lo, 'width': width, 'pixels': values.tolist()})
+    if result['height'] != hi - lo or result['width'] != width:
+        raise ValueError('parallel filters must not change the size of the image')
+    kept = _to_array(result['pixels'][(row0 - lo) * width:(row1 - lo) * width])
+
+    block = shared_memory.SharedMemory(name=out_name)
+    try:
+        start = 8 * (offset + row0 * width)
+        block.buf[start:start + 8 * len(kept)] = memoryview(kept).cast('B')
+    finally:
+        block.close()
+    return kept.typecode
+
+
+def _fork_context():
+    try:
+        return multiprocessing.get_context('fork')
+    except ValueError:
+        return None
+
+
+def filter_channels(channels, height, width, filt, reach=None, processes=None):
+    """
+    Apply a greyscale filter (which must not change the size of the image) to
+    each of the given channels, lists of height*width pixels, in parallel.
+    Returns the list of filtered channels (lists of pixels).
+
+    Parameters:
+        * reach (int): how many rows above and below each pixel the filter
+                       looks at, or None if unknown; each channel is then a
+                       single task rather than being split into tiles
+        * processes (int): number of worker processes (default: one per core)
+    """
+    processes = processes or os.cpu_count() or 1
+    context = _fork_context()
+    n = height * width
+    if processes == 1 or context is None or n * len(channels) < MIN_PIXELS:
+        return [filt({'height': height, 'width': width, 'pixels': list(pixels)})['pixels']
+                for pixels in channels]
+
+    # enough tiles per channel to keep every process busy
+    if reach is None:
+        tiles = 1
+    else:
+        tiles = max(1, min(-(-processes // len(channels)), height // max(1, 4 * reach)))
+    bounds = [(height * t // tiles, height * (t + 1) // tiles) for t in range(tiles)]
+
+    # each channel keeps its own typecode, so that int channels are filtered
+    # (and come back) as ints even when another channel holds floats
+    inputs = [_to_array(pixels) for pixels in channels]
+    in_block = shared_memory.SharedMemory(create=True, size=max(1, 8 * n * len(channels)))
+    out_block = shared_memory.SharedMemory(create=True, size=max(1, 8 * n * len(channels)))
+    try:
+        for c, values in enumerate(inputs):
+            in_block.buf[8 * c * n:8 * (c + 1) * n] = memoryview(values).cast('B')
+
+        tasks = [(in_block.name, out_block.name, inputs[c].typecode, height, width, c * n,
+                  row0, row1, reach or 0)
+                 for c in range(len(channels)) for row0, row1 in bounds]
+        with context.Pool(min(processes, len(tasks)), _init_worker, (filt,)) as pool:
+            kinds = pool.map(_run_task, tasks, chunksize=1)
+
+        out = []
+        for c in range(len(channels)):
+            pixels = []
+            for (row0, row1), kind in zip(bounds, kinds[c * tiles:(c + 1) * tiles]):
+                values = array(kind)
+                values.frombytes(out_block.buf[8 * (c * n + row0 * width):8 * (c * n + row1 * width)])
+                pixels.extend(values.tolist())
+            out.append(pixels)
+        return out
+    finally:
+        for block in (in_block, out_block):
+            block.close()
+            block.unlink()
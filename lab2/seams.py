@@ -0,0 +1,531 @@
+"""
+Incremental seam carving.
+
+seam_carving in lab.py rebuilds the greyscale image, the energy (edges) and
+the cumulative energy map of the whole image for every seam it removes.  But
+removing (or duplicating) one pixel per row only changes the energy of the
+pixels next to the seam, and the cumulative energy only where those changes
+propagate down the map, which they usually stop doing within a few rows.
+
+SeamCarver keeps the image, its greyscale version, its energy and its
+cumulative energy map as lists of rows (so each row knows its own width, and
+cutting a pixel out of it is a single `del`), and after each seam updates:
+
+    * the energy in a window around the seam on each row (the Sobel
+      operator looks one pixel away, so nothing further can change)
+    * the cumulative energy from the top row down, recomputing only the
+      pixels whose energy changed or whose parents in the row above did, and
+      noting which of them actually came out different
+
+Everything is exact integer arithmetic, and seams are chosen with the same
+tie-breaking as minimum_energy_seam, so the results are identical to
+recomputing everything from scratch.
+
+plan_seams and apply_seams remove or duplicate batches of seams at once, and
+retarget resizes an image in both directions, carving horizontal seams as
+vertical seams of a transposed view of the image.
+"""
+
+import os
+import sys
+import math
+from array import array
+from itertools import chain
+from operator import add, ne
+
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+# the modules shared between the labs are in ../common
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'common'))
+
+from correlation import sobel
+from imagefiles import grey_values
+from images import transposed, materialized
+
+
+_INF = float('inf')
+
+
+def grey_value(pixel):
+    """
+    Return the greyscale value of an (r, g, b) pixel, as
+    greyscale_image_from_color_image computes it.
+    """
+    r, g, b = pixel
+    return round(.299*r + .587*g + .114*b)
+
+
+def grey_rows(rows, width):
+    """
+    Return the greyscale values of rows of (r, g, b) pixels, as lists.
+    """
+    try:
+        data = bytes(chain.from_iterable(chain.from_iterable(rows)))
+    except (TypeError, ValueError):
+        data = None
+    if data is None or len(data) != 3 * width * len(rows):
+        # not all bytes: one pixel at a time
+        return [[grey_value(p) for p in row] for row in rows]
+    values = grey_values(data, 3)
+    return [values[x * width:(x + 1) * width] for x in range(len(rows))]
+
+
+def energy_span(up, mid, down, start, stop):
+    """
+    Return the energies (as compute_energy defines them: the clipped Sobel
+    gradient magnitude) of columns start through stop-1 of the row `mid`,
+    given the rows above and below it (which are `mid` itself at the top and
+    bottom of the image).
+    """
+    width = len(mid)
+
+    def part(row):
+        # columns start-1 .. stop, clamped to the edges of the row
+        return [row[max(start - 1, 0)]] + row[start:stop] + [row[min(stop, width - 1)]]
+
+    u, m, d = part(up), part(mid), part(down)
+    out = []
+    for j in range(stop - start):
+        ox = (u[j + 2] - u[j]) + 2 * (m[j + 2] - m[j]) + (d[j + 2] - d[j])
+        oy = (d[j] + 2 * d[j + 1] + d[j + 2]) - (u[j] + 2 * u[j + 1] + u[j + 2])
+        e = round(math.sqrt(ox**2 + oy**2))
+        out.append(255 if e > 255 else e)
+    return out
+
+
+def lowest_parent(row, y):
+    """
+    Return the column of the smallest of row[y-1], row[y], row[y+1] (those
+    that exist), preferring the leftmost on ties, as adjacent_min does.
+    """
+    best = y
+    if y > 0 and row[y - 1] <= row[y]:
+        best = y - 1
+    if y + 1 < len(row) and row[y + 1] < row[best]:
+        best = y + 1
+    return best
+
+
+# CUMULATIVE ENERGY
+
+class EnergyMap(dict):
+    """
+    A cumulative energy map: an image dictionary of cumulative energies, as
+    cumulative_energy_map returns, which also remembers where each pixel's
+    cheapest path came from.  parents[i] is the offset (-1, 0 or 1) of the
+    column of the pixel in the row above that pixel i continues, chosen as
+    adjacent_min chooses it (the leftmost of equal minima); it is 0 on the
+    top row.
+    """
+    parents = None
+
+
+def _cumulative_numpy(pixels, height, width, dtype, big):
+    values = numpy.array(pixels, dtype=dtype).reshape(height, width)
+    out = numpy.empty_like(values)
+    parents = numpy.zeros((height, width), dtype=numpy.int8)
+    out[0] = values[0]
+    columns = numpy.arange(width)
+    shifted = numpy.full((3, width), big, dtype=dtype)
+    for x in range(1, height):
+        above = out[x - 1]
+        # the row above, shifted right, as is and shifted left
+        shifted[0, 1:] = above[:-1]
+        shifted[1] = above
+        shifted[2, :-1] = above[1:]
+        choice = shifted.argmin(axis=0)  # the first of equal minima
+        out[x] = values[x] + shifted[choice, columns]
+        parents[x] = choice - 1
+    offsets = array('b')
+    offsets.frombytes(parents.tobytes())
+    return out.ravel().tolist(), offsets
+
+
+def _cumulative_python(pixels, height, width):
+    out = list(pixels[:width])
+    offsets = array('b', bytes(width))
+    above = out
+    inf = float('inf')
+    for x in range(1, height):
+        left = [inf] + above[:-1]
+        right = above[1:] + [inf]
+        best = list(map(min, left, above, right))
+        row = list(map(add, pixels[x * width:(x + 1) * width], best))
+        offsets.extend(-1 if l == b else (0 if c == b else 1)
+                       for l, c, b in zip(left, above, best))
+        out.extend(row)
+        above = row
+    return out, offsets
+
+
+def cumulative_energy(energy):
+    """
+    Return the cumulative energy map (an EnergyMap) of the given energy
+    image, one row at a time: each row is the energy plus the smallest of
+    the three neighbours above, taken from shifted copies of the row above
+    (with NumPy, if it is installed, for int or float energies).
+    """
+    height, width = energy['height'], energy['width']
+    pixels = list(energy['pixels'])
+    kinds = set(map(type, pixels))
+    if not height or not width:
+        values, parents = pixels, array('b')
+    elif numpy is not None and kinds == {int} and \
+            max(map(abs, pixels)) * height < 2 ** 62:
+        values, parents = _cumulative_numpy(pixels, height, width, numpy.int64,
+                                            numpy.iinfo(numpy.int64).max)
+    elif numpy is not None and kinds == {float}:
+        values, parents = _cumulative_numpy(pixels, height, width, float, numpy.inf)
+    else:
+        values, parents = _cumulative_python(pixels, height, width)
+    cem = EnergyMap(height=height, width=width, pixels=values)
+    cem.parents = parents
+    return cem
+
+
+def trace_seam(cem):
+    """
+    Return the minimum-energy seam of a cumulative energy map as a list of
+    indices into its 'pixels', from the bottom row up, as
+    minimum_energy_seam does: starting from the leftmost minimum of the
+    bottom row, and following the parents of an EnergyMap (or, for any other
+    map, the leftmost smallest of the three pixels above).
+    """
+    height, width, pixels = cem['height'], cem['width'], cem['pixels']
+    parents = getattr(cem, 'parents', None)
+    x = height - 1
+    bottom = pixels[x * width:(x + 1) * width]
+    y = bottom.index(min(bottom))
+    seam = [x * width + y]
+    while x > 0:
+        if parents is not None:
+            y += parents[x * width + y]
+        else:
+            y = lowest_parent(pixels[(x - 1) * width:x * width], y)
+        x -= 1
+        seam.append(x * width + y)
+    return seam
+
+
+class SeamCarver:
+    """
+    A colour image from which vertical seams can be removed (or duplicated)
+    one at a time, keeping its energy and cumulative energy map up to date.
+
+    Parameters:
+        * image (dict): a color image; it is not modified
+    """
+    def __init__(self, image):
+        self.height = image['height']
+        self.width = image['width']
+        w = self.width
+        pixels = image['pixels']
+        self.rows = [pixels[x * w:(x + 1) * w] for x in range(self.height)]
+        self.grey = grey_rows(self.rows, w)
+        energy = sobel({'height': self.height, 'width': w, 'pixels': [g for row in self.grey for g in row]})
+        self.energy = [energy['pixels'][x * w:(x + 1) * w] for x in range(self.height)]
+        cumulative = cumulative_energy(energy)['pixels']
+        self.cumulative = [cumulative[x * w:(x + 1) * w] for x in range(self.height)]
+
+    def _grey_row(self, x):
+        return self.grey[min(max(x, 0), self.height - 1)]
+
+    def cost(self):
+        """
+        Return the total energy of the minimum-energy seam.
+        """
+        return min(self.cumulative[-1])
+
+    def image(self):
+        """
+        Return the current image as a new color image dictionary.
+        """
+        pixels = []
+        for row in self.rows:
+            pixels.extend(row)
+        return {'height': self.height, 'width': self.width, 'pixels': pixels}
+
+    def seam(self):
+        """
+        Return the minimum-energy seam as a list of one column per row, from
+        the top row down (the same seam as minimum_energy_seam).
+        """
+        bottom = self.cumulative[-1]
+        y = bottom.index(min(bottom))
+        columns = [y]
+        for x in range(self.height - 1, 0, -1):
+            y = lowest_parent(self.cumulative[x - 1], y)
+            columns.append(y)
+        columns.reverse()
+        return columns
+
+    def remove_seam(self, columns=None):
+        """
+        Remove a seam (by default, the minimum-energy one) and return it.
+        """
+        if columns is None:
+            columns = self.seam()
+        for x, y in enumerate(columns):
+            for rows in (self.rows, self.grey, self.energy, self.cumulative):
+                del rows[x][y]
+        self.width -= 1
+        self._update(columns, 2, 1)
+        return columns
+
+    def insert_seam(self, columns=None):
+        """
+        Duplicate every pixel of a seam (by default, the minimum-energy one),
+        as image_with_seam does, and return it.
+        """
+        if columns is None:
+            columns = self.seam()
+        for x, y in enumerate(columns):
+            for rows in (self.rows, self.grey, self.energy, self.cumulative):
+                rows[x].insert(y, rows[x][y])
+        self.width += 1
+        self._update(columns, 1, 2)
+        return columns
+
+    def _update(self, columns, left, right):
+        # the pixels around the seam have been removed or duplicated in every
+        # row, and the other values shifted along with them.  A pixel's
+        # energy can only have changed if it lies within `left` columns to
+        # the left or `right` to the right of the seam in its own row or the
+        # rows next to it.
+        height, width = self.height, self.width
+        if width == 0:
+            return
+        changed = None
+        for x in range(height):
+            near = columns[max(x - 1, 0):x + 2]
+            lo, hi = max(min(near) - left, 0), min(max(near) + right, width - 1)
+            self.energy[x][lo:hi + 1] = energy_span(self._grey_row(x - 1), self.grey[x],
+                                                    self._grey_row(x + 1), lo, hi + 1)
+
+            # recompute the cumulative energy wherever the energy or the
+            # row above may have changed, and record where it really did
+            energy, current = self.energy[x], self.cumulative[x]
+            if changed is not None:
+                lo, hi = min(lo, changed[0] - 1), max(hi, changed[1] + 1)
+                lo, hi = max(lo, 0), min(hi, width - 1)
+            if x == 0:
+                values = energy[lo:hi + 1]
+            else:
+                # the smallest of the three pixels above, from shifted slices
+                above = self.cumulative[x - 1]
+                upper_left = above[lo - 1:hi] if lo else [_INF] + above[:hi]
+                upper_right = above[lo + 1:hi + 2] if hi + 1 < width else above[lo + 1:] + [_INF]
+                values = list(map(add, energy[lo:hi + 1],
+                                  map(min, upper_left, above[lo:hi + 1], upper_right)))
+            differs = list(map(ne, values, current[lo:hi + 1]))
+            if True in differs:
+                first = differs.index(True)
+                last = len(differs) - 1 - differs[::-1].index(True)
+                current[lo + first:lo + last + 1] = values[first:last + 1]
+                changed = (lo + first, lo + last)
+            else:
+                changed = None
+
+
+# BATCHES OF SEAMS
+
+def plan_seams(image, count):
+    """
+    Return `count` non-overlapping minimum-energy seams of the given image,
+    each as a list of one column (of the original image) per row, top row
+    first.  They are the seams seam_carving would remove, found by carving
+    them out one after another while remembering where each remaining
+    pixel came from.
+    """
+    carver = SeamCarver(image)
+    origin = [list(range(image['width'])) for _ in range(image['height'])]
+    seams = []
+    for _ in range(count):
+        columns = carver.remove_seam()
+        seams.append([origin[x].pop(y) for x, y in enumerate(columns)])
+    return seams
+
+
+def apply_seams(image, seams, widen=False):
+    """
+    Return a new image with all of the given (non-overlapping) seams, as
+    returned by plan_seams, removed from the given image, or each of their
+    pixels doubled if widen is True, in a single pass over the image.
+    """
+    height, width = image['height'], image['width']
+    pixels = image['pixels']
+    out = []
+    for x in range(height):
+        start = x * width
+        done = 0
+        for y in sorted(seam[x] for seam in seams):
+            out.extend(pixels[start + done:start + y])
+            if widen:
+                out.append(pixels[start + y])
+                out.append(pixels[start + y])
+            done = y + 1
+        out.extend(pixels[start + done:start + width])
+    change = len(seams) if widen else -len(seams)
+    return {'height': height, 'width': width + change, 'pixels': out}
+
+
+# RETARGETING
+
+# shrinking in both directions uses the optimal order of seams when the
+# number of pixels times the number of intermediate sizes is at most this
+OPTIMAL_WORK = 1 << 21
+
+# otherwise the two directions are compared again after removing this
+# fraction of the seams left in the cheaper one
+GREEDY_BLOCK = 4
+
+
+def _flip(image):
+    # the transpose of an image, as a list-backed dictionary
+    return materialized(transposed(image))
+
+
+def _carver(carvers, vertical):
+    # the carver of an optimal_carve state in the given direction, made from
+    # its carver in the other direction if it has none
+    if vertical not in carvers:
+        carvers[vertical] = SeamCarver(transposed(carvers[not vertical].image()))
+    return carvers[vertical]
+
+
+def _step(state, vertical, keep):
+    # remove one vertical (or horizontal) seam from the image of a state of
+    # optimal_carve, through the state's carver in that direction, giving the
+    # total energy removed and the carvers of the new state.  If `keep`, the
+    # state's image is still needed, so its carver in the other direction is
+    # made before this one is changed.
+    cost, carvers = state
+    carver = _carver(carvers, vertical)
+    if keep:
+        _carver(carvers, not vertical)
+    del carvers[vertical]
+    step = carver.cost()
+    carver.remove_seam()
+    return cost + step, {vertical: carver}
+
+
+def optimal_carve(image, rows, cols):
+    """
+    Remove `rows` horizontal and `cols` vertical seams from the image, in
+    the order that removes the least total energy (the transport map of
+    Avidan and Shamir): the cheapest way to remove r rows and c columns is
+    the cheaper of removing r-1 rows and c columns (in the cheapest way) and
+    then a horizontal seam, or r rows and c-1 columns and then a vertical
+    seam.  This carves two seams for each of (rows+1)*(cols+1) intermediate
+    sizes, so it is only practical for small images.
+
+    Each size keeps the SeamCarver its last seam was removed with, and the
+    next seam in the same direction is removed through it; only the other
+    direction needs a new carver, so there is at most one per size.
+    """
+    previous = None
+    for r in range(rows + 1):
+        current = []
+        for c in range(cols + 1):
+            options = []
+            if c > 0:
+                # the vertical step comes first, so the horizontal one from
+                # the same size (in the next row) still needs its image
+                options.append(_step(current[c - 1], True, r < rows))
+            if r > 0:
+                options.append(_step(previous[c], False, False))
+            # on ties, the vertical seam (listed first) wins
+            current.append(min(options, key=lambda option: option[0]) if options
+                           else (0, {True: SeamCarver(image)}))
+        previous = current
+    carvers = previous[cols][1]
+    if True in carvers:
+        return carvers[True].image()
+    return _flip(carvers[False].image())
+
+
+def _other_cost(carver):
+    # energy of the cheapest seam across the carver's rows: the Sobel
+    # magnitude of the transposed image is the transpose of the magnitude,
+    # so only the cumulative energy has to be computed the other way
+    energy = {'height': carver.height, 'width': carver.width,
+              'pixels': list(chain.from_iterable(carver.energy))}
+    cumulative = cumulative_energy(transposed(energy))
+    return min(cumulative['pixels'][-cumulative['width']:])
+
+
+def greedy_carve(image, rows, cols):
+    """
+    Remove `rows` horizontal and `cols` vertical seams from the image,
+    repeatedly removing a block of seams in whichever direction has the
+    cheaper seam.  Each block is carved incrementally by a SeamCarver, on a
+    transposed view of the image for horizontal seams, so the image is only
+    rebuilt when the direction changes.
+    """
+    left = {True: cols, False: rows}
+    vertical = True
+    carver = SeamCarver(image)
+    while left[True] or left[False]:
+        if left[not vertical] and (not left[vertical] or _other_cost(carver) < carver.cost()):
+            carver = SeamCarver(transposed(carver.image()))
+            vertical = not vertical
+        if left[not vertical]:
+            block = max(1, -(-left[vertical] // GREEDY_BLOCK))
+        else:
+            block = left[vertical]
+        for _ in range(block):
+            carver.remove_seam()
+        left[vertical] -= block
+    out = carver.image()
+    return out if vertical else _flip(out)
+
+
+def widen(image, count, vertical=True):
+    """
+    Return the image with `count` vertical (or horizontal) seams duplicated,
+    in batches of non-overlapping seams as seam_adding adds them.
+    """
+    if not vertical:
+        image = transposed(image)
+    while count > 0 and image['width'] > 0:
+        batch = min(count, image['width'])
+        image = apply_seams(image, plan_seams(image, batch), widen=True)
+        count -= batch
+    return image if vertical else _flip(image)
+
+
+def retarget(image, width, height, method='auto'):
+    """
+    Return a new image of the given size made from the given colour image by
+    removing or duplicating vertical seams (to change its width) and
+    horizontal seams (to change its height).
+
+    When both dimensions shrink, method chooses the order in which the seams
+    are removed: 'optimal' (optimal_carve), 'greedy' (greedy_carve), or
+    'auto', which is optimal_carve when that is cheap enough (OPTIMAL_WORK)
+    and greedy_carve otherwise.  Growing happens after shrinking.
+    """
+    if width < 1 or height < 1:
+        raise ValueError('cannot retarget to %dx%d' % (width, height))
+    if method not in ('auto', 'optimal', 'greedy'):
+        raise ValueError('unknown retargeting method: %r' % method)
+    rows = max(image['height'] - height, 0)
+    cols = max(image['width'] - width, 0)
+    if method == 'auto':
+        work = (rows + 1) * (cols + 1) * image['height'] * image['width']
+        method = 'optimal' if work <= OPTIMAL_WORK else 'greedy'
+
+    if rows and cols:
+        out = (optimal_carve if method == 'optimal' else greedy_carve)(image, rows, cols)
+    elif cols:
+        out = greedy_carve(image, 0, cols)
+    elif rows:
+        out = greedy_carve(image, rows, 0)
+    else:
+        out = materialized(image)
+    out = widen(out, width - out['width'], vertical=True)
+    out = widen(out, height - out['height'], vertical=False)
+    return out
@@ -346,6 +346,494 @@ def load_greyscale_image(filename):
         return {'height': h, 'width': w, 'pixels': pixels}
 
 
+def direct_correlation(image, kernel):
+    # the plain per-tap definition of correlation, with clamped edges
+    h, w = image['height'], image['width']
+    offsets = range(-((len(kernel) - 1) // 2), 1 + len(kernel) // 2)
+    pixels = []
+    for x in range(h):
+        for y in range(w):
+            new = 0
+            for dx, row in zip(offsets, kernel):
+                for dy, k in zip(offsets, row):
+                    new += image['pixels'][min(max(x + dx, 0), h - 1) * w + min(max(y + dy, 0), w - 1)] * k
+            pixels.append(new)
+    return {'height': h, 'width': w, 'pixels': pixels}
+
+
+def test_fast_box_filters():
+    # box filters use running sums and separable kernels two 1-D passes;
+    # both must round exactly like the direct computation, including ties
+    im = {
+        'height': 5,
+        'width': 7,
+        'pixels': [(37 * i * i + 11 * i) % 256 for i in range(35)],
+    }
+    halves = {'height': 4, 'width': 3, 'pixels': [0, 2, 0, 2, 0, 2, 1, 3, 5, 255, 0, 254]}
+    for image in (im, halves):
+        original = object_hash(image)
+        for n in range(1, 7):
+            box = [[1/(n**2)] * n for _ in range(n)]
+            sharp = [[-1/(n**2)] * n for _ in range(n)]
+            sharp[(n-1)//2][(n-1)//2] += 2
+            compare_greyscale_images(lab.blurred(image, n), lab.round_and_clip_image(direct_correlation(image, box)))
+            compare_greyscale_images(lab.sharpened(image, n), lab.round_and_clip_image(direct_correlation(image, sharp)))
+        sobel = [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]
+        assert lab.correlate(image, sobel) == direct_correlation(image, sobel)
+        assert object_hash(image) == original, "Be careful not to modify the original image!"
+
+
+def test_padded_correlation():
+    # kernels that cannot be separated go through the padded buffer, which
+    # adds up the same products in the same order as the direct definition
+    import correlation
+    im = {
+        'height': 6,
+        'width': 4,
+        'pixels': [(53 * i + 7) % 256 for i in range(24)],
+    }
+    kernels = [
+        [[0.0, 0.2, 0.0], [0.2, 0.2, 0.2], [0.0, 0.2, 0.0]],
+        [[1, -2, 0, 3], [0, 1, 1, 0], [2, 0, 0, -1], [0, 0, 5, 1]],
+        [[(3 * i + j) % 7 / 10 - 0.3 for j in range(7)] for i in range(7)],
+    ]
+    numpy = correlation.numpy
+    try:
+        for mode in (numpy, None):
+            correlation.numpy = mode
+            for k in kernels:
+                result = lab.correlate(im, k)
+                expected = direct_correlation(im, k)
+                assert result == expected
+                assert [type(p) for p in result['pixels']] == [type(p) for p in expected['pixels']]
+    finally:
+        correlation.numpy = numpy
+
+
+def test_fft_correlation():
+    # large kernels go through the FFT; edges behave as in correlate and the
+    # rounded results are the same as the direct ones
+    import correlation
+    im = {
+        'height': 12,
+        'width': 9,
+        'pixels': [(29 * i * i + 3 * i) % 256 for i in range(108)],
+    }
+    n = 17
+    smooth = [[((i * n + j) % 5 + 1) / (3 * n * n) for j in range(n)] for i in range(n)]
+    halves = [[0.5 if (i + j) % 2 else 0.25 for j in range(n)] for i in range(n)]
+    integral = [[(i * j) % 3 - 1 for j in range(n)] for i in range(n)]
+    assert correlation.prefer_fft({'height': 1000, 'width': 1000}, [[0.01] * 31] * 31)
+    assert not correlation.prefer_fft({'height': 1000, 'width': 1000}, [[1, 0, 0], [0, 2, 0], [0, 0, 1]])
+    numpy = correlation.numpy
+    try:
+        for mode in (numpy, None):
+            correlation.numpy = mode
+            for k in (smooth, halves):
+                compare_greyscale_images(lab.round_and_clip_image(correlation.correlate_fft(im, k)),
+                               lab.round_and_clip_image(direct_correlation(im, k)))
+            assert correlation.correlate_fft(im, integral) == direct_correlation(im, integral)
+    finally:
+        correlation.numpy = numpy
+
+
+def test_cascade_plan():
+    # consecutive color filters share one separate/combine, and the result
+    # is the same as applying each filter in turn
+    im = {
+        'height': 7,
+        'width': 6,
+        'pixels': [((13 * i) % 256, (71 * i * i) % 256, (5 * i + 90) % 256) for i in range(42)],
+    }
+    color = lab.color_filter_from_greyscale_filter
+    swap = lambda im: {k: ([(i[1], i[0], i[2]) for i in v] if isinstance(v, list) else v) for k, v in im.items()}
+    filters = [color(lab.make_blur_filter(3)), color(lab.edges), swap,
+               color(lab.make_sharpen_filter(3)), color(lab.make_blur_filter(1)), color(lab.inverted)]
+    plan = lab.plan_cascade(filters)
+    assert [kind for kind, _ in plan] == ['color', 'any', 'color']
+    assert len(plan[2][1]) == 2, 'the identity blur after a sharpen changes nothing'
+
+    expected = im
+    for f in filters:
+        expected = f(expected)
+    oim = object_hash(im)
+    compare_color_images(lab.filter_cascade(filters)(im), expected)
+    assert object_hash(im) == oim, 'Be careful not to modify the original image!'
+
+    # merging blurs only skips the rounding between them
+    blurs = [color(lab.make_blur_filter(3)), color(lab.make_blur_filter(2)), color(lab.make_blur_filter(5))]
+    assert len(lab.plan_cascade(blurs, exact=False)[0][1]) == 1
+    expected = lab.filter_cascade(blurs)(im)
+    result = lab.filter_cascade(blurs, exact=False)(im)
+    assert all(abs(a - b) <= 2 for p, q in zip(result['pixels'], expected['pixels']) for a, b in zip(p, q))
+
+    # kernels that only move pixels merge with their neighbours exactly
+    right = [[0, 0, 0], [1, 0, 0], [0, 0, 0]]
+    down = [[0, 0, 0], [0, 0, 0], [0, 1, 0]]
+    moves = [color(lab.make_sharpen_filter(3)), color(lab.make_kernel_filter(right)),
+             color(lab.make_kernel_filter(down)), color(lab.make_blur_filter(3)),
+             color(lab.make_blur_filter(3))]
+    after = [color(lab.edges), color(lab.make_kernel_filter(down)), color(lab.make_blur_filter(3))]
+    # but not into what comes after them when their input may not be rounded
+    first = [color(lab.make_kernel_filter(right)), color(lab.make_blur_filter(3))]
+    for filters, count in ((moves, 3), (after, 2), (first, 2)):
+        assert [len(stages) for _, stages in lab.plan_cascade(filters)] == [count]
+        expected = im
+        for f in filters:
+            expected = f(expected)
+        compare_color_images(lab.filter_cascade(filters)(im), expected)
+
+
+def test_parallel_color_filter():
+    # channels and tiles (with halo rows) filtered by worker processes give
+    # the same image as filtering each whole channel here
+    import parallel
+    im = {
+        'height': 17,
+        'width': 5,
+        'pixels': [((31 * i) % 256, (7 * i * i) % 256, (250 - 3 * i) % 256) for i in range(85)],
+    }
+    oim = object_hash(im)
+    min_pixels = parallel.MIN_PIXELS
+    parallel.MIN_PIXELS = 0
+    try:
+        for filt in (lab.make_blur_filter(5), lab.make_sharpen_filter(4), lab.edges, lab.inverted):
+            expected = lab.color_filter_from_greyscale_filter(filt)(im)
+            compare_color_images(lab.parallel_color_filter(filt, 6)(im), expected)
+
+        # an int channel stays int next to a float one, as it does serially
+        channels = [[i % 7 for i in range(85)], [i / 4 for i in range(85)]]
+        result = parallel.filter_channels(channels, 17, 5, lab.inverted, 0, 4)
+        expected = [lab.inverted({'height': 17, 'width': 5, 'pixels': c})['pixels'] for c in channels]
+        assert result == expected
+        assert [type(p) for c in result for p in c] == [type(p) for c in expected for p in c]
+    finally:
+        parallel.MIN_PIXELS = min_pixels
+    assert object_hash(im) == oim, 'Be careful not to modify the original image!'
+
+
+def test_incremental_seams():
+    # the carver's energy and cumulative energy map, updated around each
+    # seam, match recomputing them from scratch, so it finds the same seams
+    from seams import SeamCarver
+    im = {
+        'height': 9,
+        'width': 11,
+        'pixels': [((i * 37) % 7 * 40, (i * i) % 5 * 60, (i // 3) % 4 * 80) for i in range(99)],
+    }
+    oim = object_hash(im)
+    carver = SeamCarver(im)
+    current = im
+    for step in range(6):
+        energy = lab.compute_energy(lab.greyscale_image_from_color_image(current))
+        cem = lab.cumulative_energy_map(energy)
+        assert [v for row in carver.energy for v in row] == energy['pixels']
+        assert [v for row in carver.cumulative for v in row] == cem['pixels']
+        seam = lab.minimum_energy_seam(cem)
+        columns = carver.seam()
+        assert sorted(seam) == [x * current['width'] + y for x, y in enumerate(columns)]
+        if step % 2:
+            carver.insert_seam(columns)
+            current = lab.image_with_seam(current, seam)
+        else:
+            carver.remove_seam(columns)
+            current = lab.image_without_seam(current, seam)
+        compare_color_images(carver.image(), current)
+    assert object_hash(im) == oim, 'Be careful not to modify the original image!'
+
+
+def test_seam_rebuild():
+    # one-pixel-per-row seams (in any order) are cut out of or doubled in
+    # each row; other index lists still remove or double exactly those pixels
+    im = {'height': 3, 'width': 4, 'pixels': [(i, i, i) for i in range(12)]}
+    oim = object_hash(im)
+    seam = [9, 6, 1]
+    result = lab.image_without_seam(im, seam)
+    assert result['width'] == 3
+    assert [p[0] for p in result['pixels']] == [0, 2, 3, 4, 5, 7, 8, 10, 11]
+    result = lab.image_with_seam(im, seam)
+    assert result['width'] == 5
+    assert [p[0] for p in result['pixels']] == [0, 1, 1, 2, 3, 4, 5, 6, 6, 7, 8, 9, 9, 10, 11]
+    assert lab.seam_columns(im, [0, 1, 8]) is None
+    result = lab.image_without_seam(im, [0, 1, 8])
+    assert [p[0] for p in result['pixels']] == [2, 3, 4, 5, 6, 7, 9, 10, 11]
+    assert object_hash(im) == oim, 'Be careful not to modify the original image!'
+
+
+def test_seam_batches():
+    # the planned seams are the ones seam_carving removes, in the original
+    # image's columns, and never share a pixel
+    from seams import plan_seams, apply_seams
+    im = {
+        'height': 7,
+        'width': 10,
+        'pixels': [((i * 53) % 11 * 23, (i * 7) % 6 * 50, (i * i) % 9 * 30) for i in range(70)],
+    }
+    oim = object_hash(im)
+    seams = plan_seams(im, 4)
+    for x in range(im['height']):
+        assert len({seam[x] for seam in seams}) == 4
+    compare_color_images(apply_seams(im, seams), lab.seam_carving(im, 4))
+
+    widened = apply_seams(im, seams, widen=True)
+    assert widened['width'] == 14
+    for x in range(im['height']):
+        row = im['pixels'][x * 10:(x + 1) * 10]
+        wide = widened['pixels'][x * 14:(x + 1) * 14]
+        assert wide == [p for y, p in enumerate(row) for _ in range(2 if any(s[x] == y for s in seams) else 1)]
+    compare_color_images(lab.seam_adding(im, 4), widened)
+    assert lab.seam_adding(im, 25)['width'] == 35
+    assert object_hash(im) == oim, 'Be careful not to modify the original image!'
+
+
+def test_packed_images():
+    # colour images are stored as three planes; separate and combine hand
+    # out views of them, and filters give the same results as on dictionaries
+    from images import PackedImage
+    im = {
+        'height': 5,
+        'width': 8,
+        'pixels': [((11 * i) % 256, (i * i) % 256, (200 - 4 * i) % 256) for i in range(40)],
+    }
+    packed = PackedImage.from_dict(im)
+    assert packed.is_color() and [p.typecode for p in packed.planes] == ['B'] * 3
+    assert packed.to_dict() == im and packed == im
+    assert packed != 'not an image' and packed != {'height': 5}
+    assert list(packed['pixels'][8:11]) == im['pixels'][8:11]
+    assert [bytes(view) for view in packed.row(1)] == \
+        [bytes(p[c] for p in im['pixels'][8:16]) for c in range(3)]
+
+    red, green, blue = lab.separate(packed)
+    assert red.planes[0] is packed.planes[0]
+    assert lab.combine(red, green, blue).planes == packed.planes
+    compare_greyscale_images(blue.to_dict(), lab.separate(im)[2])
+
+    for filt in (lab.make_blur_filter(3), lab.make_sharpen_filter(3), lab.edges):
+        color = lab.color_filter_from_greyscale_filter(filt)
+        compare_color_images(color(packed), color(im))
+    compare_color_images(lab.seam_carving(packed, 2), lab.seam_carving(im, 2))
+    assert object_hash(im) == object_hash(packed.to_dict())
+
+
+def test_image_files(tmp_path):
+    # raw-byte loading converts to greyscale exactly as the per-pixel formula
+    # does, with or without NumPy, and regions match cropping the whole image
+    import imagefiles
+    from PIL import Image
+    colors = [(r, g, 255 - r) for r in range(0, 256, 15) for g in range(0, 256, 17)]
+    img = Image.new('RGBA', (16, len(colors) // 16))
+    img.putdata([c + (99,) for c in colors])
+    fname = str(tmp_path / 'colors.png')
+    img.save(fname)
+
+    expected = [round(.299 * r + .587 * g + .114 * b) for r, g, b in colors]
+    numpy = imagefiles.numpy
+    try:
+        for mode in (numpy, None):
+            imagefiles.numpy = mode
+            assert lab.load_greyscale_image(fname)['pixels'] == expected
+    finally:
+        imagefiles.numpy = numpy
+
+    color = lab.load_color_image(fname)
+    assert color['pixels'] == colors
+    compare_color_images(lab.load_color_image(fname, (3, 5, 4, 9)), lab.crop(color, 3, 5, 4, 9))
+    grey = lab.load_greyscale_image(fname)
+    compare_greyscale_images(lab.load_greyscale_image(fname, (0, 2, 7, 14)), lab.crop(grey, 0, 2, 7, 14))
+    with pytest.raises(ValueError):
+        lab.load_color_image(fname, (10, 0, 100, 4))
+    for ext in ('bmp', 'ppm', 'tif'):
+        # uncompressed files are read only in the rows of the region
+        other = str(tmp_path / ('colors.' + ext))
+        img.convert('RGB').save(other)
+        assert imagefiles._raw_layout(Image.open(other)) is not None
+        for region in ((3, 5, 4, 9), (0, 0, 1, 16), (13, 15, 2, 1)):
+            compare_color_images(lab.load_color_image(other, region), lab.crop(color, *region))
+            compare_greyscale_images(lab.load_greyscale_image(other, region), lab.crop(grey, *region))
+
+    lab.save_color_image(color, str(tmp_path / 'copy.png'))
+    compare_color_images(lab.load_color_image(str(tmp_path / 'copy.png')), color)
+    lab.save_greyscale_image(grey, str(tmp_path / 'grey.png'))
+    compare_greyscale_images(lab.load_greyscale_image(str(tmp_path / 'grey.png')), grey)
+
+
+def test_fused_edges():
+    # the single-pass Sobel magnitude is the same as correlating with both
+    # kernels and combining them, with and without NumPy and for float images
+    import math
+    import correlation
+    Kx = [[-1, 0, 1], [-2, 0, 2], [-1, 0, 1]]
+    Ky = [[-1, -2, -1], [0, 0, 0], [1, 2, 1]]
+    images = [
+        {'height': 7, 'width': 6, 'pixels': [(71 * i * i + 13 * i) % 256 for i in range(42)]},
+        {'height': 4, 'width': 9, 'pixels': [((i * 7) % 10) * 1.25 - 3 for i in range(36)]},
+    ]
+    numpy = correlation.numpy
+    try:
+        for mode in (numpy, None):
+            correlation.numpy = mode
+            for im in images:
+                ox, oy = direct_correlation(im, Kx), direct_correlation(im, Ky)
+                magnitude = [round(math.sqrt(x**2 + y**2)) for x, y in zip(ox['pixels'], oy['pixels'])]
+                assert lab.edges(im, clip=False)['pixels'] == magnitude
+                assert lab.edges(im)['pixels'] == [min(v, 255) for v in magnitude]
+    finally:
+        correlation.numpy = numpy
+
+
+def test_cumulative_energy_rows():
+    # row-at-a-time cumulative energies, with and without NumPy, break ties
+    # towards the left as adjacent_min does, and the recorded parents trace
+    # the same seam as the map alone
+    import seams
+    energy = {
+        'height': 4,
+        'width': 4,
+        'pixels': [5, 1, 1, 5,
+                   2, 2, 2, 2,
+                   9, 0, 9, 0,
+                   3, 3, 1, 1],
+    }
+    expected = [5, 1, 1, 5,
+                3, 3, 3, 3,
+                12, 3, 12, 3,
+                6, 6, 4, 4]
+    numpy = seams.numpy
+    try:
+        for mode in (numpy, None):
+            seams.numpy = mode
+            for e in (energy, dict(energy, pixels=[float(p) for p in energy['pixels']])):
+                cem = lab.cumulative_energy_map(e)
+                compare_greyscale_images(cem, dict(energy, pixels=expected))
+                assert list(cem.parents) == [0, 0, 0, 0, 1, 0, -1, -1, 0, -1, -1, -1, 1, 0, -1, 0]
+                assert lab.minimum_energy_seam(cem) == [14, 9, 4, 1]
+                assert lab.minimum_energy_seam(dict(cem)) == [14, 9, 4, 1]
+    finally:
+        seams.numpy = numpy
+    column = lab.cumulative_energy_map({'height': 3, 'width': 1, 'pixels': [1, 2, 3]})
+    assert column['pixels'] == [1, 3, 6]
+    assert lab.minimum_energy_seam(column) == [2, 1, 0]
+
+
+def test_content_aware_resize():
+    # columns come off as in seam_carving, rows as in seam_carving of the
+    # transposed image, and both orders reach the requested size
+    from images import transposed, materialized
+    im = {
+        'height': 8,
+        'width': 9,
+        'pixels': [((i * 41) % 13 * 19, (i * i) % 7 * 36, (i // 5) % 6 * 50) for i in range(72)],
+    }
+    oim = object_hash(im)
+    view = transposed(im)['pixels']
+    expected = [im['pixels'][(i % 8) * 9 + i // 8] for i in range(72)]
+    for index in (slice(None), slice(3, 7), slice(None, None, -1), slice(20, 2, -3), slice(5, 5)):
+        assert list(view[index]) == expected[index]
+    compare_color_images(lab.content_aware_resize(im, 6, 8), lab.seam_carving(im, 3))
+    flipped = materialized(transposed(lab.seam_carving(materialized(transposed(im)), 2)))
+    compare_color_images(lab.content_aware_resize(im, 9, 6), flipped)
+    from seams import optimal_carve
+    compare_color_images(optimal_carve(im, 0, 3), lab.seam_carving(im, 3))
+    compare_color_images(optimal_carve(im, 2, 0), flipped)
+    for method in ('optimal', 'greedy', 'auto'):
+        for width, height in ((6, 5), (11, 6), (7, 10), (12, 12)):
+            result = lab.content_aware_resize(im, width, height, method)
+            assert result['width'] == width and result['height'] == height
+            assert len(result['pixels']) == width * height
+            assert set(result['pixels']) <= set(im['pixels'])
+    with pytest.raises(ValueError):
+        lab.content_aware_resize(im, 0, 3)
+    assert object_hash(im) == oim, 'Be careful not to modify the original image!'
+
+
+def test_result_cache(tmp_path, monkeypatch):
+    # cached results (from memory or from disk) are the filters' own, and
+    # seam carving picks up from the seams already found
+    import filtercache
+    from filtercache import ResultCache, image_digest, filter_spec, function_digest
+    from images import PackedImage
+    im = {
+        'height': 9,
+        'width': 12,
+        'pixels': [((i * 37) % 11 * 23, (i * 5) % 17 * 15, (i // 7) % 5 * 60) for i in range(108)],
+    }
+    oim = object_hash(im)
+    assert image_digest(im) == image_digest(PackedImage.from_dict(im))
+    assert image_digest(im) != image_digest(im, ('seams',))
+
+    cache = ResultCache(str(tmp_path), memory_items=1)
+    color_edges = lab.color_filter_from_greyscale_filter(lab.edges)
+    blur = lab.color_filter_from_greyscale_filter(lab.make_blur_filter(3))
+    cascade = lab.filter_cascade([color_edges, blur])
+    expected = cascade(im)
+    compare_color_images(cache.apply(cascade, im), expected)
+    result = cache.apply(cascade, im)
+    compare_color_images(result, expected)
+    result['pixels'][0] = (1, 2, 3)
+    compare_color_images(ResultCache(str(tmp_path)).apply(cascade, im), expected)
+    compare_color_images(cache.cached(blur)(im), blur(im))
+
+    for n in (3, 7, 5):
+        compare_color_images(cache.seam_carving(im, n), lab.seam_carving(im, n))
+    assert len(cache.seams(im, 6)) == 6
+
+    # functions are known by their code as well as their names
+    assert filter_spec(lab.edges) == ('function', 'lab', 'edges', function_digest(lab.edges))
+    assert function_digest(lab.edges) != function_digest(lab.inverted)
+    assert function_digest(lambda x: x + 1) != function_digest(lambda x: x + 2)
+
+    # a file deleted by another process between reading and touching it
+    key = image_digest(im, filter_spec(cascade))
+    def deleted(path):
+        raise FileNotFoundError(path)
+    monkeypatch.setattr(filtercache.os, 'utime', deleted)
+    compare_color_images(ResultCache(str(tmp_path)).get(key), expected)
+    monkeypatch.undo()
+
+    small = ResultCache(str(tmp_path), disk_bytes=0)
+    small.put('key', expected)
+    assert list(tmp_path.glob('*.pickle')) == []
+    assert small.get('key') is expected
+    assert object_hash(im) == oim, 'Be careful not to modify the original image!'
+
+
+def test_tiled_filters(tmp_path):
+    # filtering a raw image a tile at a time gives the same pixels as
+    # filtering the whole image, in greyscale and in colour
+    from tiles import RawImage
+    from imagefiles import image_to_raw, raw_to_image
+    im = {
+        'height': 19,
+        'width': 26,
+        'pixels': [((i * 37) % 256, (i * 11) % 97 * 2, (i // 3) % 9 * 28) for i in range(494)],
+    }
+    lab.save_color_image(im, str(tmp_path / 'im.png'))
+    image_to_raw(str(tmp_path / 'im.png'), str(tmp_path / 'im.raw'), color=True, strip=5)
+    image_to_raw(str(tmp_path / 'im.png'), str(tmp_path / 'grey.raw'), strip=5)
+    grey = lab.load_greyscale_image(str(tmp_path / 'im.png'))
+    with RawImage(str(tmp_path / 'im.raw'), 19, 26, color=True) as source, \
+            RawImage(str(tmp_path / 'grey.raw'), 19, 26) as grey_source:
+        compare_color_images(source.read(0, 0, 19, 26), im)
+        compare_greyscale_images(grey_source.read(3, 4, 5, 6), lab.crop(grey, 3, 4, 5, 6))
+        for filt in (lab.make_blur_filter(5), lab.make_sharpen_filter(3), lab.edges):
+            color_filt = lab.color_filter_from_greyscale_filter(filt)
+            with RawImage(str(tmp_path / 'out.raw'), 19, 26, color=True, create=True) as target:
+                lab.tiled_filter(color_filt, source, target, size=7)
+                compare_color_images(target.read(0, 0, 19, 26), color_filt(im))
+            with RawImage(str(tmp_path / 'grey_out.raw'), 19, 26, create=True) as target:
+                lab.tiled_filter(filt, grey_source, target, size=6)
+                compare_greyscale_images(target.read(0, 0, 19, 26), filt(grey))
+        for filt, args in ((lab.blurred, (5,)), (lab.sharpened, (3,)), (lab.edges, (True,))):
+            with RawImage(str(tmp_path / 'grey_out.raw'), 19, 26, create=True) as target:
+                lab.tiled_filter(filt, grey_source, target, *args, size=6)
+                compare_greyscale_images(target.read(0, 0, 19, 26), filt(grey, *args))
+        raw_to_image(str(tmp_path / 'out.raw'), 19, 26, str(tmp_path / 'out.png'), color=True)
+        compare_color_images(lab.load_color_image(str(tmp_path / 'out.png')),
+                             lab.color_filter_from_greyscale_filter(lab.edges)(im))
+        with pytest.raises(ValueError):
+            lab.tiled_filter(lambda image: image, grey_source, grey_source)
+
+
 if __name__ == '__main__':
     import sys
     import json